@@ -0,0 +1,48 @@
+'''
+syntax:
+
+from a command prompt:
+python convert_sol.py raw sol1_in sol2_in sol_out
+
+from a Python interpreter:
+import sys
+sys.argv = [raw, sol1_in, sol2_in, sol_out]
+execfile("convert_sol.py")
+
+converts text solution files sol1_in and sol2_in (plain, gzip, bz2 or xz)
+to the binary solution format in the directory sol_out.
+the directory can then be given as sol1 and sol2 to evaluation.run.
+'''
+
+import argparse
+import time
+
+# gocomp imports
+import data
+import evaluation
+
+def main():
+
+    parser = argparse.ArgumentParser(description='Convert text solution files to the binary solution format')
+    
+    parser.add_argument('raw', help='raw')
+    parser.add_argument('sol1_in', help='sol1_in')
+    parser.add_argument('sol2_in', help='sol2_in')
+    parser.add_argument('sol_out', help='sol_out')
+    
+    args = parser.parse_args()
+
+    start_time = time.time()
+    p = data.Data()
+    p.raw.read(args.raw)
+    time_elapsed = time.time() - start_time
+    print("read data time: %f" % time_elapsed)
+    
+    print("buses: %u" % len(p.raw.buses))
+    print("generators: %u" % len(p.raw.generators))
+
+    evaluation.convert_sol_to_npy(
+        args.sol1_in, args.sol2_in, len(p.raw.buses), len(p.raw.generators), args.sol_out)
+
+if __name__ == '__main__':
+    main()
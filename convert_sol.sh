@@ -0,0 +1,10 @@
+#!/bin/sh
+
+case_dir='./examples/case2/'
+raw=$case_dir'case.raw'
+sol1=$case_dir'sol1.txt'
+sol2=$case_dir'sol2.txt'
+sol_out=$case_dir'sol_npy'
+
+# run it
+python convert_sol.py "$raw" "$sol1" "$sol2" "$sol_out"
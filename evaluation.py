@@ -10,24 +10,39 @@ use scipy sparse matrices to store bus-branch incidence info
 and matrix-vector product to compute bus power imbalance.
 """
 
+import bz2
 import csv
+import gzip
 import math
+import mmap
+import multiprocessing
+import os
+import stat
 import data
 import time
 #from collections import OrderedDict
 from itertools import islice
+from contextlib import closing
 import numpy as np
-import pandas as pd
 import traceback
 from scipy import sparse as sp
 import sys
+import threading
+try:
+    import queue
+except ImportError:
+    import Queue as queue
+try:
+    import lzma
+except ImportError:
+    lzma = None # py2, no xz support
+try:
+    import numba
+except ImportError:
+    numba = None # optional, see ctg_kernel_backend
 #from io import open
 #import StringIO
 #import cStringIO
-try:
-    from cStringIO import StringIO
-except ImportError:
-    from io import StringIO
 from operator import itemgetter
 
 """
@@ -65,29 +80,98 @@ hard_constr_tol = 1e-4
 pandas_float_precision=None
 #pandas_float_precision='round_trip'
 
-def eval_piecewise_linear_penalty(residual, penalty_block_max, penalty_block_coeff):
-    '''residual, penaltyblock_max, penalty_block_coeff are 1-dimensional numpy arrays'''
+# number of contingencies evaluated together by Evaluation.eval_ctg_batch,
+# stacked into (batch size, num bus), (batch size, num gen), etc. arrays.
+# 1: evaluate one contingency at a time with Evaluation.eval_ctg.
+# a larger batch size means less overhead per contingency but more memory,
+# and in follow mode a contingency is not evaluated until its batch is complete
+ctg_batch_size = 1
+
+# True: bus power injections from the complex bus admittance matrix (Ybus),
+# as V * conj(Ybus V), with the branches out of service in a ctg removed by a
+# low rank correction to Ybus V, and branch flows, for the flow limits only,
+# from complex branch currents.
+# False: bus power injections are sums of the branch flows.
+# the results are the same up to rounding
+ybus_engine = False
+
+# number of largest violations in each category written to the top k file,
+# a side output next to the detail file, see top_k_name.
+# 0: no top k file
+detail_top_k = 0
+
+# kernels for the branch flows of a single ctg, Evaluation.eval_ctg with
+# ybus_engine False and ctg_batch_size 1:
+# 'numpy': numpy arrays, one pass over the branches for each operation.
+# 'numba': ctg_branch_kernel, one loop over the branches for the flows, flow limit
+# violations and bus sums of the branch flows, compiled with numba.
+# if numba is not installed, 'numba' falls back to 'numpy'.
+# the results are the same up to rounding, see Evaluation.check_ctg_branch_kernel
+ctg_kernel_backend = 'numpy'
+
+# contingency type codes, bit flags in Evaluation.ctg_type
+ctg_type_gen = 1
+ctg_type_line = 2
+ctg_type_xfmr = 4
+
+# number of sol2 contingencies read and parsed ahead of the evaluation
+# by a background thread. 0: read in the main thread
+sol2_prefetch_depth = 4
+
+# number of worker processes parsing byte ranges of sol2,
+# and number of contingency blocks in each range.
+# 1: no worker processes, sol2 is read in a single pass by read_sol2_ctgs
+sol2_num_proc = 1
+sol2_ctgs_per_task = 32
+
+# follow mode, i.e. evaluating sol2 while it is still being written:
+# how long to wait with no new data before treating the file as ended (seconds),
+# and how often to look for new data (seconds)
+sol2_follow_idle_timeout = 60.0
+sol2_follow_poll_time = 0.1
+
+# True: find the sol2 contingency blocks by label with Solution2LabelIndex,
+# allowing the blocks in any order, and evaluate them in the order of the con file.
+# False: evaluate the blocks in the order of the sol2 file
+sol2_label_index = False
+
+def eval_piecewise_linear_penalty(residual, penalty_block_max, penalty_block_coeff, out=None, work=None):
+    '''penaltyblock_max, penalty_block_coeff are 1-dimensional numpy arrays,
+    or 2-dimensional with blocks on the first axis, (num block, num), for blocks
+    that differ by entry, e.g. Evaluation.penalty_viol_block_max.
+    residual is a numpy array of any shape, e.g. (num ctg in batch, num bus),
+    ending in num for 2-dimensional blocks, and the penalty has the same shape.
+    out: None, or an array for the penalty.
+    work: None, or a pair of arrays for intermediate values.
+    with out and work nothing is allocated'''
 
     r = residual
     num_block = len(penalty_block_coeff)
     num_block_bounded = len(penalty_block_max)
     assert(num_block_bounded + 1 == num_block)
-    num_resid = r.size
-    abs_resid = np.abs(r)
+    if work is None:
+        work = (None, None)
+    abs_resid = np.abs(r, out=work[0])
     #penalty_block_max_extended = np.concatenate((penalty_block_max, np.inf))
     remaining_resid = abs_resid
-    penalty = np.zeros(num_resid)
+    if out is None:
+        penalty = np.zeros(r.shape)
+    else:
+        penalty = out
+        penalty.fill(0.0)
     for i in range(num_block):
         #block_min = penalty_block_cumul_min[i]
         #block_max = penalty_block_cumul_max[i]
         block_coeff = penalty_block_coeff[i]
         if i < num_block - 1:
             block_max = penalty_block_max[i]
-            penalized_resid = np.minimum(block_max, remaining_resid)
-            penalty += block_coeff * penalized_resid
+            penalized_resid = np.minimum(block_max, remaining_resid, out=work[1])
             remaining_resid -= penalized_resid
+            penalized_resid *= block_coeff
+            penalty += penalized_resid
         else:
-            penalty += block_coeff * remaining_resid
+            remaining_resid *= block_coeff
+            penalty += remaining_resid
     return penalty
 
 def extra_max(keys, values):
@@ -103,11 +187,164 @@ def extra_max(keys, values):
         value = values[index]
         return (key, value)
 
+def extra_max_rows(keys, values):
+    '''as extra_max, for each row of a 2-dimensional numpy array values.
+    returns a list of (k,v), one for each row'''
+
+    if values.shape[1] == 0:
+        return [(None, 0.0)] * values.shape[0]
+    else:
+        index = np.argmax(values, axis=1)
+        return [(keys[i], values[r, i]) for r, i in enumerate(index)]
+
+def extra_top_k_rows(keys, values, k):
+    '''the k largest values in each row of a 2-dimensional numpy array values, largest first.
+    keys is a list with len=values.shape[1].
+    argpartition finds them in O(num) per row, then only the k are sorted.
+    returns a list of lists of (k,v), one for each row'''
+
+    num = values.shape[1]
+    k = min(k, num)
+    if k == 0:
+        return [[] for r in range(values.shape[0])]
+    index = np.argpartition(values, num - k, axis=1)[:, (num - k):]
+    order = np.argsort(-np.take_along_axis(values, index, axis=1), axis=1, kind='stable')
+    index = np.take_along_axis(index, order, axis=1)
+    return [[(keys[i], values[r, i]) for i in index[r]] for r in range(values.shape[0])]
+
+def extra_top_k(keys, values, k):
+    '''as extra_top_k_rows, for a 1-dimensional numpy array values.
+    returns a list of (k,v)'''
+
+    return extra_top_k_rows(keys, values.reshape(1, values.size), k)[0]
+
+def get_top_k_rows(label, top_k):
+    '''rows of the top k file for one ctg, or for the base case with label ''.
+    top_k is a list of (category, list of (k,v)), as from extra_top_k,
+    and only the violations > 0 are written.
+    the keys are the same objects as in the -idx fields of the detail rows,
+    i.e. a bus number, an (i, id) gen key or an (i, j, ckt) branch key,
+    so the csv writer formats them as it does in the detail file'''
+
+    return [
+        [label, category, rank + 1, key, value]
+        for (category, top) in top_k
+        for (rank, (key, value)) in enumerate(top)
+        if value > 0.0]
+
+def top_k_name(detail_name):
+    '''name of the top k file for a detail file, e.g. detail_topk.csv for detail.csv'''
+
+    (root, ext) = os.path.splitext(detail_name)
+    return root + '_topk' + ext
+
+# top k file categories, as in the detail file, for the ctg blocks of CtgWorkspace
+top_k_bus_categories = ['vmax', 'vmin', 'bmax', 'bmin', 'pbal', 'qbal']
+top_k_ctg_gen_categories = ['qgmax', 'qgmin', 'qvg1', 'qvg2']
+top_k_branch_categories = ['omax', 'dmax']
+
+def ctg_branch_kernel(
+        bus_volt_mag, bus_volt_ang, branch_orig_bus, branch_dest_bus, branch_tap_ang,
+        coeff_orig_sq_real, coeff_orig_sq_imag, coeff_dest_sq_real, coeff_dest_sq_imag,
+        coeff_cross_real, coeff_cross_imag, branch_limit_curr, flow_mag_max, branch_out,
+        orig_volt_mag, dest_volt_mag, pow_orig_real, pow_orig_imag, pow_dest_real, pow_dest_imag,
+        orig_viol, dest_viol, bus_branch_pow_real, bus_branch_pow_imag):
+    '''one loop over the branches of a ctg computing, for each branch, what
+    Evaluation.compute_branch_pow and Evaluation.compute_branch_flow_viol compute,
+    with 0 flow on the branches with branch_out True, and adding the flows into the
+    bus sums bus_branch_pow_real, bus_branch_pow_imag.
+    the results are written to the arrays after branch_out.
+    plain python, compiled with numba by get_ctg_branch_kernel'''
+
+    bus_branch_pow_real[:] = 0.0
+    bus_branch_pow_imag[:] = 0.0
+    for k in range(branch_orig_bus.shape[0]):
+        i = branch_orig_bus[k]
+        j = branch_dest_bus[k]
+        vi = bus_volt_mag[i]
+        vj = bus_volt_mag[j]
+        orig_volt_mag[k] = vi
+        dest_volt_mag[k] = vj
+        if branch_out[k]:
+            por = 0.0
+            poi = 0.0
+            pdr = 0.0
+            pdi = 0.0
+        else:
+            diff = bus_volt_ang[i] - bus_volt_ang[j] - branch_tap_ang[k]
+            cos_diff = math.cos(diff)
+            sin_diff = math.sin(diff)
+            prod = vi * vj
+            real_cos = coeff_cross_real[k] * cos_diff
+            real_sin = coeff_cross_real[k] * sin_diff
+            imag_cos = coeff_cross_imag[k] * cos_diff
+            imag_sin = coeff_cross_imag[k] * sin_diff
+            por = coeff_orig_sq_real[k] * (vi * vi) + (real_cos + imag_sin) * prod
+            poi = coeff_orig_sq_imag[k] * (vi * vi) + (real_sin - imag_cos) * prod
+            pdr = coeff_dest_sq_real[k] * (vj * vj) + (real_cos - imag_sin) * prod
+            pdi = coeff_dest_sq_imag[k] * (vj * vj) - (real_sin + imag_cos) * prod
+        pow_orig_real[k] = por
+        pow_orig_imag[k] = poi
+        pow_dest_real[k] = pdr
+        pow_dest_imag[k] = pdi
+        limit_orig = flow_mag_max[k]
+        limit_dest = flow_mag_max[k]
+        if branch_limit_curr[k]:
+            limit_orig *= vi
+            limit_dest *= vj
+        orig_viol[k] = max(0.0, math.sqrt(por * por + poi * poi) - limit_orig)
+        dest_viol[k] = max(0.0, math.sqrt(pdr * pdr + pdi * pdi) - limit_dest)
+        bus_branch_pow_real[i] += por
+        bus_branch_pow_imag[i] += poi
+        bus_branch_pow_real[j] += pdr
+        bus_branch_pow_imag[j] += pdi
+
+ctg_branch_kernel_numba = None
+
+def compile_ctg_branch_kernel():
+    '''ctg_branch_kernel compiled with numba, on the first call,
+    or the plain python function if numba is not installed'''
+
+    global ctg_branch_kernel_numba
+    if numba is None:
+        return ctg_branch_kernel
+    if ctg_branch_kernel_numba is None:
+        ctg_branch_kernel_numba = numba.njit(ctg_branch_kernel)
+    return ctg_branch_kernel_numba
+
+def get_ctg_branch_kernel():
+    '''the compiled ctg_branch_kernel if ctg_kernel_backend is 'numba' and
+    numba is installed, else None, i.e. use the numpy kernels'''
+
+    if ctg_kernel_backend != 'numba' or numba is None:
+        return None
+    return compile_ctg_branch_kernel()
+
+def make_batches(items, batch_size):
+    '''lists of up to batch_size consecutive items'''
+
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == batch_size:
+            yield batch
+            batch = []
+    if len(batch) > 0:
+        yield batch
+
 def clean_string(s):
     t = s.replace("'","").replace('"','').replace(' ','')
     #t = str(s).replace("'","").replace('"','').replace(' ','')
     return t
 
+def clean_string_array(s):
+    '''clean_string on each of an array or list of strings, vectorized'''
+
+    t = np.array(s, dtype=np.unicode_).reshape(len(s))
+    for c in ["'", '"', ' ']:
+        t = np.char.replace(t, c, '')
+    return t
+
 def count_lines(file_name):
 
     #return simplecount(file_name)
@@ -136,9 +373,48 @@ def _make_gen(reader):
         yield b
         b = reader(1024*1024)
 
+# magic bytes at the start of compressed solution files
+sol_compression_magic = [
+    ('gzip', b'\x1f\x8b'),
+    ('bz2', b'BZh'),
+    ('xz', b'\xfd7zXZ\x00')]
+
+def is_regular_file(file_name):
+    '''False for e.g. a named pipe, which cannot be read twice'''
+
+    return stat.S_ISREG(os.stat(file_name).st_mode)
+
+def get_sol_compression(file_name):
+    '''compression format of a solution file from its first bytes.
+    returns 'gzip', 'bz2', 'xz', or None for a plain file'''
+
+    with open(file_name, 'rb') as f:
+        head = f.read(8)
+    for (compression, magic) in sol_compression_magic:
+        if head.startswith(magic):
+            return compression
+    return None
+
+def open_sol(file_name):
+    '''open a solution file for reading in binary mode.
+    gzip, bz2 and xz files are detected from their magic bytes and
+    decompressed as they are read, so no decompressed copy is written to disk'''
+
+    compression = get_sol_compression(file_name) if is_regular_file(file_name) else None
+    if compression is None:
+        return open(file_name, 'rb')
+    elif compression == 'gzip':
+        return gzip.GzipFile(file_name, 'rb')
+    elif compression == 'bz2':
+        return bz2.BZ2File(file_name, 'rb')
+    elif lzma is None:
+        raise Exception('xz compressed solution file, but lzma is not available: %s' % file_name)
+    else:
+        return lzma.LZMAFile(file_name, 'rb')
+
 def rawgencount(filename):
     start_time = time.time()
-    f = open(filename, 'rb')
+    f = open_sol(filename)
     f_gen = _make_gen(f.read) # py2
     #f_gen = _make_gen(f.raw.read) # py3
     count = sum( buf.count(b'\n') for buf in f_gen )
@@ -151,14 +427,36 @@ def get_ctg_block_size(num_bus, num_gen):
         
     return(num_bus + num_gen + 10)
 
+def get_ctg_block_line_offsets(num_bus, num_gen):
+    '''line numbers, relative to the first line of a contingency block in sol2,
+    of the lines that start each part of the block:
+      0: --contingency
+      1: contingency label
+      2: --bus section
+      3: first bus data row
+      4: --generator section
+      5: first generator data row
+      6: --delta section
+      7: delta
+      8: first line of the next block (= block size)'''
+
+    return [
+        0, 2, 3, 5, 5 + num_bus, 7 + num_bus, 7 + num_bus + num_gen,
+        9 + num_bus + num_gen, 10 + num_bus + num_gen]
+
 def get_sol2_num_lines_expected(num_bus, num_gen, num_ctg):
 
     return(num_ctg * get_ctg_block_size(num_bus, num_gen))
 
 def check_sol2_num_lines(sol2_name, num_bus, num_gen, num_ctg):
 
-    expected = get_sol2_num_lines_expected(num_bus, num_gen, num_ctg)
     found = count_lines(sol2_name)
+    check_sol2_num_lines_found(num_bus, num_gen, num_ctg, found)
+
+def check_sol2_num_lines_found(num_bus, num_gen, num_ctg, found):
+    '''found is the number of newline characters in sol2, as counted by rawgencount'''
+
+    expected = get_sol2_num_lines_expected(num_bus, num_gen, num_ctg)
     print('sol2 num lines expected: %u' % expected)
     print('sol2 num lines found: %u' % found)
     if found < expected:
@@ -178,11 +476,11 @@ def get_sol2_ctg_labels(sol2_name, num_bus, num_gen, num_ctg):
         num_ctgs_found = 0
         line_num_to_find = line_nums_to_find[num_ctgs_found]
         line_num_current = 0
-        f = open(sol2_name)
+        f = open_sol(sol2_name)
         #f = open(sol2_name, 'rb', 1024*1024)
         for line in f:
             if line_num_current == line_num_to_find:
-                ctg_labels.append(clean_string(line.strip())) # put back
+                ctg_labels.append(clean_string(sol_bytes_to_str(line).strip())) # put back
                 num_ctgs_found += 1
                 if num_ctgs_found == num_ctg:
                     break
@@ -200,6 +498,12 @@ def check_sol2_ctg_labels(sol2_name, num_bus, num_gen, ctg_labels_data_list):
     num_ctg = len(ctg_labels_data_list)
     ctg_labels_sol_list = get_sol2_ctg_labels(sol2_name, num_bus, num_gen, num_ctg)
     #ctg_labels_sol_list = ctg_labels_data_list
+    check_sol2_ctg_labels_found(ctg_labels_data_list, ctg_labels_sol_list)
+
+def check_sol2_ctg_labels_found(ctg_labels_data_list, ctg_labels_sol_list):
+    '''ctg_labels_sol_list holds the cleaned labels of the first len(ctg_labels_data_list)
+    blocks of sol2, as returned by get_sol2_ctg_labels'''
+
     ctg_labels_data = set(ctg_labels_data_list)
     ctg_labels_sol = set(ctg_labels_sol_list)
     ctg_labels_data_minus_sol = ctg_labels_data - ctg_labels_sol
@@ -224,6 +528,18 @@ def check_sol2_ctg_labels(sol2_name, num_bus, num_gen, ctg_labels_data_list):
     else:
         print('sol2 ctg labels ok')
 
+def permute_column(array, permutation, column, out=None):
+    '''array[permutation, column], with permutation None meaning the identity.
+    out: None, or an array for the result'''
+
+    if permutation is None:
+        if out is None:
+            return array[:, column].copy()
+        out[:] = array[:, column]
+        return out
+    else:
+        return np.take(array[:, column], permutation, out=out)
+
 class Result:
 
     def __init__(self, ctgs):
@@ -463,6 +779,186 @@ def get_ctg_num_lines(file_name):
     return ctg_num_lines #todo1
     #return ctg_num_lines[0:30] #todo1
 
+def make_key_array(keys):
+    '''numpy array of keys, for KeyIndex.
+    int keys, e.g. bus numbers, give an int array.
+    tuple keys, e.g. (i, id) or (i, j, ckt), give a structured array with
+    an int field for each int entry and a fixed width string field for each string entry.'''
+
+    if len(keys) == 0 or not isinstance(keys[0], tuple):
+        return np.array(keys, dtype=np.int_).reshape(len(keys))
+    fields = []
+    for j in range(len(keys[0])):
+        if isinstance(keys[0][j], str):
+            fields.append(('f%u' % j, np.unicode_, max(1, max([len(k[j]) for k in keys]))))
+        else:
+            fields.append(('f%u' % j, np.int_))
+    return np.array(keys, dtype=np.dtype(fields)).reshape(len(keys))
+
+def make_key_array_from_fields(fields):
+    '''structured key array, as from make_key_array, from one array per entry of the keys,
+    e.g. [gen_i, gen_id] with gen_i an int array and gen_id a string array'''
+
+    fields = [np.asarray(f) for f in fields]
+    dtype = np.dtype([('f%u' % j, fields[j].dtype) for j in range(len(fields))])
+    keys = np.zeros(shape=fields[0].size, dtype=dtype)
+    for j in range(len(fields)):
+        keys['f%u' % j] = fields[j]
+    return keys
+
+def make_csr_table(rows, cols, num_rows, num_cols):
+    '''(indptr, indices) int32 arrays of a CSR table with num_rows rows,
+    row k holding the sorted distinct cols[n] with rows[n] == k'''
+
+    table = sp.csr_matrix(
+        (np.ones(len(rows)), (np.asarray(rows, dtype=np.int_), np.asarray(cols, dtype=np.int_))),
+        (num_rows, num_cols))
+    table.sum_duplicates()
+    return (table.indptr.astype(np.int32), table.indices.astype(np.int32))
+
+def csr_row(indptr, indices, k):
+    '''row k of a CSR table from make_csr_table'''
+
+    return indices[indptr[k]:indptr[k + 1]]
+
+def csr_rows(indptr, indices, rows):
+    '''several rows of a CSR table from make_csr_table, as (k, index) arrays,
+    with k the position of the row in rows, e.g. for setting the entries of a
+    (len(rows), num cols) array at once'''
+
+    starts = indptr[rows]
+    counts = indptr[rows + 1] - starts
+    k = np.repeat(np.arange(len(rows)), counts)
+    offsets = np.arange(np.sum(counts)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (k, indices[np.repeat(starts, counts) + offsets])
+
+class KeyIndex:
+    '''positions of keys in a list of keys, e.g. bus numbers or (i, id) generator keys,
+    looked up for an array of keys at once.
+    the keys are packed by make_key_array and sorted once, and lookups use
+    np.searchsorted. as with a dict built from the list, the last position
+    of a repeated key is the one found, and a missing key raises KeyError.'''
+
+    def __init__(self, keys):
+
+        self.keys = keys if isinstance(keys, np.ndarray) else make_key_array(keys)
+        self.order = np.argsort(self.keys, kind='mergesort') # stable, so repeated keys stay in order
+        self.sorted_keys = self.keys[self.order]
+
+    def get(self, keys):
+        '''positions of keys, an int array. keys is a list, or an array from make_key_array'''
+
+        pos = self.find(keys)
+        missing = np.flatnonzero(pos < 0)
+        if missing.size > 0:
+            raise KeyError(keys[int(missing[0])])
+        return pos
+
+    def find(self, keys):
+        '''positions of keys, as get(), but -1 for a missing key rather than KeyError'''
+
+        query = keys if isinstance(keys, np.ndarray) else make_key_array(keys)
+        if query.size == 0:
+            return np.zeros(shape=0, dtype=np.int_)
+        if self.sorted_keys.size == 0:
+            return -np.ones(shape=query.size, dtype=np.int_)
+        fits = np.ones(shape=query.size, dtype=bool)
+        if query.dtype != self.keys.dtype and query.size > 0:
+            # strings longer than the field width cannot match, and would be cut short by the cast
+            if query.dtype.names is not None:
+                for name in query.dtype.names:
+                    if query.dtype[name].kind == 'U':
+                        width = self.keys.dtype[name].itemsize // np.dtype((np.unicode_, 1)).itemsize
+                        fits &= np.char.str_len(query[name]) <= width
+            query = query.astype(self.keys.dtype)
+        pos = np.searchsorted(self.sorted_keys, query, side='right') - 1
+        pos_ok = np.maximum(pos, 0)
+        found = fits & (pos >= 0) & (self.sorted_keys[pos_ok] == query)
+        return np.where(found, self.order[pos_ok], -1)
+
+class CtgWorkspace:
+    '''arrays for the contingency evaluation, allocated once, so that the kernels,
+    e.g. Evaluation.eval_ctg_bus_volt_viol, can write their results and intermediate
+    values with numpy out= parameters and in place operations.
+    the arrays have shape (num) or, with num_row, (num_row, num).
+    the ctg_ attributes of Evaluation are views of these arrays, so they are
+    overwritten by the evaluation of the next ctg.
+    the violations reported in the detail rows are the rows of 2-dimensional blocks,
+    bus_viol, gen_viol, branch_viol, one block for each kind of element, so
+    Evaluation.compute_ctg_detail can take the max of a whole block with one argmax'''
+
+    def __init__(self, num_bus, num_gen, num_branch, num_row=None, num_pow_balance_inj=0, num_penalty_viol=0, num_area=0):
+
+        def zeros(num, dtype=float):
+            return np.zeros(shape=((num,) if num_row is None else (num_row, num)), dtype=dtype)
+
+        def block(num_block, num):
+            return np.zeros(shape=((num_block, num) if num_row is None else (num_block, num_row, num)))
+
+        # in the order of the detail rows
+        self.bus_viol = block(6, num_bus)
+        (self.bus_volt_mag_max_viol,
+         self.bus_volt_mag_min_viol,
+         self.bus_swsh_adm_imag_max_viol,
+         self.bus_swsh_adm_imag_min_viol,
+         self.bus_pow_balance_real_viol,
+         self.bus_pow_balance_imag_viol) = self.bus_viol
+        self.gen_viol = block(4, num_gen)
+        (self.gen_pow_imag_max_viol,
+         self.gen_pow_imag_min_viol,
+         self.gen_pvpq1_viol,
+         self.gen_pvpq2_viol) = self.gen_viol
+        self.branch_viol = block(2, num_branch)
+        (self.branch_flow_orig_mag_max_viol,
+         self.branch_flow_dest_mag_max_viol) = self.branch_viol
+
+        self.bus_volt_mag = zeros(num_bus)
+        self.bus_volt_ang = zeros(num_bus)
+        self.bus_swsh_adm_imag = zeros(num_bus)
+        self.bus_volt_mag_sq = zeros(num_bus)
+        self.bus_fxsh_pow_real = zeros(num_bus)
+        self.bus_fxsh_pow_imag = zeros(num_bus)
+        self.bus_swsh_pow_imag = zeros(num_bus)
+        # stacked injections, real and imag, see Evaluation.compute_bus_pow_balance
+        self.bus_pow_balance_inj = np.zeros(shape=((num_pow_balance_inj, 2) if num_row is None else (num_pow_balance_inj, 2, num_row)))
+
+        self.gen_pow_real = zeros(num_gen)
+        self.gen_pow_imag = zeros(num_gen)
+        self.gen_bus_volt_mag = zeros(num_gen)
+        self.gen_out_of_service_mask = zeros(num_gen, bool)
+        self.gen_not_participating_mask = zeros(num_gen, bool)
+        self.gen_pow_imag_min = zeros(num_gen)
+        self.gen_pow_imag_max = zeros(num_gen)
+        self.gen_work = (zeros(num_gen), zeros(num_gen))
+
+        # 1.0 for the areas affected by the ctg, see Evaluation.set_ctg_data
+        self.area_affected = zeros(num_area)
+
+        self.branch_orig_volt_mag = zeros(num_branch)
+        self.branch_dest_volt_mag = zeros(num_branch)
+        self.branch_volt_ang_diff = zeros(num_branch)
+        self.branch_cos_volt_ang_diff = zeros(num_branch)
+        self.branch_sin_volt_ang_diff = zeros(num_branch)
+        self.branch_orig_dest_volt_mag_prod = zeros(num_branch)
+        self.branch_real_cos = zeros(num_branch)
+        self.branch_real_sin = zeros(num_branch)
+        self.branch_imag_cos = zeros(num_branch)
+        self.branch_imag_sin = zeros(num_branch)
+        self.branch_pow_orig_real = zeros(num_branch)
+        self.branch_pow_orig_imag = zeros(num_branch)
+        self.branch_pow_dest_real = zeros(num_branch)
+        self.branch_pow_dest_imag = zeros(num_branch)
+        self.branch_work = (zeros(num_branch), zeros(num_branch))
+        # for ctg_branch_kernel
+        self.branch_out = zeros(num_branch, bool)
+        self.bus_branch_pow_real = zeros(num_bus)
+        self.bus_branch_pow_imag = zeros(num_bus)
+
+        # stacked violations, see Evaluation.set_data_penalty_params
+        self.penalty_viol = zeros(num_penalty_viol)
+        self.penalty = zeros(num_penalty_viol)
+        self.penalty_work = (zeros(num_penalty_viol), zeros(num_penalty_viol))
+
 class Evaluation:
     '''In per unit convention, i.e. same as the model'''
 
@@ -478,6 +974,9 @@ class Evaluation:
         self.area = []
         self.swsh = []
         self.ctg = []
+        self.sol_permutation_cache = None
+        self.ctg_workspace = None
+        self.ctg_branch_kernel = None
         
         self.bus_volt_mag_min = {}
         self.bus_volt_mag_max = {}
@@ -684,7 +1183,8 @@ class Evaluation:
         buses = list(data.raw.buses.values())
         self.num_bus = len(buses)
         self.bus_i = [r.i for r in buses]
-        self.bus_map = {self.bus_i[i]:i for i in range(len(self.bus_i))}
+        self.bus_i_array = np.array(self.bus_i, dtype=np.int_)
+        self.bus_index = KeyIndex(self.bus_i_array)
         self.bus_volt_mag_max = np.array([r.nvhi for r in buses])
         self.bus_volt_mag_min = np.array([r.nvlo for r in buses])
         self.ctg_bus_volt_mag_max = np.array([r.evhi for r in buses])
@@ -693,9 +1193,11 @@ class Evaluation:
         areas = [r.area for r in buses]
         self.num_area = len(areas)
         self.area_i = [i for i in areas]
-        self.area_map = dict(zip(self.area_i, range(self.num_area)))
 
-        self.bus_area = [self.area_map[r.area] for r in buses]
+        # area_i has one entry for each bus, so an area number is repeated, and
+        # the area index of a bus is the last position of its area number in area_i
+        # (as with the dict built from area_i that this replaces)
+        self.bus_area = KeyIndex(self.area_i).get(self.area_i)
         end_time = time.time()
         print('set data bus params: %f' % (end_time - start_time))
 
@@ -706,14 +1208,13 @@ class Evaluation:
         self.num_load = len(loads)
         self.load_i = [r.i for r in loads]
         self.load_id = [r.id for r in loads]
-        self.load_bus = [self.bus_map[self.load_i[i]] for i in range(self.num_load)]
-        self.load_map = {(self.load_i[i], self.load_id[i]):i for i in range(self.num_load)}
+        self.load_bus = self.bus_index.get(self.load_i)
         self.load_status = np.array([r.status for r in loads])
         self.load_const_pow_real = np.array([r.pl / self.base_mva for r in loads]) * self.load_status
         self.load_const_pow_imag = np.array([r.ql / self.base_mva for r in loads]) * self.load_status
         self.bus_load_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_load)],
-             (self.load_bus, list(range(self.num_load)))),
+            (np.ones(self.num_load),
+             (self.load_bus, np.arange(self.num_load))),
             (self.num_bus, self.num_load))
         self.bus_load_const_pow_real = self.bus_load_matrix.dot(self.load_const_pow_real)
         self.bus_load_const_pow_imag = self.bus_load_matrix.dot(self.load_const_pow_imag)
@@ -727,14 +1228,13 @@ class Evaluation:
         self.num_fxsh = len(fxshs)
         self.fxsh_i = [r.i for r in fxshs]
         self.fxsh_id = [r.id for r in fxshs]
-        self.fxsh_bus = [self.bus_map[self.fxsh_i[i]] for i in range(self.num_fxsh)]
-        self.fxsh_map = {(self.fxsh_i[i], self.fxsh_id[i]):i for i in range(self.num_fxsh)}
+        self.fxsh_bus = self.bus_index.get(self.fxsh_i)
         self.fxsh_status = np.array([r.status for r in fxshs])
         self.fxsh_adm_real = np.array([r.gl / self.base_mva for r in fxshs]) * self.fxsh_status
         self.fxsh_adm_imag = np.array([r.bl / self.base_mva for r in fxshs]) * self.fxsh_status
         self.bus_fxsh_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_fxsh)],
-             (self.fxsh_bus, list(range(self.num_fxsh)))),
+            (np.ones(self.num_fxsh),
+             (self.fxsh_bus, np.arange(self.num_fxsh))),
             (self.num_bus, self.num_fxsh))
         self.bus_fxsh_adm_real = self.bus_fxsh_matrix.dot(self.fxsh_adm_real)
         self.bus_fxsh_adm_imag = self.bus_fxsh_matrix.dot(self.fxsh_adm_imag)
@@ -749,18 +1249,22 @@ class Evaluation:
         self.num_gen = len(gens)
         self.gen_i = [r.i for r in gens]
         self.gen_id = [r.id for r in gens]
-        self.gen_bus = [self.bus_map[self.gen_i[i]] for i in range(self.num_gen)]
-        self.gen_map = {(self.gen_i[i], self.gen_id[i]):i for i in range(self.num_gen)}
+        self.gen_i_array = np.array(self.gen_i, dtype=np.int_)
+        self.gen_id_array = np.array(self.gen_id, dtype=np.unicode_).reshape(self.num_gen)
+        self.gen_bus = self.bus_index.get(self.gen_i_array)
+        self.gen_index = KeyIndex(self.gen_key)
         self.gen_status = np.array([r.stat for r in gens])
         self.gen_pow_imag_max = np.array([r.qt / self.base_mva for r in gens]) * self.gen_status
         self.gen_pow_imag_min = np.array([r.qb / self.base_mva for r in gens]) * self.gen_status
         self.gen_pow_real_max = np.array([r.pt / self.base_mva for r in gens]) * self.gen_status
         self.gen_pow_real_min = np.array([r.pb / self.base_mva for r in gens]) * self.gen_status
-        gen_part_fact = {(r.i, r.id) : r.r for r in data.inl.generator_inl_records.values()}
-        self.gen_part_fact = np.array([gen_part_fact[(r.i, r.id)] for r in gens]) * self.gen_status
+        inls = list(data.inl.generator_inl_records.values())
+        inl_part_fact = np.array([r.r for r in inls])
+        inl_index = KeyIndex([(r.i, r.id) for r in inls])
+        self.gen_part_fact = inl_part_fact[inl_index.get(self.gen_key)] * self.gen_status
         self.bus_gen_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_gen)],
-             (self.gen_bus, list(range(self.num_gen)))),
+            (np.ones(self.num_gen),
+             (self.gen_bus, np.arange(self.num_gen))),
             (self.num_bus, self.num_gen))
         #self.bus_gen = {i:[] for i in range(self.num_bus)}
         #for i in range(self.num_gen):
@@ -770,15 +1274,16 @@ class Evaluation:
         #    if self.gen_i[i] == 630653:
         #        gi = self.gen_i[i]
         #        gid = self.gen_id[i]
-        #        print([gi, gid, self.gen_map[(gi, gid)]])
-
-        self.gen_area = [self.bus_area[r] for r in self.gen_bus]
-        self.area_gens = [set() for a in range(self.num_area)]
-        for i in range(self.num_gen):
-            self.area_gens[self.gen_area[i]].add(i)
-        self.gen_out_of_service = [
-            i for i in range(self.num_gen)
-            if self.gen_status[i] == 0.0]
+        #        print([gi, gid, self.gen_index.get([(gi, gid)])[0]])
+
+        self.gen_area = self.bus_area[self.gen_bus]
+        # area x gen membership, for the gens participating in a ctg
+        self.area_gen_matrix = sp.csc_matrix(
+            (np.ones(self.num_gen),
+             (self.gen_area, np.arange(self.num_gen))),
+            (self.num_area, self.num_gen))
+        self.gen_out_of_service_mask = (self.gen_status == 0.0)
+        self.gen_out_of_service = np.flatnonzero(self.gen_out_of_service_mask).tolist()
         print('num gen in service: %u, out of service: %u' % (self.num_gen - len(self.gen_out_of_service), len(self.gen_out_of_service)))
 
         end_time = time.time()
@@ -793,9 +1298,9 @@ class Evaluation:
         self.line_i = [r.i for r in lines]
         self.line_j = [r.j for r in lines]
         self.line_ckt = [r.ckt for r in lines]
-        self.line_orig_bus = [self.bus_map[self.line_i[i]] for i in range(self.num_line)]
-        self.line_dest_bus = [self.bus_map[self.line_j[i]] for i in range(self.num_line)]
-        self.line_map = {(self.line_i[i], self.line_j[i], self.line_ckt[i]):i for i in range(self.num_line)}
+        self.line_orig_bus = self.bus_index.get(self.line_i)
+        self.line_dest_bus = self.bus_index.get(self.line_j)
+        self.line_index = KeyIndex(self.line_key)
         self.line_status = np.array([r.st for r in lines])
         self.line_adm_real = np.array([r.r / (r.r**2.0 + r.x**2.0) for r in lines]) * self.line_status
         self.line_adm_imag = np.array([-r.x / (r.r**2.0 + r.x**2.0) for r in lines]) * self.line_status
@@ -803,14 +1308,6 @@ class Evaluation:
         self.line_adm_total_imag = self.line_adm_imag + 0.5 * self.line_adm_ch_imag
         self.line_curr_mag_max = np.array([r.ratea / self.base_mva for r in lines]) # todo - normalize by bus base kv???
         self.ctg_line_curr_mag_max = np.array([r.ratec / self.base_mva for r in lines]) # todo - normalize by bus base kv???
-        self.bus_line_orig_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_line)],
-             (self.line_orig_bus, list(range(self.num_line)))),
-            (self.num_bus, self.num_line))
-        self.bus_line_dest_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_line)],
-             (self.line_dest_bus, list(range(self.num_line)))),
-            (self.num_bus, self.num_line))
         #self.bus_line_orig = {i:[] for i in range(self.num_bus)}
         #self.bus_line_dest = {i:[] for i in range(self.num_bus)}
         #for i in range(self.num_line):
@@ -828,9 +1325,9 @@ class Evaluation:
         self.xfmr_i = [r.i for r in xfmrs]
         self.xfmr_j = [r.j for r in xfmrs]
         self.xfmr_ckt = [r.ckt for r in xfmrs]
-        self.xfmr_orig_bus = [self.bus_map[self.xfmr_i[i]] for i in range(self.num_xfmr)]
-        self.xfmr_dest_bus = [self.bus_map[self.xfmr_j[i]] for i in range(self.num_xfmr)]
-        self.xfmr_map = {(self.xfmr_i[i], self.xfmr_j[i], self.xfmr_ckt[i]):i for i in range(self.num_xfmr)}
+        self.xfmr_orig_bus = self.bus_index.get(self.xfmr_i)
+        self.xfmr_dest_bus = self.bus_index.get(self.xfmr_j)
+        self.xfmr_index = KeyIndex(self.xfmr_key)
         self.xfmr_status = np.array([r.stat for r in xfmrs])
         self.xfmr_adm_real = np.array([r.r12 / (r.r12**2.0 + r.x12**2.0) for r in xfmrs]) * self.xfmr_status
         self.xfmr_adm_imag = np.array([-r.x12 / (r.r12**2.0 + r.x12**2.0) for r in xfmrs]) * self.xfmr_status
@@ -840,14 +1337,6 @@ class Evaluation:
         self.xfmr_tap_ang = np.array([r.ang1 * math.pi / 180.0 for r in xfmrs]) * self.xfmr_status
         self.xfmr_pow_mag_max = np.array([r.rata1 / self.base_mva for r in xfmrs]) # todo check normalization
         self.ctg_xfmr_pow_mag_max = np.array([r.ratc1 / self.base_mva for r in xfmrs]) # todo check normalization
-        self.bus_xfmr_orig_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_xfmr)],
-             (self.xfmr_orig_bus, list(range(self.num_xfmr)))),
-            (self.num_bus, self.num_xfmr))
-        self.bus_xfmr_dest_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_xfmr)],
-             (self.xfmr_dest_bus, list(range(self.num_xfmr)))),
-            (self.num_bus, self.num_xfmr))
         #self.bus_xfmr_orig = {i:[] for i in range(self.num_bus)}
         #self.bus_xfmr_dest = {i:[] for i in range(self.num_bus)}
         #for i in range(self.num_xfmr):
@@ -856,6 +1345,116 @@ class Evaluation:
         end_time = time.time()
         print('set data xfmr params: %f' % (end_time - start_time))
 
+    def set_data_branch_params(self):
+        '''one table of branches, lines then xfmrs.
+        a line is a xfmr with tap mag 1.0, tap ang 0.0 and no magnetizing admittance,
+        but with charging susceptance on both ends, and with a current limit, i.e. the flow limit is
+        multiplied by the bus voltage magnitude, where a xfmr has an apparent power limit.
+        branch k is line k for k < num_line, and xfmr k - num_line otherwise'''
+
+        start_time = time.time()
+        self.num_branch = self.num_line + self.num_xfmr
+        self.branch_key = self.line_key + self.xfmr_key
+        self.branch_line = slice(0, self.num_line)
+        self.branch_xfmr = slice(self.num_line, self.num_branch)
+        self.branch_orig_bus = np.concatenate((self.line_orig_bus, self.xfmr_orig_bus))
+        self.branch_dest_bus = np.concatenate((self.line_dest_bus, self.xfmr_dest_bus))
+        self.branch_tap_ang = np.concatenate((np.zeros(self.num_line), self.xfmr_tap_ang))
+        # coefficients of the voltage magnitude products, i.e. series admittance / tap mag
+        self.branch_adm_real = np.concatenate((self.line_adm_real, self.xfmr_adm_real / self.xfmr_tap_mag))
+        self.branch_adm_imag = np.concatenate((self.line_adm_imag, self.xfmr_adm_imag / self.xfmr_tap_mag))
+        # coefficients of the squared voltage magnitudes at each end
+        self.branch_adm_orig_real = np.concatenate((
+            self.line_adm_real,
+            self.xfmr_adm_real / self.xfmr_tap_mag**2.0 + self.xfmr_adm_mag_real))
+        self.branch_adm_orig_imag = np.concatenate((
+            self.line_adm_total_imag,
+            self.xfmr_adm_imag / self.xfmr_tap_mag**2.0 + self.xfmr_adm_mag_imag))
+        self.branch_adm_dest_real = np.concatenate((self.line_adm_real, self.xfmr_adm_real))
+        self.branch_adm_dest_imag = np.concatenate((self.line_adm_total_imag, self.xfmr_adm_imag))
+        # limit type. True: current limit, as for lines. False: apparent power limit, as for xfmrs
+        self.branch_limit_curr = np.concatenate((np.ones(self.num_line, dtype=bool), np.zeros(self.num_xfmr, dtype=bool)))
+        self.branch_flow_mag_max = np.concatenate((self.line_curr_mag_max, self.xfmr_pow_mag_max))
+        self.ctg_branch_flow_mag_max = np.concatenate((self.ctg_line_curr_mag_max, self.ctg_xfmr_pow_mag_max))
+        end_time = time.time()
+        print('set data branch params: %f' % (end_time - start_time))
+
+    def set_data_branch_coeffs(self):
+        '''compile the branch table into constant coefficient vectors of the flow kernel,
+        so that compute_branch_pow does only the voltage dependent multiply-adds.
+        with t = orig volt ang - dest volt ang - tap ang and p = orig volt mag * dest volt mag:
+        pow orig real = coeff_orig_sq_real * orig volt mag**2 + (coeff_cross_real * cos t + coeff_cross_imag * sin t) * p
+        pow orig imag = coeff_orig_sq_imag * orig volt mag**2 + (coeff_cross_real * sin t - coeff_cross_imag * cos t) * p
+        pow dest real = coeff_dest_sq_real * dest volt mag**2 + (coeff_cross_real * cos t - coeff_cross_imag * sin t) * p
+        pow dest imag = coeff_dest_sq_imag * dest volt mag**2 - (coeff_cross_real * sin t + coeff_cross_imag * cos t) * p
+        i.e. g_ff, -b_ff, g_tt, -b_tt, and g_ft = g_tf, b_ft = b_tf, in the usual notation'''
+
+        self.branch_coeff_orig_sq_real = self.branch_adm_orig_real.copy()
+        self.branch_coeff_orig_sq_imag = - self.branch_adm_orig_imag
+        self.branch_coeff_dest_sq_real = self.branch_adm_dest_real.copy()
+        self.branch_coeff_dest_sq_imag = - self.branch_adm_dest_imag
+        self.branch_coeff_cross_real = - self.branch_adm_real
+        self.branch_coeff_cross_imag = - self.branch_adm_imag
+
+    def set_data_bus_pow_balance_params(self):
+        '''one signed bus x injection operator for the bus power balance.
+        the injections are stacked as
+        [gen, load, fxsh, swsh, branch orig, branch dest],
+        with a sign of 1 for gens and -1 for the others, so the balance
+        at every bus, real and imag, is a single sparse product, see compute_bus_pow_balance.
+        the pow_balance_ slices give the position of each kind of injection'''
+
+        start_time = time.time()
+        sizes = [self.num_gen, self.num_bus, self.num_bus, self.num_bus, self.num_branch, self.num_branch]
+        ends = np.cumsum(sizes)
+        starts = ends - sizes
+        (self.pow_balance_gen,
+         self.pow_balance_load,
+         self.pow_balance_fxsh,
+         self.pow_balance_swsh,
+         self.pow_balance_branch_orig,
+         self.pow_balance_branch_dest) = [slice(starts[k], ends[k]) for k in range(len(sizes))]
+        self.num_pow_balance_inj = ends[-1]
+        bus = np.arange(self.num_bus)
+        self.bus_pow_balance_matrix = sp.csr_matrix(
+            (np.concatenate((np.ones(self.num_gen), - np.ones(self.num_pow_balance_inj - self.num_gen))),
+             (np.concatenate((self.gen_bus, bus, bus, bus, self.branch_orig_bus, self.branch_dest_bus)),
+              np.arange(self.num_pow_balance_inj))),
+            (self.num_bus, self.num_pow_balance_inj))
+        end_time = time.time()
+        print('set data bus pow balance params: %f' % (end_time - start_time))
+
+    def set_data_ybus_params(self):
+        '''complex bus admittance matrix from the branch table and the fixed shunts,
+        and the complex admittances of each branch, i.e. branch currents
+        orig: adm_orig_orig * V_orig + adm_orig_dest * V_dest
+        dest: adm_dest_orig * V_orig + adm_dest_dest * V_dest
+        see ybus_engine'''
+
+        start_time = time.time()
+        branch_adm = self.branch_adm_real + 1j * self.branch_adm_imag
+        branch_tap_ang = np.exp(1j * self.branch_tap_ang)
+        self.branch_adm_orig_orig = self.branch_adm_orig_real + 1j * self.branch_adm_orig_imag
+        self.branch_adm_orig_dest = - branch_adm * branch_tap_ang
+        self.branch_adm_dest_orig = - branch_adm * np.conj(branch_tap_ang)
+        self.branch_adm_dest_dest = self.branch_adm_dest_real + 1j * self.branch_adm_dest_imag
+        bus = np.arange(self.num_bus)
+        self.ybus = sp.csr_matrix(
+            (np.concatenate((
+                self.branch_adm_orig_orig, self.branch_adm_orig_dest,
+                self.branch_adm_dest_orig, self.branch_adm_dest_dest,
+                self.bus_fxsh_adm_real + 1j * self.bus_fxsh_adm_imag)),
+             (np.concatenate((
+                 self.branch_orig_bus, self.branch_orig_bus,
+                 self.branch_dest_bus, self.branch_dest_bus, bus)),
+              np.concatenate((
+                  self.branch_orig_bus, self.branch_dest_bus,
+                  self.branch_orig_bus, self.branch_dest_bus, bus)))),
+            (self.num_bus, self.num_bus))
+        self.ybus.sum_duplicates()
+        end_time = time.time()
+        print('set data ybus params: %f' % (end_time - start_time))
+
     def set_data_swsh_params(self, data):
 
         start_time = time.time()
@@ -863,8 +1462,7 @@ class Evaluation:
         swshs = list(data.raw.switched_shunts.values())
         self.num_swsh = len(swshs)
         self.swsh_i = [r.i for r in swshs]
-        self.swsh_bus = [self.bus_map[self.swsh_i[i]] for i in range(self.num_swsh)]
-        self.swsh_map = {self.swsh_i[i]:i for i in range(self.num_swsh)}
+        self.swsh_bus = self.bus_index.get(self.swsh_i)
         self.swsh_status = np.array([r.stat for r in swshs])
         self.swsh_adm_imag_max = np.array([0.0 for r in swshs])
         self.swsh_adm_imag_min = np.array([0.0 for r in swshs])
@@ -884,8 +1482,8 @@ class Evaluation:
                     else:
                         break
         self.bus_swsh_matrix = sp.csc_matrix(
-            ([1.0 for i in range(self.num_swsh)],
-             (self.swsh_bus, list(range(self.num_swsh)))),
+            (np.ones(self.num_swsh),
+             (self.swsh_bus, np.arange(self.num_swsh))),
             (self.num_bus, self.num_swsh))
         self.bus_swsh_adm_imag_max = self.bus_swsh_matrix.dot(self.swsh_adm_imag_max)
         self.bus_swsh_adm_imag_min = self.bus_swsh_matrix.dot(self.swsh_adm_imag_min)
@@ -911,10 +1509,11 @@ class Evaluation:
         self.gen_num_pl = [0 for i in range(self.num_gen)]
         self.gen_pl_x = [None for i in range(self.num_gen)]
         self.gen_pl_y = [None for i in range(self.num_gen)]
-        for r in data.rop.generator_dispatch_records.values():
+        records = list(data.rop.generator_dispatch_records.values())
+        records_gen = self.gen_index.get([(r.bus, r.genid) for r in records])
+        for (r, gen) in zip(records, records_gen):
             r_bus = r.bus
             r_genid = r.genid
-            gen = self.gen_map[(r_bus, r_genid)]
             r_dsptbl = r.dsptbl
             s = data.rop.active_power_dispatch_records[r_dsptbl]
             r_ctbl = s.ctbl
@@ -963,46 +1562,114 @@ class Evaluation:
                         print(d1)
                         #raise Exception('cost convexity error') # 
             #'''
+        self.set_data_gen_cost_tables()
         end_time = time.time()
         print('set data gen cost params: %f' % (end_time - start_time))
 
+    def set_data_gen_cost_tables(self):
+        '''packs the piecewise linear cost functions into (num gen, max num segments) arrays,
+        padded on the right, for compute_gen_cost.
+        segment i of gen k starts at (gen_pl_seg_x[k, i], gen_pl_seg_y[k, i]),
+        has slope gen_pl_seg_slope[k, i], and covers p <= gen_pl_seg_x_end[k, i].
+        the first segment extends to the left and the last one to the right, so x_end
+        is +inf on the last segment and on the padding.
+        gens with no cost function have no segments and get 0 cost'''
+
+        num_seg = np.array([max(0, n - 1) for n in self.gen_num_pl], dtype=int)
+        max_num_seg = max(1, np.amax(num_seg) if self.num_gen > 0 else 0)
+        self.gen_pl_seg_x = np.zeros(shape=(self.num_gen, max_num_seg))
+        self.gen_pl_seg_y = np.zeros(shape=(self.num_gen, max_num_seg))
+        self.gen_pl_seg_slope = np.zeros(shape=(self.num_gen, max_num_seg))
+        self.gen_pl_seg_x_end = np.full(shape=(self.num_gen, max_num_seg), fill_value=float('inf'))
+        for k in range(self.num_gen):
+            n = num_seg[k]
+            if n == 0:
+                continue
+            pl_x = np.array(self.gen_pl_x[k])
+            pl_y = np.array(self.gen_pl_y[k])
+            self.gen_pl_seg_x[k, :n] = pl_x[:-1]
+            self.gen_pl_seg_y[k, :n] = pl_y[:-1]
+            self.gen_pl_seg_slope[k, :n] = (pl_y[1:] - pl_y[:-1]) / (pl_x[1:] - pl_x[:-1])
+            self.gen_pl_seg_x_end[k, :(n - 1)] = pl_x[1:-1]
+
+    def set_data_penalty_params(self):
+        '''the penalized violations are stacked in one vector,
+        [branch (line, xfmr), bus pow balance real, bus pow balance imag],
+        so the penalty of all of them, for one ctg or for a batch, is one call of compute_penalty.
+        the blocks of the stack are set in set_params_penalty_viol_blocks'''
+
+        self.num_penalty_viol = self.num_branch + 2 * self.num_bus
+        self.penalty_viol_line = slice(0, self.num_line)
+        self.penalty_viol_xfmr = slice(self.num_line, self.num_branch)
+        self.penalty_viol_branch = slice(0, self.num_branch)
+        self.penalty_viol_bus_real = slice(self.num_branch, self.num_branch + self.num_bus)
+        self.penalty_viol_bus_imag = slice(self.num_branch + self.num_bus, self.num_penalty_viol)
+
+    def set_params_penalty_viol_blocks(self):
+        '''penalty_viol_block_max, penalty_viol_block_coeff give the blocks of each
+        entry of the stacked violations, (num block - 1, num) and (num block, num).
+        a category with fewer blocks is padded with 0 width blocks before its last, unbounded, block'''
+
+        blocks = [
+            (self.penalty_viol_branch, self.penalty_block_pow_abs_max, self.penalty_block_pow_abs_coeff),
+            (self.penalty_viol_bus_real, self.penalty_block_pow_real_max, self.penalty_block_pow_real_coeff),
+            (self.penalty_viol_bus_imag, self.penalty_block_pow_imag_max, self.penalty_block_pow_imag_coeff)]
+        num_block_bounded = max([len(b[1]) for b in blocks])
+        self.penalty_viol_block_max = np.zeros(shape=(num_block_bounded, self.num_penalty_viol))
+        self.penalty_viol_block_coeff = np.zeros(shape=(num_block_bounded + 1, self.num_penalty_viol))
+        for (k, block_max, block_coeff) in blocks:
+            assert(len(block_max) + 1 == len(block_coeff))
+            self.penalty_viol_block_max[:len(block_max), k] = np.reshape(block_max, (-1, 1))
+            self.penalty_viol_block_coeff[:len(block_max), k] = np.reshape(block_coeff[:-1], (-1, 1))
+            self.penalty_viol_block_coeff[-1, k] = block_coeff[-1]
+
     def set_data_ctg_params(self, data):
         # contingency records
         # this section was pretty long (40 s) - much reduced now, < 1 s (see below)
 
         start_time = time.time()
-        ctgs = data.con.contingencies.values()
+        ctgs = list(data.con.contingencies.values())
         self.num_ctg = len(ctgs)
         self.ctg_label = [r.label for r in ctgs]
         self.ctg_map = dict(zip(self.ctg_label, range(self.num_ctg)))
-        line_keys = set(self.line_key)
-        xfmr_keys = set(self.xfmr_key)
-        ctg_gen_keys_out = {
-            r.label:set([(e.i, e.id) for e in r.generator_out_events])
-            for r in ctgs}
-        ctg_branch_keys_out = {
-            r.label:set([(e.i, e.j, e.ckt) for e in r.branch_out_events])
-            for r in ctgs}
-        ctg_line_keys_out = {k:(v & line_keys) for k,v in ctg_branch_keys_out.items()}
-        ctg_xfmr_keys_out = {k:(v & xfmr_keys) for k,v in ctg_branch_keys_out.items()}
-        ctg_areas_affected = {
-            k.label:(
-                set([self.bus_area[self.bus_map[r[0]]] for r in ctg_gen_keys_out[k.label]]) |
-                set([self.bus_area[self.bus_map[r[0]]] for r in ctg_branch_keys_out[k.label]]) |
-                set([self.bus_area[self.bus_map[r[1]]] for r in ctg_branch_keys_out[k.label]]))
-            for k in ctgs}
-        self.ctg_gens_out = [
-            [self.gen_map[k] for k in ctg_gen_keys_out[self.ctg_label[i]]]
-            for i in range(self.num_ctg)]
-        self.ctg_lines_out = [
-            [self.line_map[k] for k in ctg_line_keys_out[self.ctg_label[i]]]
-            for i in range(self.num_ctg)]
-        self.ctg_xfmrs_out = [
-            [self.xfmr_map[k] for k in ctg_xfmr_keys_out[self.ctg_label[i]]]
-            for i in range(self.num_ctg)]
-        self.ctg_areas_affected = [
-            ctg_areas_affected[self.ctg_label[i]]
-            for i in range(self.num_ctg)]
+
+        # the outage events of all the ctgs in flat arrays, with the ctg of each event
+        gen_event_ctg = [k for k in range(self.num_ctg) for e in ctgs[k].generator_out_events]
+        gen_event_key = [(e.i, e.id) for r in ctgs for e in r.generator_out_events]
+        branch_event_ctg = np.array([k for k in range(self.num_ctg) for e in ctgs[k].branch_out_events], dtype=np.int_)
+        branch_event_key = [(e.i, e.j, e.ckt) for r in ctgs for e in r.branch_out_events]
+
+        # outaged gens must exist. a branch key may be a line or a xfmr
+        gen_event_gen = self.gen_index.get(gen_event_key)
+        branch_event_line = self.line_index.find(branch_event_key)
+        branch_event_xfmr = self.xfmr_index.find(branch_event_key)
+        is_line = (branch_event_line >= 0)
+        is_xfmr = (branch_event_xfmr >= 0)
+
+        # the areas of the buses of all the outaged elements, branches at both ends
+        area_event_ctg = np.concatenate((gen_event_ctg, branch_event_ctg, branch_event_ctg))
+        area_event_area = self.bus_area[self.bus_index.get(
+            [r[0] for r in gen_event_key] +
+            [r[0] for r in branch_event_key] +
+            [r[1] for r in branch_event_key])]
+
+        # CSR tables. row k holds the elements of ctg k
+        (self.ctg_gens_out_indptr, self.ctg_gens_out_indices) = make_csr_table(
+            gen_event_ctg, gen_event_gen, self.num_ctg, self.num_gen)
+        (self.ctg_lines_out_indptr, self.ctg_lines_out_indices) = make_csr_table(
+            branch_event_ctg[is_line], branch_event_line[is_line], self.num_ctg, self.num_line)
+        (self.ctg_xfmrs_out_indptr, self.ctg_xfmrs_out_indices) = make_csr_table(
+            branch_event_ctg[is_xfmr], branch_event_xfmr[is_xfmr], self.num_ctg, self.num_xfmr)
+        (self.ctg_areas_affected_indptr, self.ctg_areas_affected_indices) = make_csr_table(
+            area_event_ctg, area_event_area, self.num_ctg, self.num_area)
+        (self.ctg_branches_out_indptr, self.ctg_branches_out_indices) = make_csr_table(
+            np.concatenate((branch_event_ctg[is_line], branch_event_ctg[is_xfmr])),
+            np.concatenate((branch_event_line[is_line], self.num_line + branch_event_xfmr[is_xfmr])),
+            self.num_ctg, self.num_line + self.num_xfmr)
+        self.ctg_type = (
+            ctg_type_gen * (np.diff(self.ctg_gens_out_indptr) > 0) +
+            ctg_type_line * (np.diff(self.ctg_lines_out_indptr) > 0) +
+            ctg_type_xfmr * (np.diff(self.ctg_xfmrs_out_indptr) > 0)).astype(np.int32)
         end_time = time.time()
         print('set data ctg params: %f' % (end_time - start_time))
 
@@ -1018,9 +1685,18 @@ class Evaluation:
         self.set_data_gen_params(data)
         self.set_data_line_params(data)
         self.set_data_xfmr_params(data)
+        self.set_data_branch_params()
+        self.set_data_branch_coeffs()
+        self.set_data_ybus_params()
+        self.set_data_bus_pow_balance_params()
         self.set_data_swsh_params(data)
         self.set_data_gen_cost_params(data)
         self.set_data_ctg_params(data)
+        self.set_data_penalty_params()
+        self.ctg_workspace = CtgWorkspace(
+            self.num_bus, self.num_gen, self.num_branch,
+            num_pow_balance_inj=self.num_pow_balance_inj, num_penalty_viol=self.num_penalty_viol,
+            num_area=self.num_area)
         end_time = time.time()
         print('set data time: %f' % (end_time - start_time))
 
@@ -1033,64 +1709,57 @@ class Evaluation:
         self.penalty_block_pow_imag_coeff = np.array(penalty_block_pow_imag_coeff) * self.base_mva
         self.penalty_block_pow_abs_max = np.array(penalty_block_pow_abs_max) / self.base_mva
         self.penalty_block_pow_abs_coeff = np.array(penalty_block_pow_abs_coeff) * self.base_mva
+        self.set_params_penalty_viol_blocks()
+
+    def get_sol_permutations(self, sol_bus_i, sol_gen_i, sol_gen_id):
+        '''permutations taking the bus and generator order of a solution file
+        to the order of the data, i.e. x_data = x_sol[permutation],
+        or None for a solution already in the order of the data.
+        most solvers write the solution in the data order, and this is checked
+        by comparing the key arrays. otherwise the permutations are looked up
+        in a KeyIndex of the solution keys. the last result is cached with the raw
+        keys, so cleaning the ids and the lookups are only needed when the order
+        changes from one solution block to the next.'''
+
+        cache = self.sol_permutation_cache
+        if (cache is not None and
+            np.array_equal(cache[0], sol_bus_i) and
+            np.array_equal(cache[1], sol_gen_i) and
+            cache[2] == list(sol_gen_id)):
+            return (cache[3], cache[4])
+
+        if np.array_equal(sol_bus_i, self.bus_i_array):
+            bus_permutation = None
+        else:
+            bus_permutation = KeyIndex(np.asarray(sol_bus_i)).get(self.bus_i_array)
+        sol_gen_id_clean = clean_string_array(sol_gen_id)
+        if np.array_equal(sol_gen_i, self.gen_i_array) and np.array_equal(sol_gen_id_clean, self.gen_id_array):
+            gen_permutation = None
+        else:
+            sol_gen_index = KeyIndex(make_key_array_from_fields([sol_gen_i, sol_gen_id_clean]))
+            gen_permutation = sol_gen_index.get(self.gen_index.keys)
+        self.sol_permutation_cache = (
+            np.array(sol_bus_i), np.array(sol_gen_i), list(sol_gen_id),
+            bus_permutation, gen_permutation)
+        return (bus_permutation, gen_permutation)
 
     def set_solution1(self, solution1):
         ''' set values from the solution objects
         convert to per unit (p.u.) convention'''
 
         start_time = time.time()
-        sol_bus_i = solution1.bus_df.i.values
-        sol_gen_i = solution1.gen_df.i.values
-        #print(solution1.gen_df.id)
-        #sol_gen_id = solution1.gen_df.id.values
-        sol_gen_id = map(clean_string, list(solution1.gen_df.id.values))
-
-        #for i in range(self.num_gen):
-        #    gi = sol_gen_i[i]
-        #    gid = sol_gen_id[i]
-        #    if gi == 630653:
-        #        print( (gi, gid) )
-
-        # which is faster? do the same for gens
-        #sol_bus_map = {sol_bus_i[i]:i for i in range(self.num_bus)}
-        sol_bus_map = dict(zip(sol_bus_i, list(range(self.num_bus))))
-
-        #sol_gen_map = {(sol_gen_i[i], sol_gen_id[i]):i for i in range(self.num_gen)}
-        sol_gen_key = zip(sol_gen_i, sol_gen_id)
-        sol_gen_map = dict(zip(sol_gen_key, list(range(self.num_gen))))
-        #print([sol_gen_i, sol_gen_id, sol_gen_key, sol_gen_map, self.gen_key])
-        # up through here is fast enough ~ 0.001 s
-        
-        # which is faster?
-        #bus_permutation = [sol_bus_map[self.bus_i[r]] for r in range(self.num_bus)] # this line is slow ~0.015s. is there a faster python-y way to do it?
-        bus_permutation = [sol_bus_map[k] for k in self.bus_i]
-        #bus_permutation = list(itemgetter(*(self.bus_i))(sol_bus_map))
-        #bus_permutation = itemgetter(*(self.bus_i))(sol_bus_map) # this does not work - list is needed, unfortunately, and takes some time
-        #a = {'foo':0, 'bar':1, 'baz':2}
-        #b = ['bar', 'baz', 'foo']
-        #print(str(*b))
-        #perm = list(itemgetter(*b)(a))
-        #vector = np.array([11,12,13])
-        #print(vector[perm])
-        #print(perm)
-        #print(vector.flat[1,2,0])
-
-        # up through here takes 0.015 s
-        #gen_permutation = [sol_gen_map[(self.gen_i[r], self.gen_id[r])] for r in range(self.num_gen)]
-        #gen_permutation = [sol_gen_map[self.gen_key[r]] for r in range(self.num_gen)]
-        gen_permutation = [sol_gen_map[k] for k in self.gen_key]
-        #gen_permutation = list(itemgetter(*(self.gen_key))(sol_gen_map))
-        # up through here takes 0.015 s
+        (bus_permutation, gen_permutation) = self.get_sol_permutations(
+            solution1.bus_i, solution1.gen_i, solution1.gen_id)
         
         # need it to handle arbitrary bus order in solution files
         # is there a faster way to do it?
         # maybe arrange all the bus-indexed vectors in a matrix - not much time left to save though
         # multiplication by a permutation matrix?
-        self.bus_volt_mag = solution1.bus_df.vm.values[bus_permutation]
-        self.bus_volt_ang = solution1.bus_df.va.values[bus_permutation] * (math.pi / 180.0)
-        self.bus_swsh_adm_imag = solution1.bus_df.b.values[bus_permutation] / self.base_mva
-        self.gen_pow_real = solution1.gen_df.pg.values[gen_permutation] / self.base_mva
-        self.gen_pow_imag = solution1.gen_df.qg.values[gen_permutation] / self.base_mva
+        self.bus_volt_mag = permute_column(solution1.bus_array, bus_permutation, 0)
+        self.bus_volt_ang = permute_column(solution1.bus_array, bus_permutation, 1) * (math.pi / 180.0)
+        self.bus_swsh_adm_imag = permute_column(solution1.bus_array, bus_permutation, 2) / self.base_mva
+        self.gen_pow_real = permute_column(solution1.gen_array, gen_permutation, 0) / self.base_mva
+        self.gen_pow_imag = permute_column(solution1.gen_array, gen_permutation, 1) / self.base_mva
         self.gen_bus_volt_mag = self.bus_volt_mag[self.gen_bus]
         # up through here is fast enough ~ 0.02 s (only 0.005 s from previous point)
         end_time = time.time()
@@ -1100,25 +1769,47 @@ class Evaluation:
         ''' set values from the solution objects
         convert to per unit (p.u.) convention'''
 
+        work = self.ctg_workspace
         self.ctg_current = self.ctg_map[clean_string(solution2.ctg_label)]
-        sol_bus_i = solution2.bus_df.i.values
-        sol_gen_i = solution2.gen_df.i.values
-        #sol_gen_id = solution2.gen_df.id.values
-        sol_gen_id = map(clean_string, list(solution2.gen_df.id.values))
-        sol_bus_map = dict(zip(sol_bus_i, list(range(self.num_bus))))
-        sol_gen_key = zip(sol_gen_i, sol_gen_id)
-        sol_gen_map = dict(zip(sol_gen_key, list(range(self.num_gen))))
-        #bus_permutation = list(itemgetter(*(self.bus_i))(sol_bus_map))
-        #gen_permutation = list(itemgetter(*(self.gen_key))(sol_gen_map))
-        bus_permutation = [sol_bus_map[k] for k in self.bus_i]
-        gen_permutation = [sol_gen_map[k] for k in self.gen_key]
-        self.ctg_bus_volt_mag = solution2.bus_df.vm.values[bus_permutation]
-        self.ctg_bus_volt_ang = solution2.bus_df.va.values[bus_permutation] * (math.pi / 180.0)
-        self.ctg_bus_swsh_adm_imag = solution2.bus_df.b.values[bus_permutation] / self.base_mva
-        #self.ctg_gen_pow_real = solution2.gen_df.pg.values[gen_permutation] / self.base_mva # ctg_gen_pow_real is computed, not read from data
-        self.ctg_gen_pow_imag = solution2.gen_df.qg.values[gen_permutation] / self.base_mva
+        (bus_permutation, gen_permutation) = self.get_sol_permutations(
+            solution2.bus_i, solution2.gen_i, solution2.gen_id)
+        self.ctg_bus_volt_mag = permute_column(solution2.bus_array, bus_permutation, 0, out=work.bus_volt_mag)
+        self.ctg_bus_volt_ang = permute_column(solution2.bus_array, bus_permutation, 1, out=work.bus_volt_ang)
+        self.ctg_bus_volt_ang *= (math.pi / 180.0)
+        self.ctg_bus_swsh_adm_imag = permute_column(solution2.bus_array, bus_permutation, 2, out=work.bus_swsh_adm_imag)
+        self.ctg_bus_swsh_adm_imag /= self.base_mva
+        #self.ctg_gen_pow_real = permute_column(solution2.gen_array, gen_permutation, 0) / self.base_mva # ctg_gen_pow_real is computed, not read from data
+        self.ctg_gen_pow_imag = permute_column(solution2.gen_array, gen_permutation, 1, out=work.gen_pow_imag)
+        self.ctg_gen_pow_imag /= self.base_mva
         self.ctg_pow_real_change = solution2.delta / self.base_mva
-        self.ctg_gen_bus_volt_mag = self.ctg_bus_volt_mag[self.gen_bus]
+        self.ctg_gen_bus_volt_mag = np.take(self.ctg_bus_volt_mag, self.gen_bus, out=work.gen_bus_volt_mag)
+
+    def set_solution2_batch(self, solution2_batch):
+        '''as set_solution2, for a batch of ctgs, see eval_ctg_batch.
+        row k of each array is from solution2_batch[k]'''
+
+        num_ctg_batch = len(solution2_batch)
+        self.ctg_batch = np.zeros(shape=num_ctg_batch, dtype=np.int_)
+        self.ctg_batch_bus_volt_mag = np.zeros(shape=(num_ctg_batch, self.num_bus))
+        self.ctg_batch_bus_volt_ang = np.zeros(shape=(num_ctg_batch, self.num_bus))
+        self.ctg_batch_bus_swsh_adm_imag = np.zeros(shape=(num_ctg_batch, self.num_bus))
+        self.ctg_batch_gen_pow_imag = np.zeros(shape=(num_ctg_batch, self.num_gen))
+        self.ctg_batch_pow_real_change = np.zeros(shape=num_ctg_batch)
+        for k in range(num_ctg_batch):
+            solution2 = solution2_batch[k]
+            self.ctg_batch[k] = self.ctg_map[clean_string(solution2.ctg_label)]
+            (bus_permutation, gen_permutation) = self.get_sol_permutations(
+                solution2.bus_i, solution2.gen_i, solution2.gen_id)
+            self.ctg_batch_bus_volt_mag[k] = permute_column(solution2.bus_array, bus_permutation, 0)
+            self.ctg_batch_bus_volt_ang[k] = permute_column(solution2.bus_array, bus_permutation, 1)
+            self.ctg_batch_bus_swsh_adm_imag[k] = permute_column(solution2.bus_array, bus_permutation, 2)
+            self.ctg_batch_gen_pow_imag[k] = permute_column(solution2.gen_array, gen_permutation, 1)
+            self.ctg_batch_pow_real_change[k] = solution2.delta
+        self.ctg_batch_bus_volt_ang *= (math.pi / 180.0)
+        self.ctg_batch_bus_swsh_adm_imag /= self.base_mva
+        self.ctg_batch_gen_pow_imag /= self.base_mva
+        self.ctg_batch_pow_real_change /= self.base_mva
+        self.ctg_batch_gen_bus_volt_mag = self.ctg_batch_bus_volt_mag[:, self.gen_bus]
 
     def set_ctg_data(self):
         '''need to set:
@@ -1139,22 +1830,51 @@ class Evaluation:
         '''
 
         #'''
-        gens_out_of_service = set(self.gen_out_of_service) | set(self.ctg_gens_out[self.ctg_current])
-        areas_affected = self.ctg_areas_affected[self.ctg_current]
-        gens_participating = set([g for a in areas_affected for g in self.area_gens[a]])
-        gens_participating = gens_participating - gens_out_of_service
-        gens_not_participating = set(range(self.num_gen)) - gens_participating
-        self.ctg_gen_out_of_service = sorted(list(gens_out_of_service))
-        self.ctg_gen_not_participating = sorted(list(gens_not_participating))
-        self.ctg_gen_pow_imag_min = self.gen_pow_imag_min.copy() # base case p/q min/max already are 0.0 for generators out of service in the base case
-        self.ctg_gen_pow_imag_max = self.gen_pow_imag_max.copy()
-        self.ctg_gen_pow_imag_min[self.ctg_gen_out_of_service] = 0.0 # set q min/max to 0.0 for generators going out of service in current contingency - p not needed
-        self.ctg_gen_pow_imag_max[self.ctg_gen_out_of_service] = 0.0
+        # masks over gens, from the area x gen matrix, no python sets
+        work = self.ctg_workspace
+        gen_out_of_service = work.gen_out_of_service_mask
+        gen_out_of_service[:] = self.gen_out_of_service_mask
+        gen_out_of_service[csr_row(self.ctg_gens_out_indptr, self.ctg_gens_out_indices, self.ctg_current)] = True
+        area_affected = work.area_affected
+        area_affected.fill(0.0)
+        area_affected[csr_row(self.ctg_areas_affected_indptr, self.ctg_areas_affected_indices, self.ctg_current)] = 1.0
+        gen_not_participating = work.gen_not_participating_mask
+        np.greater(self.area_gen_matrix.T.dot(area_affected), 0.0, out=gen_not_participating)
+        np.logical_not(gen_not_participating, out=gen_not_participating)
+        np.logical_or(gen_not_participating, gen_out_of_service, out=gen_not_participating)
+        self.ctg_gen_out_of_service_mask = gen_out_of_service
+        self.ctg_gen_not_participating_mask = gen_not_participating
+        self.ctg_gen_out_of_service = np.flatnonzero(gen_out_of_service)
+        self.ctg_gen_not_participating = np.flatnonzero(gen_not_participating)
+        # base case p/q min/max already are 0.0 for generators out of service in the base case
+        # set q min/max to 0.0 for generators going out of service in current contingency - p not needed
+        self.ctg_gen_pow_imag_min = work.gen_pow_imag_min
+        self.ctg_gen_pow_imag_min[:] = self.gen_pow_imag_min
+        self.ctg_gen_pow_imag_min[gen_out_of_service] = 0.0
+        self.ctg_gen_pow_imag_max = work.gen_pow_imag_max
+        self.ctg_gen_pow_imag_max[:] = self.gen_pow_imag_max
+        self.ctg_gen_pow_imag_max[gen_out_of_service] = 0.0
         #'''
 
         end_time = time.time()
         #print('set ctg data time: %f' % (end_time - start_time))
 
+    def set_ctg_data_batch(self):
+        '''as set_ctg_data, for the ctgs of the batch'''
+
+        num_ctg_batch = self.ctg_batch.size
+        gen_out_of_service = np.tile(self.gen_out_of_service_mask, (num_ctg_batch, 1))
+        (k, gen) = csr_rows(self.ctg_gens_out_indptr, self.ctg_gens_out_indices, self.ctg_batch)
+        gen_out_of_service[k, gen] = True
+        area_affected = np.zeros(shape=(num_ctg_batch, self.num_area))
+        (k, area) = csr_rows(self.ctg_areas_affected_indptr, self.ctg_areas_affected_indices, self.ctg_batch)
+        area_affected[k, area] = 1.0
+        gen_participating = (self.area_gen_matrix.T.dot(area_affected.T).T > 0.0) & (~gen_out_of_service)
+        self.ctg_batch_gen_out_of_service_mask = gen_out_of_service
+        self.ctg_batch_gen_not_participating_mask = ~gen_participating
+        self.ctg_batch_gen_pow_imag_min = np.where(gen_out_of_service, 0.0, self.gen_pow_imag_min)
+        self.ctg_batch_gen_pow_imag_max = np.where(gen_out_of_service, 0.0, self.gen_pow_imag_max)
+
     def write_header(self, det_name):
         """write header line for detailed output
         the detailed output file has a header row, then a row for the base case, then a row for each contingency.
@@ -1261,6 +1981,24 @@ class Evaluation:
                  self.max_xfmr_pow_dest_mag_max_viol[1],
                  ])
 
+    def write_top_k_header(self, top_k_name):
+        """write header line for the top k file, see detail_top_k.
+        each row is one of the detail_top_k largest violations > 0 of a category
+        in the base case (empty ctg) or a ctg, largest first (rank 1).
+        cat is the name of the (idx, val) pair of the category in the detail file,
+        and idx is written as in that pair, e.g. "(1, '1')" for a gen"""
+
+        with open(top_k_name, 'w') as out:
+            csv_writer = csv.writer(out, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerow(['ctg', 'cat', 'rank', 'idx', 'val'])
+
+    def write_top_k(self, top_k_name, rows):
+        """append rows to the top k file"""
+
+        with open(top_k_name, 'a') as out:
+            csv_writer = csv.writer(out, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerows(rows)
+
     def print_base(self):
         """print out summary info on the base case"""
 
@@ -1275,45 +2013,56 @@ class Evaluation:
         #with open(det_name, 'a', newline='') as out:
         #with open(det_name, 'ab') as out:
             csv_writer = csv.writer(out, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
-            csv_writer.writerow(
-                [self.ctg_label[self.ctg_current], self.ctg_infeas, self.ctg_penalty, 0.0, self.obj,
-                 self.ctg_max_bus_volt_mag_max_viol[0],
-                 self.ctg_max_bus_volt_mag_max_viol[1],
-                 self.ctg_max_bus_volt_mag_min_viol[0],
-                 self.ctg_max_bus_volt_mag_min_viol[1],
-                 self.ctg_max_bus_swsh_adm_imag_max_viol[0],
-                 self.ctg_max_bus_swsh_adm_imag_max_viol[1],
-                 self.ctg_max_bus_swsh_adm_imag_min_viol[0],
-                 self.ctg_max_bus_swsh_adm_imag_min_viol[1],
-                 self.ctg_max_bus_pow_balance_real_viol[0],
-                 self.ctg_max_bus_pow_balance_real_viol[1],
-                 self.ctg_max_bus_pow_balance_imag_viol[0],
-                 self.ctg_max_bus_pow_balance_imag_viol[1],
-                 #self.ctg_max_gen_pow_real_max_viol[0],
-                 #self.ctg_max_gen_pow_real_max_viol[1],
-                 #self.ctg_max_gen_pow_real_min_viol[0],
-                 #self.ctg_max_gen_pow_real_min_viol[1],
-                 None,
-                 0.0,
-                 None,
-                 0.0,
-                 self.ctg_max_gen_pow_imag_max_viol[0],
-                 self.ctg_max_gen_pow_imag_max_viol[1],
-                 self.ctg_max_gen_pow_imag_min_viol[0],
-                 self.ctg_max_gen_pow_imag_min_viol[1],
-                 self.ctg_max_gen_pvpq1_viol[0],
-                 self.ctg_max_gen_pvpq1_viol[1],
-                 self.ctg_max_gen_pvpq2_viol[0],
-                 self.ctg_max_gen_pvpq2_viol[1],
-                 self.ctg_max_line_curr_orig_mag_max_viol[0],
-                 self.ctg_max_line_curr_orig_mag_max_viol[1],
-                 self.ctg_max_line_curr_dest_mag_max_viol[0],
-                 self.ctg_max_line_curr_dest_mag_max_viol[1],
-                 self.ctg_max_xfmr_pow_orig_mag_max_viol[0],
-                 self.ctg_max_xfmr_pow_orig_mag_max_viol[1],
-                 self.ctg_max_xfmr_pow_dest_mag_max_viol[0],
-                 self.ctg_max_xfmr_pow_dest_mag_max_viol[1],
-                 ])
+            csv_writer.writerow(self.get_ctg_detail_row())
+
+    def write_ctg_rows(self, det_name, rows):
+        """write detail of ctg evaluations, rows from get_ctg_detail_row"""
+
+        with open(det_name, 'a') as out:
+            csv_writer = csv.writer(out, delimiter=',', quotechar='"', quoting=csv.QUOTE_MINIMAL)
+            csv_writer.writerows(rows)
+
+    def get_ctg_detail_row(self):
+        """detail of ctg evaluation, a row of the detail file"""
+
+        return [self.ctg_label[self.ctg_current], self.ctg_infeas, self.ctg_penalty, 0.0, self.obj,
+            self.ctg_max_bus_volt_mag_max_viol[0],
+            self.ctg_max_bus_volt_mag_max_viol[1],
+            self.ctg_max_bus_volt_mag_min_viol[0],
+            self.ctg_max_bus_volt_mag_min_viol[1],
+            self.ctg_max_bus_swsh_adm_imag_max_viol[0],
+            self.ctg_max_bus_swsh_adm_imag_max_viol[1],
+            self.ctg_max_bus_swsh_adm_imag_min_viol[0],
+            self.ctg_max_bus_swsh_adm_imag_min_viol[1],
+            self.ctg_max_bus_pow_balance_real_viol[0],
+            self.ctg_max_bus_pow_balance_real_viol[1],
+            self.ctg_max_bus_pow_balance_imag_viol[0],
+            self.ctg_max_bus_pow_balance_imag_viol[1],
+            #self.ctg_max_gen_pow_real_max_viol[0],
+            #self.ctg_max_gen_pow_real_max_viol[1],
+            #self.ctg_max_gen_pow_real_min_viol[0],
+            #self.ctg_max_gen_pow_real_min_viol[1],
+            None,
+            0.0,
+            None,
+            0.0,
+            self.ctg_max_gen_pow_imag_max_viol[0],
+            self.ctg_max_gen_pow_imag_max_viol[1],
+            self.ctg_max_gen_pow_imag_min_viol[0],
+            self.ctg_max_gen_pow_imag_min_viol[1],
+            self.ctg_max_gen_pvpq1_viol[0],
+            self.ctg_max_gen_pvpq1_viol[1],
+            self.ctg_max_gen_pvpq2_viol[0],
+            self.ctg_max_gen_pvpq2_viol[1],
+            self.ctg_max_line_curr_orig_mag_max_viol[0],
+            self.ctg_max_line_curr_orig_mag_max_viol[1],
+            self.ctg_max_line_curr_dest_mag_max_viol[0],
+            self.ctg_max_line_curr_dest_mag_max_viol[1],
+            self.ctg_max_xfmr_pow_orig_mag_max_viol[0],
+            self.ctg_max_xfmr_pow_orig_mag_max_viol[1],
+            self.ctg_max_xfmr_pow_dest_mag_max_viol[0],
+            self.ctg_max_xfmr_pow_dest_mag_max_viol[1],
+            ]
 
     def eval_base(self):
         """evaluate base case violations"""
@@ -1324,10 +2073,8 @@ class Evaluation:
         self.eval_load_pow()
         self.eval_fxsh_pow()
         self.eval_gen_pow_viol()
-        self.eval_line_pow()
-        self.eval_line_curr_viol()
-        self.eval_xfmr_pow()
-        self.eval_xfmr_pow_viol()
+        self.eval_branch_pow()
+        self.eval_branch_flow_viol()
         self.eval_bus_swsh_adm_imag_viol()
         self.eval_bus_swsh_pow()
         self.eval_bus_pow_balance()
@@ -1347,10 +2094,12 @@ class Evaluation:
         self.eval_ctg_gen_pow_real()
         #self.eval_ctg_gen_pow_real_viol() # this is not used - ctg_gen_pow_real is computed by eval, and bounds are automatic
         self.eval_ctg_gen_pow_imag_viol()
-        self.eval_ctg_line_pow()
-        self.eval_ctg_line_curr_viol() 
-        self.eval_ctg_xfmr_pow()
-        self.eval_ctg_xfmr_pow_viol()
+        self.ctg_branch_kernel = None if ybus_engine else get_ctg_branch_kernel()
+        if self.ctg_branch_kernel is None:
+            self.eval_ctg_branch_pow()
+            self.eval_ctg_branch_flow_viol()
+        else:
+            self.eval_ctg_branch_kernel()
         self.eval_ctg_bus_swsh_adm_imag_viol()
         self.eval_ctg_bus_swsh_pow()
         self.eval_ctg_bus_pow_balance()
@@ -1370,6 +2119,215 @@ class Evaluation:
 
         if self.ctg_infeas > hard_constr_tol:
             self.infeas = 1
+
+    def eval_ctg_batch(self):
+        '''evaluate the ctgs of the batch set by set_solution2_batch and set_ctg_data_batch.
+        each step is as in eval_ctg, on (num ctg in batch, num bus), (num ctg in batch, num gen), etc.
+        arrays, so the results for each ctg are the same as from eval_ctg.
+        then the obj, infeas and detail rows are updated one ctg at a time, in the order of the batch'''
+
+        self.eval_ctg_batch_bus_volt_viol()
+        self.eval_ctg_batch_fxsh_pow()
+        self.eval_ctg_batch_gen_pow_real()
+        self.eval_ctg_batch_gen_pow_imag_viol()
+        self.eval_ctg_batch_branch_pow()
+        self.eval_ctg_batch_branch_flow_viol()
+        self.eval_ctg_batch_bus_swsh_adm_imag_viol()
+        self.eval_ctg_batch_bus_swsh_pow()
+        self.eval_ctg_batch_bus_pow_balance()
+        self.eval_ctg_batch_gen_pvpq_viol()
+        self.compute_ctg_batch_detail()
+        self.eval_ctg_batch_penalty()
+        self.ctg_batch_detail_rows = []
+        for k in range(self.ctg_batch.size):
+            self.set_ctg_batch_detail(k)
+            self.eval_ctg_infeas()
+            self.eval_ctg_update_obj()
+            self.eval_ctg_update_infeas()
+            self.ctg_batch_detail_rows.append(self.get_ctg_detail_row())
+
+    def eval_ctg_batch_bus_volt_viol(self):
+
+        self.ctg_batch_bus_volt_mag_min_viol = np.maximum(0.0, self.ctg_bus_volt_mag_min - self.ctg_batch_bus_volt_mag)
+        self.ctg_batch_bus_volt_mag_max_viol = np.maximum(0.0, self.ctg_batch_bus_volt_mag - self.ctg_bus_volt_mag_max)
+
+    def eval_ctg_batch_fxsh_pow(self):
+
+        self.ctg_batch_bus_fxsh_pow_real = self.bus_fxsh_adm_real * (self.ctg_batch_bus_volt_mag ** 2.0)
+        self.ctg_batch_bus_fxsh_pow_imag = - self.bus_fxsh_adm_imag * (self.ctg_batch_bus_volt_mag ** 2.0)
+
+    def eval_ctg_batch_gen_pow_real(self):
+
+        self.ctg_batch_gen_pow_real = np.maximum(
+            self.gen_pow_real_min,
+            np.minimum(
+                self.gen_pow_real_max,
+                self.gen_pow_real + self.gen_part_fact * self.ctg_batch_pow_real_change[:, np.newaxis]))
+        self.ctg_batch_gen_pow_real = np.where(
+            self.ctg_batch_gen_not_participating_mask, self.gen_pow_real, self.ctg_batch_gen_pow_real)
+        self.ctg_batch_gen_pow_real[self.ctg_batch_gen_out_of_service_mask] = 0.0
+
+    def eval_ctg_batch_gen_pow_imag_viol(self):
+
+        self.ctg_batch_gen_pow_imag_min_viol = np.maximum(0.0, self.ctg_batch_gen_pow_imag_min - self.ctg_batch_gen_pow_imag)
+        self.ctg_batch_gen_pow_imag_max_viol = np.maximum(0.0, self.ctg_batch_gen_pow_imag - self.ctg_batch_gen_pow_imag_max)
+
+    def eval_ctg_batch_branch_pow(self):
+
+        if ybus_engine:
+            self.ctg_batch_bus_volt = self.ctg_batch_bus_volt_mag * np.exp(1j * self.ctg_batch_bus_volt_ang)
+            branch_pow = self.compute_branch_pow_ybus(self.ctg_batch_bus_volt_mag, self.ctg_batch_bus_volt)
+        else:
+            branch_pow = self.compute_branch_pow(self.ctg_batch_bus_volt_mag, self.ctg_batch_bus_volt_ang)
+        (self.ctg_batch_branch_orig_volt_mag,
+         self.ctg_batch_branch_dest_volt_mag,
+         self.ctg_batch_branch_pow_orig_real,
+         self.ctg_batch_branch_pow_orig_imag,
+         self.ctg_batch_branch_pow_dest_real,
+         self.ctg_batch_branch_pow_dest_imag) = branch_pow
+        branches_out = csr_rows(self.ctg_branches_out_indptr, self.ctg_branches_out_indices, self.ctg_batch)
+        self.ctg_batch_branches_out = branches_out
+        self.ctg_batch_branch_pow_orig_real[branches_out] = 0.0
+        self.ctg_batch_branch_pow_orig_imag[branches_out] = 0.0
+        self.ctg_batch_branch_pow_dest_real[branches_out] = 0.0
+        self.ctg_batch_branch_pow_dest_imag[branches_out] = 0.0
+
+    def eval_ctg_batch_branch_flow_viol(self):
+
+        (self.ctg_batch_branch_flow_orig_mag_max_viol,
+         self.ctg_batch_branch_flow_dest_mag_max_viol) = self.compute_branch_flow_viol(
+            self.ctg_batch_branch_pow_orig_real,
+            self.ctg_batch_branch_pow_orig_imag,
+            self.ctg_batch_branch_pow_dest_real,
+            self.ctg_batch_branch_pow_dest_imag,
+            self.ctg_batch_branch_orig_volt_mag,
+            self.ctg_batch_branch_dest_volt_mag,
+            self.ctg_branch_flow_mag_max)
+        self.ctg_batch_line_curr_orig_mag_max_viol = self.ctg_batch_branch_flow_orig_mag_max_viol[:, self.branch_line]
+        self.ctg_batch_line_curr_dest_mag_max_viol = self.ctg_batch_branch_flow_dest_mag_max_viol[:, self.branch_line]
+        self.ctg_batch_xfmr_pow_orig_mag_max_viol = self.ctg_batch_branch_flow_orig_mag_max_viol[:, self.branch_xfmr]
+        self.ctg_batch_xfmr_pow_dest_mag_max_viol = self.ctg_batch_branch_flow_dest_mag_max_viol[:, self.branch_xfmr]
+
+    def eval_ctg_batch_bus_swsh_adm_imag_viol(self):
+
+        self.ctg_batch_bus_swsh_adm_imag_min_viol = np.maximum(0.0, self.bus_swsh_adm_imag_min - self.ctg_batch_bus_swsh_adm_imag)
+        self.ctg_batch_bus_swsh_adm_imag_max_viol = np.maximum(0.0, self.ctg_batch_bus_swsh_adm_imag - self.bus_swsh_adm_imag_max)
+
+    def eval_ctg_batch_bus_swsh_pow(self):
+
+        self.ctg_batch_bus_swsh_pow_imag = -self.ctg_batch_bus_swsh_adm_imag * self.ctg_batch_bus_volt_mag**2.0
+
+    def eval_ctg_batch_bus_pow_balance(self):
+        '''the operator is applied to all the ctgs of the batch at once,
+        i.e. (num bus, num inj) x (num inj, 2 x num ctg in batch)'''
+
+        if ybus_engine:
+            self.eval_ctg_batch_bus_pow_balance_ybus()
+            return
+        shape = self.ctg_batch_bus_volt_mag.shape
+        (resid_real, resid_imag) = self.compute_bus_pow_balance(
+            self.ctg_batch_gen_pow_real, self.ctg_batch_gen_pow_imag,
+            np.broadcast_to(self.bus_load_const_pow_real, shape), np.broadcast_to(self.bus_load_const_pow_imag, shape),
+            self.ctg_batch_bus_fxsh_pow_real, self.ctg_batch_bus_fxsh_pow_imag, self.ctg_batch_bus_swsh_pow_imag,
+            self.ctg_batch_branch_pow_orig_real, self.ctg_batch_branch_pow_orig_imag,
+            self.ctg_batch_branch_pow_dest_real, self.ctg_batch_branch_pow_dest_imag)
+        self.ctg_batch_bus_pow_balance_real_viol = np.abs(resid_real)
+        self.ctg_batch_bus_pow_balance_imag_viol = np.abs(resid_imag)
+
+    def eval_ctg_batch_bus_pow_balance_ybus(self):
+
+        bus_pow_inj = self.compute_bus_pow_inj_ybus(self.ctg_batch_bus_volt, self.ctg_batch_branches_out)
+        self.ctg_batch_bus_pow_balance_real_viol = np.abs(
+            self.bus_gen_matrix.dot(self.ctg_batch_gen_pow_real.T).T -
+            self.bus_load_const_pow_real -
+            bus_pow_inj.real)
+        self.ctg_batch_bus_pow_balance_imag_viol = np.abs(
+            self.bus_gen_matrix.dot(self.ctg_batch_gen_pow_imag.T).T -
+            self.bus_load_const_pow_imag -
+            self.ctg_batch_bus_swsh_pow_imag -
+            bus_pow_inj.imag)
+
+    def eval_ctg_batch_gen_pvpq_viol(self):
+
+        self.ctg_batch_gen_pvpq1_viol = np.minimum(
+            np.maximum(0.0, self.ctg_batch_gen_pow_imag_max - self.ctg_batch_gen_pow_imag),
+            np.maximum(0.0, self.gen_bus_volt_mag - self.ctg_batch_gen_bus_volt_mag))
+        self.ctg_batch_gen_pvpq2_viol = np.minimum(
+            np.maximum(0.0, self.ctg_batch_gen_pow_imag - self.ctg_batch_gen_pow_imag_min),
+            np.maximum(0.0, self.ctg_batch_gen_bus_volt_mag - self.gen_bus_volt_mag))
+
+    def eval_ctg_batch_penalty(self):
+        '''one penalty for each ctg of the batch, from the stacked violations of the batch.
+        the sums are over C ordered rows, so they are the same as the sums in eval_ctg_penalty'''
+
+        self.ctg_batch_penalty = (1 - base_case_penalty_weight) / max(1.0, float(self.num_ctg)) * self.compute_penalty(
+            self.stack_penalty_viol(
+                self.ctg_batch_branch_flow_orig_mag_max_viol, self.ctg_batch_branch_flow_dest_mag_max_viol,
+                self.ctg_batch_bus_pow_balance_real_viol, self.ctg_batch_bus_pow_balance_imag_viol))
+
+    def compute_ctg_batch_detail(self):
+
+        self.ctg_batch_max_bus_volt_mag_max_viol = extra_max_rows(self.bus_i, self.ctg_batch_bus_volt_mag_max_viol)
+        self.ctg_batch_max_bus_volt_mag_min_viol = extra_max_rows(self.bus_i, self.ctg_batch_bus_volt_mag_min_viol)
+        self.ctg_batch_max_bus_swsh_adm_imag_max_viol = extra_max_rows(self.bus_i, self.ctg_batch_bus_swsh_adm_imag_max_viol)
+        self.ctg_batch_max_bus_swsh_adm_imag_min_viol = extra_max_rows(self.bus_i, self.ctg_batch_bus_swsh_adm_imag_min_viol)
+        self.ctg_batch_max_bus_pow_balance_real_viol = extra_max_rows(self.bus_i, self.ctg_batch_bus_pow_balance_real_viol)
+        self.ctg_batch_max_bus_pow_balance_imag_viol = extra_max_rows(self.bus_i, self.ctg_batch_bus_pow_balance_imag_viol)
+        self.ctg_batch_max_gen_pow_imag_max_viol = extra_max_rows(self.gen_key, self.ctg_batch_gen_pow_imag_max_viol)
+        self.ctg_batch_max_gen_pow_imag_min_viol = extra_max_rows(self.gen_key, self.ctg_batch_gen_pow_imag_min_viol)
+        self.ctg_batch_max_gen_pvpq1_viol = extra_max_rows(self.gen_key, self.ctg_batch_gen_pvpq1_viol)
+        self.ctg_batch_max_gen_pvpq2_viol = extra_max_rows(self.gen_key, self.ctg_batch_gen_pvpq2_viol)
+        self.ctg_batch_max_line_curr_orig_mag_max_viol = extra_max_rows(self.line_key, self.ctg_batch_line_curr_orig_mag_max_viol)
+        self.ctg_batch_max_line_curr_dest_mag_max_viol = extra_max_rows(self.line_key, self.ctg_batch_line_curr_dest_mag_max_viol)
+        self.ctg_batch_max_xfmr_pow_orig_mag_max_viol = extra_max_rows(self.xfmr_key, self.ctg_batch_xfmr_pow_orig_mag_max_viol)
+        self.ctg_batch_max_xfmr_pow_dest_mag_max_viol = extra_max_rows(self.xfmr_key, self.ctg_batch_xfmr_pow_dest_mag_max_viol)
+        if detail_top_k > 0:
+            self.compute_ctg_batch_top_k()
+
+    def compute_ctg_batch_top_k(self):
+        '''as compute_ctg_top_k, for each ctg of the batch.
+        ctg_batch_top_k_rows is a list of the top k file rows of each ctg'''
+
+        k = detail_top_k
+        top_k = [
+            ('vmax', extra_top_k_rows(self.bus_i, self.ctg_batch_bus_volt_mag_max_viol, k)),
+            ('vmin', extra_top_k_rows(self.bus_i, self.ctg_batch_bus_volt_mag_min_viol, k)),
+            ('bmax', extra_top_k_rows(self.bus_i, self.ctg_batch_bus_swsh_adm_imag_max_viol, k)),
+            ('bmin', extra_top_k_rows(self.bus_i, self.ctg_batch_bus_swsh_adm_imag_min_viol, k)),
+            ('pbal', extra_top_k_rows(self.bus_i, self.ctg_batch_bus_pow_balance_real_viol, k)),
+            ('qbal', extra_top_k_rows(self.bus_i, self.ctg_batch_bus_pow_balance_imag_viol, k)),
+            ('qgmax', extra_top_k_rows(self.gen_key, self.ctg_batch_gen_pow_imag_max_viol, k)),
+            ('qgmin', extra_top_k_rows(self.gen_key, self.ctg_batch_gen_pow_imag_min_viol, k)),
+            ('qvg1', extra_top_k_rows(self.gen_key, self.ctg_batch_gen_pvpq1_viol, k)),
+            ('qvg2', extra_top_k_rows(self.gen_key, self.ctg_batch_gen_pvpq2_viol, k)),
+            ('lineomax', extra_top_k_rows(self.line_key, self.ctg_batch_line_curr_orig_mag_max_viol, k)),
+            ('linedmax', extra_top_k_rows(self.line_key, self.ctg_batch_line_curr_dest_mag_max_viol, k)),
+            ('xfmromax', extra_top_k_rows(self.xfmr_key, self.ctg_batch_xfmr_pow_orig_mag_max_viol, k)),
+            ('xfmrdmax', extra_top_k_rows(self.xfmr_key, self.ctg_batch_xfmr_pow_dest_mag_max_viol, k))]
+        self.ctg_batch_top_k_rows = [
+            get_top_k_rows(self.ctg_label[c], [(category, top[r]) for (category, top) in top_k])
+            for (r, c) in enumerate(self.ctg_batch)]
+
+    def set_ctg_batch_detail(self, k):
+        '''set the per ctg results, as from compute_ctg_detail and eval_ctg_penalty,
+        to those of ctg k of the batch'''
+
+        self.ctg_current = self.ctg_batch[k]
+        self.ctg_penalty = self.ctg_batch_penalty[k]
+        self.ctg_max_bus_volt_mag_max_viol = self.ctg_batch_max_bus_volt_mag_max_viol[k]
+        self.ctg_max_bus_volt_mag_min_viol = self.ctg_batch_max_bus_volt_mag_min_viol[k]
+        self.ctg_max_bus_swsh_adm_imag_max_viol = self.ctg_batch_max_bus_swsh_adm_imag_max_viol[k]
+        self.ctg_max_bus_swsh_adm_imag_min_viol = self.ctg_batch_max_bus_swsh_adm_imag_min_viol[k]
+        self.ctg_max_bus_pow_balance_real_viol = self.ctg_batch_max_bus_pow_balance_real_viol[k]
+        self.ctg_max_bus_pow_balance_imag_viol = self.ctg_batch_max_bus_pow_balance_imag_viol[k]
+        self.ctg_max_gen_pow_imag_max_viol = self.ctg_batch_max_gen_pow_imag_max_viol[k]
+        self.ctg_max_gen_pow_imag_min_viol = self.ctg_batch_max_gen_pow_imag_min_viol[k]
+        self.ctg_max_gen_pvpq1_viol = self.ctg_batch_max_gen_pvpq1_viol[k]
+        self.ctg_max_gen_pvpq2_viol = self.ctg_batch_max_gen_pvpq2_viol[k]
+        self.ctg_max_line_curr_orig_mag_max_viol = self.ctg_batch_max_line_curr_orig_mag_max_viol[k]
+        self.ctg_max_line_curr_dest_mag_max_viol = self.ctg_batch_max_line_curr_dest_mag_max_viol[k]
+        self.ctg_max_xfmr_pow_orig_mag_max_viol = self.ctg_batch_max_xfmr_pow_orig_mag_max_viol[k]
+        self.ctg_max_xfmr_pow_dest_mag_max_viol = self.ctg_batch_max_xfmr_pow_dest_mag_max_viol[k]
     
     def eval_cost(self):
         # Let [pcmin, pcmax] denote the domain of definition of the cost function
@@ -1393,42 +2351,7 @@ class Evaluation:
         # need a separate module for data checking independent of solution evaluation
 
         start_time = time.time()
-        self.gen_cost = np.zeros(self.num_gen)
-
-        for k in range(self.num_gen):
-            num_pl = self.gen_num_pl[k]
-            pl_x = self.gen_pl_x[k]
-            pl_y = self.gen_pl_y[k]
-            #print([num_pl, pl_x, pl_y])
-            if self.gen_status[k] == 0.0:
-                continue
-            #if self.gen_pow_real[k] < pl_x[0]: # do not check these
-            #    continue
-            #if self.gen_pow_real[k] > pl_x[num_pl - 1]:
-            #    continue
-            y_value = 0.0
-            slope = 0.0
-            x_change = 0.0
-            done = False
-            for i in range(num_pl - 1): # i = 0 covers first secant and extension to left
-                if self.gen_pow_real[k] <= pl_x[i + 1]:
-                    y_value = pl_y[i]
-                    slope = (pl_y[i + 1] - pl_y[i]) / (pl_x[i + 1] - pl_x[i])
-                    x_change = self.gen_pow_real[k] - pl_x[i]
-                    #if pl_x[i + 1] > pl_x[i]: # do not check this here. need an external data checker to ensure pl_x points are strictly increasing
-                    #    slope = (pl_y[i + 1] - pl_y[i]) / (pl_x[i + 1] - pl_x[i])
-                    #    x_change = self.gen_pow_real[k] - pl_x[i]
-                    done = True
-                    break
-            if not done:
-                #print([self.gen_i[k], self.gen_id[k], self.gen_num_pl[k], self.gen_pl_x[k], self.gen_pl_y[k], self.gen_pow_real[k]])
-                assert (self.gen_pow_real[k] > pl_x[num_pl - 1]) # need to extend last secant to right
-                i = num_pl - 2 # num_pl >= 2 (need at least 2 points for a secant)
-                y_value = pl_y[i]
-                slope = (pl_y[i + 1] - pl_y[i]) / (pl_x[i + 1] - pl_x[i])
-                x_change = self.gen_pow_real[k] - pl_x[i]
-            self.gen_cost[k] = y_value + slope * x_change
-                
+        self.gen_cost = self.compute_gen_cost(self.gen_pow_real)
 
         '''
         self.gen_cost = {
@@ -1464,6 +2387,22 @@ class Evaluation:
         print('eval cost time: %f' % (end_time - start_time))
 
 
+    def compute_gen_cost(self, gen_pow_real):
+        '''gen cost from the packed cost tables, see set_data_gen_cost_tables.
+        gen_pow_real has gens on the last axis, e.g. (num gen,) or
+        (num candidate dispatches, num gen), and the result has the same shape.
+        takes the first segment with p <= x_end, i.e. the segment containing p,
+        rather than the max over the affine pieces, so the cost matches
+        the curve even where the convexity check above fails.
+        out of service gens get 0 cost'''
+
+        seg = np.argmax(np.expand_dims(gen_pow_real, -1) <= self.gen_pl_seg_x_end, axis=-1)
+        gen = np.arange(self.num_gen)
+        cost = (
+            self.gen_pl_seg_y[gen, seg] +
+            self.gen_pl_seg_slope[gen, seg] * (gen_pow_real - self.gen_pl_seg_x[gen, seg]))
+        return np.where(self.gen_status != 0.0, cost, 0.0)
+
     def eval_bus_volt_viol(self):
 
         self.bus_volt_mag_min_viol = np.maximum(0.0, self.bus_volt_mag_min - self.bus_volt_mag)
@@ -1486,7 +2425,7 @@ class Evaluation:
         self.gen_pow_imag_min_viol = np.maximum(0.0, self.gen_pow_imag_min - self.gen_pow_imag)
         self.gen_pow_imag_max_viol = np.maximum(0.0, self.gen_pow_imag - self.gen_pow_imag_max)
 
-    def eval_line_pow(self):
+    def eval_branch_pow(self):
 
         '''
         if debug:
@@ -1505,93 +2444,157 @@ class Evaluation:
         '''
 
         start_time = time.time()
-        self.line_orig_volt_mag = self.bus_volt_mag[self.line_orig_bus]
-        self.line_dest_volt_mag = self.bus_volt_mag[self.line_dest_bus]
-        self.line_volt_ang_diff = self.bus_volt_ang[self.line_orig_bus] - self.bus_volt_ang[self.line_dest_bus]
-        self.line_cos_volt_ang_diff = np.cos(self.line_volt_ang_diff)
-        self.line_sin_volt_ang_diff = np.sin(self.line_volt_ang_diff)
-        self.line_orig_dest_volt_mag_prod = self.line_orig_volt_mag * self.line_dest_volt_mag
-        self.line_orig_volt_mag_sq = self.line_orig_volt_mag ** 2.0
-        self.line_dest_volt_mag_sq = self.line_dest_volt_mag ** 2.0
-        # TODO some further factorization can be done, potentially giving more speedup
-        self.line_pow_orig_real = ( # line_status not needed as we have already done it on the parameter level
-            self.line_adm_real * self.line_orig_volt_mag_sq + # ** 2.0 +
-            ( - self.line_adm_real * self.line_cos_volt_ang_diff
-              - self.line_adm_imag * self.line_sin_volt_ang_diff) *
-            self.line_orig_dest_volt_mag_prod)
-        self.line_pow_orig_imag = (
-            - self.line_adm_total_imag * self.line_orig_volt_mag_sq + # ** 2.0 +
-            (   self.line_adm_imag * self.line_cos_volt_ang_diff
-              - self.line_adm_real * self.line_sin_volt_ang_diff) *
-            self.line_orig_dest_volt_mag_prod)
-        self.line_pow_dest_real = (
-            self.line_adm_real * self.line_dest_volt_mag_sq + # ** 2.0 +
-            ( - self.line_adm_real * self.line_cos_volt_ang_diff
-              + self.line_adm_imag * self.line_sin_volt_ang_diff) *
-            self.line_orig_dest_volt_mag_prod)
-        self.line_pow_dest_imag = (
-            - self.line_adm_total_imag * self.line_dest_volt_mag_sq + # ** 2.0 +
-            (   self.line_adm_imag * self.line_cos_volt_ang_diff
-              + self.line_adm_real * self.line_sin_volt_ang_diff) *
-            self.line_orig_dest_volt_mag_prod)
-        end_time = time.time()
-        print('eval line pow time: %f' % (end_time - start_time))
-
-    def eval_line_curr_viol(self):
-
-        self.line_curr_orig_mag_max_viol = np.maximum(
-            0.0,
-            (self.line_pow_orig_real**2.0 + self.line_pow_orig_imag**2.0)**0.5 -
-            self.line_curr_mag_max * self.line_orig_volt_mag)
-        self.line_curr_dest_mag_max_viol = np.maximum(
-            0.0,
-            (self.line_pow_dest_real**2.0 + self.line_pow_dest_imag**2.0)**0.5 -
-            self.line_curr_mag_max * self.line_dest_volt_mag)
-
-    def eval_xfmr_pow(self):
-
-        start_time = time.time()
-        self.xfmr_orig_volt_mag = self.bus_volt_mag[self.xfmr_orig_bus]
-        self.xfmr_dest_volt_mag = self.bus_volt_mag[self.xfmr_dest_bus]
-        self.xfmr_volt_ang_diff = self.bus_volt_ang[self.xfmr_orig_bus] - self.bus_volt_ang[self.xfmr_dest_bus] - self.xfmr_tap_ang
-        self.xfmr_cos_volt_ang_diff = np.cos(self.xfmr_volt_ang_diff)
-        self.xfmr_sin_volt_ang_diff = np.sin(self.xfmr_volt_ang_diff)
-        self.xfmr_orig_dest_volt_mag_prod = self.xfmr_orig_volt_mag * self.xfmr_dest_volt_mag
-        self.xfmr_orig_volt_mag_sq = self.xfmr_orig_volt_mag ** 2.0
-        self.xfmr_dest_volt_mag_sq = self.xfmr_dest_volt_mag ** 2.0
-        self.xfmr_pow_orig_real = (
-            (self.xfmr_adm_real / self.xfmr_tap_mag**2.0 + self.xfmr_adm_mag_real) * self.xfmr_orig_volt_mag_sq +
-            ( - self.xfmr_adm_real / self.xfmr_tap_mag * self.xfmr_cos_volt_ang_diff
-              - self.xfmr_adm_imag / self.xfmr_tap_mag * self.xfmr_sin_volt_ang_diff) *
-                self.xfmr_orig_volt_mag * self.xfmr_dest_volt_mag)
-        self.xfmr_pow_orig_imag = (
-            - (self.xfmr_adm_imag / self.xfmr_tap_mag**2.0 + self.xfmr_adm_mag_imag) * self.xfmr_orig_volt_mag_sq +
-            (   self.xfmr_adm_imag / self.xfmr_tap_mag * self.xfmr_cos_volt_ang_diff
-              - self.xfmr_adm_real / self.xfmr_tap_mag * self.xfmr_sin_volt_ang_diff) *
-                self.xfmr_orig_volt_mag * self.xfmr_dest_volt_mag)
-        self.xfmr_pow_dest_real = (
-            self.xfmr_adm_real * self.xfmr_dest_volt_mag_sq +
-            ( - self.xfmr_adm_real / self.xfmr_tap_mag * self.xfmr_cos_volt_ang_diff
-              + self.xfmr_adm_imag / self.xfmr_tap_mag * self.xfmr_sin_volt_ang_diff) *
-                self.xfmr_orig_volt_mag * self.xfmr_dest_volt_mag)
-        self.xfmr_pow_dest_imag = (
-            - self.xfmr_adm_imag * self.xfmr_dest_volt_mag_sq +
-            (   self.xfmr_adm_imag / self.xfmr_tap_mag * self.xfmr_cos_volt_ang_diff
-              + self.xfmr_adm_real / self.xfmr_tap_mag * self.xfmr_sin_volt_ang_diff) *
-                self.xfmr_orig_volt_mag * self.xfmr_dest_volt_mag)
+        if ybus_engine:
+            self.bus_volt = self.bus_volt_mag * np.exp(1j * self.bus_volt_ang)
+            branch_pow = self.compute_branch_pow_ybus(self.bus_volt_mag, self.bus_volt)
+        else:
+            branch_pow = self.compute_branch_pow(self.bus_volt_mag, self.bus_volt_ang)
+        (self.branch_orig_volt_mag,
+         self.branch_dest_volt_mag,
+         self.branch_pow_orig_real,
+         self.branch_pow_orig_imag,
+         self.branch_pow_dest_real,
+         self.branch_pow_dest_imag) = branch_pow
         end_time = time.time()
-        print('eval xfmr pow time: %f' % (end_time - start_time))
-
-    def eval_xfmr_pow_viol(self):
-
-        self.xfmr_pow_orig_mag_max_viol = np.maximum(
-            0.0,
-            (self.xfmr_pow_orig_real**2.0 + self.xfmr_pow_orig_imag**2.0)**0.5 -
-            self.xfmr_pow_mag_max)
-        self.xfmr_pow_dest_mag_max_viol = np.maximum(
-            0.0,
-            (self.xfmr_pow_dest_real**2.0 + self.xfmr_pow_dest_imag**2.0)**0.5 -
-            self.xfmr_pow_mag_max)
+        print('eval branch pow time: %f' % (end_time - start_time))
+
+    def eval_branch_flow_viol(self):
+
+        (self.branch_flow_orig_mag_max_viol,
+         self.branch_flow_dest_mag_max_viol) = self.compute_branch_flow_viol(
+            self.branch_pow_orig_real,
+            self.branch_pow_orig_imag,
+            self.branch_pow_dest_real,
+            self.branch_pow_dest_imag,
+            self.branch_orig_volt_mag,
+            self.branch_dest_volt_mag,
+            self.branch_flow_mag_max)
+        self.line_curr_orig_mag_max_viol = self.branch_flow_orig_mag_max_viol[self.branch_line]
+        self.line_curr_dest_mag_max_viol = self.branch_flow_dest_mag_max_viol[self.branch_line]
+        self.xfmr_pow_orig_mag_max_viol = self.branch_flow_orig_mag_max_viol[self.branch_xfmr]
+        self.xfmr_pow_dest_mag_max_viol = self.branch_flow_dest_mag_max_viol[self.branch_xfmr]
+
+    def compute_branch_pow(self, bus_volt_mag, bus_volt_ang, work=None):
+        '''branch flow kernel, for lines and xfmrs alike, see set_data_branch_params.
+        bus_volt_mag, bus_volt_ang have buses on the last axis, e.g. (num bus) or
+        (num ctg in batch, num bus), and the results have branches on the last axis.
+        work: a CtgWorkspace of the same shape, for the results and intermediate values,
+        or None to allocate one.
+        returns (orig volt mag, dest volt mag, pow orig real, pow orig imag, pow dest real, pow dest imag)'''
+
+        if work is None:
+            work = CtgWorkspace(0, 0, self.num_branch, (bus_volt_mag.shape[0] if bus_volt_mag.ndim > 1 else None))
+        orig_volt_mag = np.take(bus_volt_mag, self.branch_orig_bus, axis=-1, out=work.branch_orig_volt_mag)
+        dest_volt_mag = np.take(bus_volt_mag, self.branch_dest_bus, axis=-1, out=work.branch_dest_volt_mag)
+        volt_ang_diff = np.take(bus_volt_ang, self.branch_orig_bus, axis=-1, out=work.branch_volt_ang_diff)
+        volt_ang_diff -= np.take(bus_volt_ang, self.branch_dest_bus, axis=-1, out=work.branch_cos_volt_ang_diff)
+        volt_ang_diff -= self.branch_tap_ang
+        cos_volt_ang_diff = np.cos(volt_ang_diff, out=work.branch_cos_volt_ang_diff)
+        sin_volt_ang_diff = np.sin(volt_ang_diff, out=work.branch_sin_volt_ang_diff)
+        orig_dest_volt_mag_prod = np.multiply(orig_volt_mag, dest_volt_mag, out=work.branch_orig_dest_volt_mag_prod)
+        # the 4 products with the cross coefficients are shared by both ends
+        real_cos = np.multiply(self.branch_coeff_cross_real, cos_volt_ang_diff, out=work.branch_real_cos)
+        real_sin = np.multiply(self.branch_coeff_cross_real, sin_volt_ang_diff, out=work.branch_real_sin)
+        imag_cos = np.multiply(self.branch_coeff_cross_imag, cos_volt_ang_diff, out=work.branch_imag_cos)
+        imag_sin = np.multiply(self.branch_coeff_cross_imag, sin_volt_ang_diff, out=work.branch_imag_sin)
+        # volt_ang_diff is no longer needed, and is reused for the squared volt mags
+        volt_mag_sq = volt_ang_diff
+        cross = work.branch_cos_volt_ang_diff
+        np.square(orig_volt_mag, out=volt_mag_sq)
+        pow_orig_real = np.multiply(self.branch_coeff_orig_sq_real, volt_mag_sq, out=work.branch_pow_orig_real)
+        pow_orig_real += np.multiply(np.add(real_cos, imag_sin, out=cross), orig_dest_volt_mag_prod, out=cross)
+        pow_orig_imag = np.multiply(self.branch_coeff_orig_sq_imag, volt_mag_sq, out=work.branch_pow_orig_imag)
+        pow_orig_imag += np.multiply(np.subtract(real_sin, imag_cos, out=cross), orig_dest_volt_mag_prod, out=cross)
+        np.square(dest_volt_mag, out=volt_mag_sq)
+        pow_dest_real = np.multiply(self.branch_coeff_dest_sq_real, volt_mag_sq, out=work.branch_pow_dest_real)
+        pow_dest_real += np.multiply(np.subtract(real_cos, imag_sin, out=cross), orig_dest_volt_mag_prod, out=cross)
+        pow_dest_imag = np.multiply(self.branch_coeff_dest_sq_imag, volt_mag_sq, out=work.branch_pow_dest_imag)
+        pow_dest_imag -= np.multiply(np.add(real_sin, imag_cos, out=cross), orig_dest_volt_mag_prod, out=cross)
+        return (orig_volt_mag, dest_volt_mag, pow_orig_real, pow_orig_imag, pow_dest_real, pow_dest_imag)
+
+    def compute_branch_flow_viol(
+            self, pow_orig_real, pow_orig_imag, pow_dest_real, pow_dest_imag,
+            orig_volt_mag, dest_volt_mag, flow_mag_max, work=None):
+        '''branch flow limit kernel. the limit is flow_mag_max * volt mag
+        on a branch with a current limit, and flow_mag_max otherwise.
+        work: as in compute_branch_pow.
+        returns (orig viol, dest viol)'''
+
+        if work is None:
+            work = CtgWorkspace(0, 0, self.num_branch, (pow_orig_real.shape[0] if pow_orig_real.ndim > 1 else None))
+        (flow_mag, flow_limit) = work.branch_work
+
+        def viol(pow_real, pow_imag, volt_mag, out):
+            np.square(pow_real, out=flow_mag)
+            np.add(flow_mag, np.square(pow_imag, out=out), out=flow_mag)
+            np.sqrt(flow_mag, out=flow_mag)
+            flow_limit.fill(1.0)
+            np.copyto(flow_limit, volt_mag, where=self.branch_limit_curr)
+            np.multiply(flow_mag_max, flow_limit, out=flow_limit)
+            np.subtract(flow_mag, flow_limit, out=out)
+            return np.maximum(0.0, out, out=out)
+
+        orig_viol = viol(pow_orig_real, pow_orig_imag, orig_volt_mag, work.branch_flow_orig_mag_max_viol)
+        dest_viol = viol(pow_dest_real, pow_dest_imag, dest_volt_mag, work.branch_flow_dest_mag_max_viol)
+        return (orig_viol, dest_viol)
+
+    def compute_bus_pow_balance(
+            self, gen_pow_real, gen_pow_imag, bus_load_pow_real, bus_load_pow_imag,
+            bus_fxsh_pow_real, bus_fxsh_pow_imag, bus_swsh_pow_imag,
+            branch_pow_orig_real, branch_pow_orig_imag, branch_pow_dest_real, branch_pow_dest_imag, inj=None):
+        '''bus power balance residuals, real and imag, from one product of
+        bus_pow_balance_matrix with the stacked injections as a 2 column right hand side,
+        or 2 x num ctg in batch columns, for arrays with ctgs on the first axis.
+        inj: None, or an array for the stacked injections, e.g. CtgWorkspace.bus_pow_balance_inj.
+        returns (real residual, imag residual)'''
+
+        if inj is None:
+            inj = np.zeros(shape=((self.num_pow_balance_inj, 2) + gen_pow_real.shape[:-1]))
+        for (k, x) in [
+                (self.pow_balance_gen, (gen_pow_real, gen_pow_imag)),
+                (self.pow_balance_load, (bus_load_pow_real, bus_load_pow_imag)),
+                (self.pow_balance_fxsh, (bus_fxsh_pow_real, bus_fxsh_pow_imag)),
+                (self.pow_balance_swsh, (0.0, bus_swsh_pow_imag)),
+                (self.pow_balance_branch_orig, (branch_pow_orig_real, branch_pow_orig_imag)),
+                (self.pow_balance_branch_dest, (branch_pow_dest_real, branch_pow_dest_imag))]:
+            inj[k, 0] = np.transpose(x[0])
+            inj[k, 1] = np.transpose(x[1])
+        resid = self.bus_pow_balance_matrix.dot(inj.reshape(self.num_pow_balance_inj, -1)).reshape(
+            (self.num_bus,) + inj.shape[1:])
+        return (np.transpose(resid[:, 0]), np.transpose(resid[:, 1]))
+
+    def compute_branch_pow_ybus(self, bus_volt_mag, bus_volt):
+        '''as compute_branch_pow, from the complex bus voltages bus_volt,
+        with the branch currents from the branch admittances of set_data_ybus_params'''
+
+        orig_volt = bus_volt[..., self.branch_orig_bus]
+        dest_volt = bus_volt[..., self.branch_dest_bus]
+        pow_orig = orig_volt * np.conj(self.branch_adm_orig_orig * orig_volt + self.branch_adm_orig_dest * dest_volt)
+        pow_dest = dest_volt * np.conj(self.branch_adm_dest_orig * orig_volt + self.branch_adm_dest_dest * dest_volt)
+        return (
+            bus_volt_mag[..., self.branch_orig_bus], bus_volt_mag[..., self.branch_dest_bus],
+            pow_orig.real, pow_orig.imag, pow_dest.real, pow_dest.imag)
+
+    def compute_bus_pow_inj_ybus(self, bus_volt, branches_out=None):
+        '''bus power injections into the branches and fixed shunts, V * conj(Ybus V).
+        bus_volt has buses on the last axis, e.g. (num bus) or (num ctg in batch, num bus).
+        branches_out is None, or an index tuple of the branches out of service, e.g.
+        (branches,) from csr_row or (k, branches) from csr_rows. the currents of these
+        branches are subtracted from Ybus V, a correction of rank at most 2 * num branches out,
+        rather than building Ybus again'''
+
+        bus_curr = self.ybus.dot(bus_volt.T).T
+        if branches_out is not None:
+            branches = branches_out[-1]
+            orig = branches_out[:-1] + (self.branch_orig_bus[branches],)
+            dest = branches_out[:-1] + (self.branch_dest_bus[branches],)
+            np.subtract.at(
+                bus_curr, orig,
+                self.branch_adm_orig_orig[branches] * bus_volt[orig] + self.branch_adm_orig_dest[branches] * bus_volt[dest])
+            np.subtract.at(
+                bus_curr, dest,
+                self.branch_adm_dest_orig[branches] * bus_volt[orig] + self.branch_adm_dest_dest[branches] * bus_volt[dest])
+        return bus_volt * np.conj(bus_curr)
 
     def eval_bus_swsh_adm_imag_viol(self):
 
@@ -1635,30 +2638,44 @@ class Evaluation:
             print("xfmrs dest: %s" % str([(k, self.xfmr_status[k], self.xfmr_pow_dest_real[k]) for k in self.bus_xfmr_dest[i]]))
 
         start_time = time.time()
+        if ybus_engine:
+            self.eval_bus_pow_balance_ybus()
+            end_time = time.time()
+            print('eval bus pow balance time: %f' % (end_time - start_time))
+            return
+        (resid_real, resid_imag) = self.compute_bus_pow_balance(
+            self.gen_pow_real, self.gen_pow_imag,
+            self.bus_load_pow_real, self.bus_load_pow_imag,
+            self.bus_fxsh_pow_real, self.bus_fxsh_pow_imag, self.bus_swsh_pow_imag,
+            self.branch_pow_orig_real, self.branch_pow_orig_imag,
+            self.branch_pow_dest_real, self.branch_pow_dest_imag)
+        self.bus_pow_balance_real_viol = np.abs(resid_real)
+        self.bus_pow_balance_imag_viol = np.abs(resid_imag)
+        end_time = time.time()
+        print('eval bus pow balance time: %f' % (end_time - start_time))
+
+    def eval_bus_pow_balance_ybus(self):
+        '''as eval_bus_pow_balance, with ybus_engine.
+        the fixed shunts are in Ybus'''
+
+        bus_pow_inj = self.compute_bus_pow_inj_ybus(self.bus_volt)
         self.bus_pow_balance_real_viol = np.abs(
             self.bus_gen_matrix.dot(self.gen_pow_real) -
             self.bus_load_pow_real -
-            self.bus_fxsh_pow_real -
-            self.bus_line_orig_matrix.dot(self.line_pow_orig_real) -
-            self.bus_line_dest_matrix.dot(self.line_pow_dest_real) -
-            self.bus_xfmr_orig_matrix.dot(self.xfmr_pow_orig_real) -
-            self.bus_xfmr_dest_matrix.dot(self.xfmr_pow_dest_real))
+            bus_pow_inj.real)
         self.bus_pow_balance_imag_viol = np.abs(
             self.bus_gen_matrix.dot(self.gen_pow_imag) -
             self.bus_load_pow_imag -
-            self.bus_fxsh_pow_imag -
             self.bus_swsh_pow_imag -
-            self.bus_line_orig_matrix.dot(self.line_pow_orig_imag) -
-            self.bus_line_dest_matrix.dot(self.line_pow_dest_imag) -
-            self.bus_xfmr_orig_matrix.dot(self.xfmr_pow_orig_imag) -
-            self.bus_xfmr_dest_matrix.dot(self.xfmr_pow_dest_imag))
-        end_time = time.time()
-        print('eval bus pow balance time: %f' % (end_time - start_time))
+            bus_pow_inj.imag)
 
     def eval_ctg_bus_volt_viol(self):
 
-        self.ctg_bus_volt_mag_min_viol = np.maximum(0.0, self.ctg_bus_volt_mag_min - self.ctg_bus_volt_mag)
-        self.ctg_bus_volt_mag_max_viol = np.maximum(0.0, self.ctg_bus_volt_mag - self.ctg_bus_volt_mag_max)
+        work = self.ctg_workspace
+        self.ctg_bus_volt_mag_min_viol = np.subtract(self.ctg_bus_volt_mag_min, self.ctg_bus_volt_mag, out=work.bus_volt_mag_min_viol)
+        np.maximum(0.0, self.ctg_bus_volt_mag_min_viol, out=self.ctg_bus_volt_mag_min_viol)
+        self.ctg_bus_volt_mag_max_viol = np.subtract(self.ctg_bus_volt_mag, self.ctg_bus_volt_mag_max, out=work.bus_volt_mag_max_viol)
+        np.maximum(0.0, self.ctg_bus_volt_mag_max_viol, out=self.ctg_bus_volt_mag_max_viol)
 
     def eval_ctg_load_pow(self):
 
@@ -1667,8 +2684,11 @@ class Evaluation:
 
     def eval_ctg_fxsh_pow(self):
 
-        self.ctg_bus_fxsh_pow_real = self.bus_fxsh_adm_real * (self.ctg_bus_volt_mag ** 2.0)
-        self.ctg_bus_fxsh_pow_imag = - self.bus_fxsh_adm_imag * (self.ctg_bus_volt_mag ** 2.0)
+        work = self.ctg_workspace
+        self.ctg_bus_volt_mag_sq = np.square(self.ctg_bus_volt_mag, out=work.bus_volt_mag_sq)
+        self.ctg_bus_fxsh_pow_real = np.multiply(self.bus_fxsh_adm_real, self.ctg_bus_volt_mag_sq, out=work.bus_fxsh_pow_real)
+        self.ctg_bus_fxsh_pow_imag = np.multiply(self.bus_fxsh_adm_imag, self.ctg_bus_volt_mag_sq, out=work.bus_fxsh_pow_imag)
+        np.negative(self.ctg_bus_fxsh_pow_imag, out=self.ctg_bus_fxsh_pow_imag)
 
     def eval_ctg_gen_pow_real(self):
 
@@ -1696,7 +2716,7 @@ class Evaluation:
         ctg_label = 'G_000017SENECA33U1'
         gen_i = 17
         gen_id = '1'
-        gen = self.gen_map[(gen_i, gen_id)]
+        gen = self.gen_index.get([(gen_i, gen_id)])[0]
         if self.ctg_label[self.ctg_current] == ctg_label:
             debug = True
             print('ctg_label: %s' % self.ctg_label[self.ctg_current])
@@ -1706,7 +2726,7 @@ class Evaluation:
             print('gen out of service:')
             print(self.gen_out_of_service)
             print('ctg gens out:')
-            print(self.ctg_gens_out[self.ctg_current])
+            print(csr_row(self.ctg_gens_out_indptr, self.ctg_gens_out_indices, self.ctg_current))
             print('ctg gen out of service:')
             print(self.ctg_gen_out_of_service)
             #gens_out_of_service = set(self.gen_out_of_service) | set(self.ctg_gens_out[self.ctg_current])
@@ -1714,13 +2734,12 @@ class Evaluation:
 
         # new method - not a significant time cost
         start_time = time.time()
-        self.ctg_gen_pow_real = np.maximum(
-            self.gen_pow_real_min,
-            np.minimum(
-                self.gen_pow_real_max,
-                self.gen_pow_real + self.gen_part_fact * self.ctg_pow_real_change))
-        self.ctg_gen_pow_real[self.ctg_gen_not_participating] = self.gen_pow_real[self.ctg_gen_not_participating]
-        self.ctg_gen_pow_real[self.ctg_gen_out_of_service] = 0.0
+        self.ctg_gen_pow_real = np.multiply(self.gen_part_fact, self.ctg_pow_real_change, out=self.ctg_workspace.gen_pow_real)
+        np.add(self.gen_pow_real, self.ctg_gen_pow_real, out=self.ctg_gen_pow_real)
+        np.minimum(self.gen_pow_real_max, self.ctg_gen_pow_real, out=self.ctg_gen_pow_real)
+        np.maximum(self.gen_pow_real_min, self.ctg_gen_pow_real, out=self.ctg_gen_pow_real)
+        np.copyto(self.ctg_gen_pow_real, self.gen_pow_real, where=self.ctg_gen_not_participating_mask)
+        self.ctg_gen_pow_real[self.ctg_gen_out_of_service_mask] = 0.0
         end_time = time.time()
         #print('eval ctg gen pow real time: %f' % (end_time - start_time))
 
@@ -1756,112 +2775,148 @@ class Evaluation:
 
     def eval_ctg_gen_pow_imag_viol(self):
 
-        self.ctg_gen_pow_imag_min_viol = np.maximum(0.0, self.ctg_gen_pow_imag_min - self.ctg_gen_pow_imag)
-        self.ctg_gen_pow_imag_max_viol = np.maximum(0.0, self.ctg_gen_pow_imag - self.ctg_gen_pow_imag_max)
+        work = self.ctg_workspace
+        self.ctg_gen_pow_imag_min_viol = np.subtract(self.ctg_gen_pow_imag_min, self.ctg_gen_pow_imag, out=work.gen_pow_imag_min_viol)
+        np.maximum(0.0, self.ctg_gen_pow_imag_min_viol, out=self.ctg_gen_pow_imag_min_viol)
+        self.ctg_gen_pow_imag_max_viol = np.subtract(self.ctg_gen_pow_imag, self.ctg_gen_pow_imag_max, out=work.gen_pow_imag_max_viol)
+        np.maximum(0.0, self.ctg_gen_pow_imag_max_viol, out=self.ctg_gen_pow_imag_max_viol)
 
-    def eval_ctg_line_pow(self):
+    def eval_ctg_branch_pow(self):
         '''similar to base case.
-        then zero out lines that are out of service'''
-
-        self.ctg_line_orig_volt_mag = self.ctg_bus_volt_mag[self.line_orig_bus]
-        self.ctg_line_dest_volt_mag = self.ctg_bus_volt_mag[self.line_dest_bus]
-        self.ctg_line_volt_ang_diff = self.ctg_bus_volt_ang[self.line_orig_bus] - self.ctg_bus_volt_ang[self.line_dest_bus]
-        self.ctg_line_cos_volt_ang_diff = np.cos(self.ctg_line_volt_ang_diff)
-        self.ctg_line_sin_volt_ang_diff = np.sin(self.ctg_line_volt_ang_diff)
-        self.ctg_line_orig_dest_volt_mag_prod = self.ctg_line_orig_volt_mag * self.ctg_line_dest_volt_mag
-        self.ctg_line_orig_volt_mag_sq = self.ctg_line_orig_volt_mag ** 2.0
-        self.ctg_line_dest_volt_mag_sq = self.ctg_line_dest_volt_mag ** 2.0
-        # TODO some further factorization can be done, potentially giving more speedup
-        self.ctg_line_pow_orig_real = (
-            self.line_adm_real * self.ctg_line_orig_volt_mag_sq + # ** 2.0 +
-            ( - self.line_adm_real * self.ctg_line_cos_volt_ang_diff
-              - self.line_adm_imag * self.ctg_line_sin_volt_ang_diff) *
-            self.ctg_line_orig_dest_volt_mag_prod)
-        self.ctg_line_pow_orig_imag = (
-            - self.line_adm_total_imag * self.ctg_line_orig_volt_mag_sq + # ** 2.0 +
-            (   self.line_adm_imag * self.ctg_line_cos_volt_ang_diff
-              - self.line_adm_real * self.ctg_line_sin_volt_ang_diff) *
-            self.ctg_line_orig_dest_volt_mag_prod)
-        self.ctg_line_pow_dest_real = (
-            self.line_adm_real * self.ctg_line_dest_volt_mag_sq + # ** 2.0 +
-            ( - self.line_adm_real * self.ctg_line_cos_volt_ang_diff
-              + self.line_adm_imag * self.ctg_line_sin_volt_ang_diff) *
-            self.ctg_line_orig_dest_volt_mag_prod)
-        self.ctg_line_pow_dest_imag = (
-            - self.line_adm_total_imag * self.ctg_line_dest_volt_mag_sq + # ** 2.0 +
-            (   self.line_adm_imag * self.ctg_line_cos_volt_ang_diff
-              + self.line_adm_real * self.ctg_line_sin_volt_ang_diff) *
-            self.ctg_line_orig_dest_volt_mag_prod)
-        self.ctg_line_pow_orig_real[self.ctg_lines_out[self.ctg_current]] = 0.0
-        self.ctg_line_pow_orig_imag[self.ctg_lines_out[self.ctg_current]] = 0.0
-        self.ctg_line_pow_dest_real[self.ctg_lines_out[self.ctg_current]] = 0.0
-        self.ctg_line_pow_dest_imag[self.ctg_lines_out[self.ctg_current]] = 0.0
-
-    def eval_ctg_line_curr_viol(self):
-
-        self.ctg_line_curr_orig_mag_max_viol = np.maximum(
-            0.0,
-            (self.ctg_line_pow_orig_real**2.0 + self.ctg_line_pow_orig_imag**2.0)**0.5 -
-            self.ctg_line_curr_mag_max * self.ctg_line_orig_volt_mag)
-        self.ctg_line_curr_dest_mag_max_viol = np.maximum(
-            0.0,
-            (self.ctg_line_pow_dest_real**2.0 + self.ctg_line_pow_dest_imag**2.0)**0.5 -
-            self.ctg_line_curr_mag_max * self.ctg_line_dest_volt_mag)
-
-    def eval_ctg_xfmr_pow(self):
-
-        self.ctg_xfmr_orig_volt_mag = self.ctg_bus_volt_mag[self.xfmr_orig_bus]
-        self.ctg_xfmr_dest_volt_mag = self.ctg_bus_volt_mag[self.xfmr_dest_bus]
-        self.ctg_xfmr_volt_ang_diff = self.ctg_bus_volt_ang[self.xfmr_orig_bus] - self.ctg_bus_volt_ang[self.xfmr_dest_bus] - self.xfmr_tap_ang
-        self.ctg_xfmr_cos_volt_ang_diff = np.cos(self.ctg_xfmr_volt_ang_diff)
-        self.ctg_xfmr_sin_volt_ang_diff = np.sin(self.ctg_xfmr_volt_ang_diff)
-        self.ctg_xfmr_orig_dest_volt_mag_prod = self.ctg_xfmr_orig_volt_mag * self.ctg_xfmr_dest_volt_mag
-        self.ctg_xfmr_orig_volt_mag_sq = self.ctg_xfmr_orig_volt_mag ** 2.0
-        self.ctg_xfmr_dest_volt_mag_sq = self.ctg_xfmr_dest_volt_mag ** 2.0
-        self.ctg_xfmr_pow_orig_real = (
-            (self.xfmr_adm_real / self.xfmr_tap_mag**2.0 + self.xfmr_adm_mag_real) * self.ctg_xfmr_orig_volt_mag_sq +
-            ( - self.xfmr_adm_real / self.xfmr_tap_mag * self.ctg_xfmr_cos_volt_ang_diff
-              - self.xfmr_adm_imag / self.xfmr_tap_mag * self.ctg_xfmr_sin_volt_ang_diff) *
-                self.ctg_xfmr_orig_volt_mag * self.ctg_xfmr_dest_volt_mag)
-        self.ctg_xfmr_pow_orig_imag = (
-            - (self.xfmr_adm_imag / self.xfmr_tap_mag**2.0 + self.xfmr_adm_mag_imag) * self.ctg_xfmr_orig_volt_mag_sq +
-            (   self.xfmr_adm_imag / self.xfmr_tap_mag * self.ctg_xfmr_cos_volt_ang_diff
-              - self.xfmr_adm_real / self.xfmr_tap_mag * self.ctg_xfmr_sin_volt_ang_diff) *
-                self.ctg_xfmr_orig_volt_mag * self.ctg_xfmr_dest_volt_mag)
-        self.ctg_xfmr_pow_dest_real = (
-            self.xfmr_adm_real * self.ctg_xfmr_dest_volt_mag_sq +
-            ( - self.xfmr_adm_real / self.xfmr_tap_mag * self.ctg_xfmr_cos_volt_ang_diff
-              + self.xfmr_adm_imag / self.xfmr_tap_mag * self.ctg_xfmr_sin_volt_ang_diff) *
-                self.ctg_xfmr_orig_volt_mag * self.ctg_xfmr_dest_volt_mag)
-        self.ctg_xfmr_pow_dest_imag = (
-            - self.xfmr_adm_imag * self.ctg_xfmr_dest_volt_mag_sq +
-            (   self.xfmr_adm_imag / self.xfmr_tap_mag * self.ctg_xfmr_cos_volt_ang_diff
-              + self.xfmr_adm_real / self.xfmr_tap_mag * self.ctg_xfmr_sin_volt_ang_diff) *
-                self.ctg_xfmr_orig_volt_mag * self.ctg_xfmr_dest_volt_mag)
-        self.ctg_xfmr_pow_orig_real[self.ctg_xfmrs_out[self.ctg_current]] = 0.0
-        self.ctg_xfmr_pow_orig_imag[self.ctg_xfmrs_out[self.ctg_current]] = 0.0
-        self.ctg_xfmr_pow_dest_real[self.ctg_xfmrs_out[self.ctg_current]] = 0.0
-        self.ctg_xfmr_pow_dest_imag[self.ctg_xfmrs_out[self.ctg_current]] = 0.0
-
-    def eval_ctg_xfmr_pow_viol(self):
-
-        self.ctg_xfmr_pow_orig_mag_max_viol = np.maximum(
-            0.0,
-            (self.ctg_xfmr_pow_orig_real**2.0 + self.ctg_xfmr_pow_orig_imag**2.0)**0.5 -
-            self.ctg_xfmr_pow_mag_max)
-        self.ctg_xfmr_pow_dest_mag_max_viol = np.maximum(
-            0.0,
-            (self.ctg_xfmr_pow_dest_real**2.0 + self.ctg_xfmr_pow_dest_imag**2.0)**0.5 -
-            self.ctg_xfmr_pow_mag_max)
+        then zero out branches that are out of service'''
+
+        if ybus_engine:
+            self.ctg_bus_volt = self.ctg_bus_volt_mag * np.exp(1j * self.ctg_bus_volt_ang)
+            branch_pow = self.compute_branch_pow_ybus(self.ctg_bus_volt_mag, self.ctg_bus_volt)
+        else:
+            branch_pow = self.compute_branch_pow(self.ctg_bus_volt_mag, self.ctg_bus_volt_ang, self.ctg_workspace)
+        (self.ctg_branch_orig_volt_mag,
+         self.ctg_branch_dest_volt_mag,
+         self.ctg_branch_pow_orig_real,
+         self.ctg_branch_pow_orig_imag,
+         self.ctg_branch_pow_dest_real,
+         self.ctg_branch_pow_dest_imag) = branch_pow
+        branches_out = csr_row(self.ctg_branches_out_indptr, self.ctg_branches_out_indices, self.ctg_current)
+        self.ctg_branches_out = (branches_out,)
+        self.ctg_branch_pow_orig_real[branches_out] = 0.0
+        self.ctg_branch_pow_orig_imag[branches_out] = 0.0
+        self.ctg_branch_pow_dest_real[branches_out] = 0.0
+        self.ctg_branch_pow_dest_imag[branches_out] = 0.0
+
+    def eval_ctg_branch_kernel(self, kernel=None):
+        '''as eval_ctg_branch_pow and eval_ctg_branch_flow_viol, with ctg_branch_kernel,
+        also setting the bus sums of the branch flows for eval_ctg_bus_pow_balance.
+        kernel: the compiled kernel, or None for self.ctg_branch_kernel'''
+
+        if kernel is None:
+            kernel = self.ctg_branch_kernel
+        work = self.ctg_workspace
+        branches_out = csr_row(self.ctg_branches_out_indptr, self.ctg_branches_out_indices, self.ctg_current)
+        self.ctg_branches_out = (branches_out,)
+        work.branch_out[branches_out] = True
+        kernel(
+            self.ctg_bus_volt_mag, self.ctg_bus_volt_ang,
+            self.branch_orig_bus, self.branch_dest_bus, self.branch_tap_ang,
+            self.branch_coeff_orig_sq_real, self.branch_coeff_orig_sq_imag,
+            self.branch_coeff_dest_sq_real, self.branch_coeff_dest_sq_imag,
+            self.branch_coeff_cross_real, self.branch_coeff_cross_imag,
+            self.branch_limit_curr, self.ctg_branch_flow_mag_max, work.branch_out,
+            work.branch_orig_volt_mag, work.branch_dest_volt_mag,
+            work.branch_pow_orig_real, work.branch_pow_orig_imag,
+            work.branch_pow_dest_real, work.branch_pow_dest_imag,
+            work.branch_flow_orig_mag_max_viol, work.branch_flow_dest_mag_max_viol,
+            work.bus_branch_pow_real, work.bus_branch_pow_imag)
+        work.branch_out[branches_out] = False
+        self.ctg_branch_orig_volt_mag = work.branch_orig_volt_mag
+        self.ctg_branch_dest_volt_mag = work.branch_dest_volt_mag
+        self.ctg_branch_pow_orig_real = work.branch_pow_orig_real
+        self.ctg_branch_pow_orig_imag = work.branch_pow_orig_imag
+        self.ctg_branch_pow_dest_real = work.branch_pow_dest_real
+        self.ctg_branch_pow_dest_imag = work.branch_pow_dest_imag
+        self.ctg_branch_flow_orig_mag_max_viol = work.branch_flow_orig_mag_max_viol
+        self.ctg_branch_flow_dest_mag_max_viol = work.branch_flow_dest_mag_max_viol
+        self.ctg_line_curr_orig_mag_max_viol = self.ctg_branch_flow_orig_mag_max_viol[self.branch_line]
+        self.ctg_line_curr_dest_mag_max_viol = self.ctg_branch_flow_dest_mag_max_viol[self.branch_line]
+        self.ctg_xfmr_pow_orig_mag_max_viol = self.ctg_branch_flow_orig_mag_max_viol[self.branch_xfmr]
+        self.ctg_xfmr_pow_dest_mag_max_viol = self.ctg_branch_flow_dest_mag_max_viol[self.branch_xfmr]
+        self.ctg_bus_branch_pow_real = work.bus_branch_pow_real
+        self.ctg_bus_branch_pow_imag = work.bus_branch_pow_imag
+
+    def check_ctg_branch_kernel(self, tol=1e-10):
+        '''equivalence check of the ctg kernels, for the current ctg, i.e. after set_ctg_data:
+        evaluates the branch flows, flow limit violations and bus power balance
+        with the numpy kernels and with ctg_branch_kernel, compiled if numba is installed,
+        else as plain python, and raises an Exception if any result differs by more than
+        tol * max(1, |value|).
+        needs ybus_engine False.
+        returns the largest difference, relative as above'''
+
+        if ybus_engine:
+            raise Exception('ctg kernel check needs ybus_engine False')
+        kernel = compile_ctg_branch_kernel()
+        names = [
+            'ctg_branch_pow_orig_real', 'ctg_branch_pow_orig_imag',
+            'ctg_branch_pow_dest_real', 'ctg_branch_pow_dest_imag',
+            'ctg_branch_flow_orig_mag_max_viol', 'ctg_branch_flow_dest_mag_max_viol',
+            'ctg_bus_pow_balance_real_viol', 'ctg_bus_pow_balance_imag_viol']
+        results = []
+        for k in [None, kernel]:
+            self.ctg_branch_kernel = k
+            self.eval_ctg_bus_volt_viol()
+            self.eval_ctg_load_pow()
+            self.eval_ctg_fxsh_pow()
+            self.eval_ctg_gen_pow_real()
+            self.eval_ctg_gen_pow_imag_viol()
+            if k is None:
+                self.eval_ctg_branch_pow()
+                self.eval_ctg_branch_flow_viol()
+            else:
+                self.eval_ctg_branch_kernel()
+            self.eval_ctg_bus_swsh_adm_imag_viol()
+            self.eval_ctg_bus_swsh_pow()
+            self.eval_ctg_bus_pow_balance()
+            results.append([np.array(getattr(self, n)) for n in names])
+        self.ctg_branch_kernel = None
+        diff = 0.0
+        for (n, x, y) in zip(names, results[0], results[1]):
+            if x.size == 0:
+                continue
+            d = np.amax(np.abs(x - y) / np.maximum(1.0, np.maximum(np.abs(x), np.abs(y))))
+            if not (d <= tol):
+                raise Exception('ctg kernel check failed, ctg: %s, %s, diff: %s' % (
+                    self.ctg_label[self.ctg_current], n, d))
+            diff = max(diff, d)
+        return diff
+
+    def eval_ctg_branch_flow_viol(self):
+
+        (self.ctg_branch_flow_orig_mag_max_viol,
+         self.ctg_branch_flow_dest_mag_max_viol) = self.compute_branch_flow_viol(
+            self.ctg_branch_pow_orig_real,
+            self.ctg_branch_pow_orig_imag,
+            self.ctg_branch_pow_dest_real,
+            self.ctg_branch_pow_dest_imag,
+            self.ctg_branch_orig_volt_mag,
+            self.ctg_branch_dest_volt_mag,
+            self.ctg_branch_flow_mag_max,
+            self.ctg_workspace)
+        self.ctg_line_curr_orig_mag_max_viol = self.ctg_branch_flow_orig_mag_max_viol[self.branch_line]
+        self.ctg_line_curr_dest_mag_max_viol = self.ctg_branch_flow_dest_mag_max_viol[self.branch_line]
+        self.ctg_xfmr_pow_orig_mag_max_viol = self.ctg_branch_flow_orig_mag_max_viol[self.branch_xfmr]
+        self.ctg_xfmr_pow_dest_mag_max_viol = self.ctg_branch_flow_dest_mag_max_viol[self.branch_xfmr]
 
     def eval_ctg_bus_swsh_adm_imag_viol(self):
 
-        self.ctg_bus_swsh_adm_imag_min_viol = np.maximum(0.0, self.bus_swsh_adm_imag_min - self.ctg_bus_swsh_adm_imag)
-        self.ctg_bus_swsh_adm_imag_max_viol = np.maximum(0.0, self.ctg_bus_swsh_adm_imag - self.bus_swsh_adm_imag_max)
+        work = self.ctg_workspace
+        self.ctg_bus_swsh_adm_imag_min_viol = np.subtract(self.bus_swsh_adm_imag_min, self.ctg_bus_swsh_adm_imag, out=work.bus_swsh_adm_imag_min_viol)
+        np.maximum(0.0, self.ctg_bus_swsh_adm_imag_min_viol, out=self.ctg_bus_swsh_adm_imag_min_viol)
+        self.ctg_bus_swsh_adm_imag_max_viol = np.subtract(self.ctg_bus_swsh_adm_imag, self.bus_swsh_adm_imag_max, out=work.bus_swsh_adm_imag_max_viol)
+        np.maximum(0.0, self.ctg_bus_swsh_adm_imag_max_viol, out=self.ctg_bus_swsh_adm_imag_max_viol)
 
     def eval_ctg_bus_swsh_pow(self):
 
-        self.ctg_bus_swsh_pow_imag = -self.ctg_bus_swsh_adm_imag * self.ctg_bus_volt_mag**2.0
+        self.ctg_bus_swsh_pow_imag = np.multiply(self.ctg_bus_swsh_adm_imag, self.ctg_bus_volt_mag_sq, out=self.ctg_workspace.bus_swsh_pow_imag)
+        np.negative(self.ctg_bus_swsh_pow_imag, out=self.ctg_bus_swsh_pow_imag)
 
     def eval_ctg_bus_pow_balance(self):
 
@@ -1883,23 +2938,22 @@ class Evaluation:
                 print("xfmrs dest: %s" % str([(k, self.ctg_xfmr_active[k], self.ctg_xfmr_pow_dest_real[k]) for k in self.bus_xfmr_dest[i]]))
         '''
 
-        self.ctg_bus_pow_balance_real_viol = np.abs(
-            self.bus_gen_matrix.dot(self.ctg_gen_pow_real) -
-            self.ctg_bus_load_pow_real -
-            self.ctg_bus_fxsh_pow_real -
-            self.bus_line_orig_matrix.dot(self.ctg_line_pow_orig_real) -
-            self.bus_line_dest_matrix.dot(self.ctg_line_pow_dest_real) -
-            self.bus_xfmr_orig_matrix.dot(self.ctg_xfmr_pow_orig_real) -
-            self.bus_xfmr_dest_matrix.dot(self.ctg_xfmr_pow_dest_real))
-        self.ctg_bus_pow_balance_imag_viol = np.abs(
-            self.bus_gen_matrix.dot(self.ctg_gen_pow_imag) -
-            self.ctg_bus_load_pow_imag -
-            self.ctg_bus_fxsh_pow_imag -
-            self.ctg_bus_swsh_pow_imag -
-            self.bus_line_orig_matrix.dot(self.ctg_line_pow_orig_imag) -
-            self.bus_line_dest_matrix.dot(self.ctg_line_pow_dest_imag) -
-            self.bus_xfmr_orig_matrix.dot(self.ctg_xfmr_pow_orig_imag) -
-            self.bus_xfmr_dest_matrix.dot(self.ctg_xfmr_pow_dest_imag))
+        if ybus_engine:
+            self.eval_ctg_bus_pow_balance_ybus()
+            return
+        if self.ctg_branch_kernel is not None:
+            self.eval_ctg_bus_pow_balance_kernel()
+            return
+        work = self.ctg_workspace
+        (resid_real, resid_imag) = self.compute_bus_pow_balance(
+            self.ctg_gen_pow_real, self.ctg_gen_pow_imag,
+            self.ctg_bus_load_pow_real, self.ctg_bus_load_pow_imag,
+            self.ctg_bus_fxsh_pow_real, self.ctg_bus_fxsh_pow_imag, self.ctg_bus_swsh_pow_imag,
+            self.ctg_branch_pow_orig_real, self.ctg_branch_pow_orig_imag,
+            self.ctg_branch_pow_dest_real, self.ctg_branch_pow_dest_imag,
+            work.bus_pow_balance_inj)
+        self.ctg_bus_pow_balance_real_viol = np.abs(resid_real, out=work.bus_pow_balance_real_viol)
+        self.ctg_bus_pow_balance_imag_viol = np.abs(resid_imag, out=work.bus_pow_balance_imag_viol)
 
         ''' debug
         debug = False
@@ -1907,8 +2961,8 @@ class Evaluation:
         bus_i = 17
         #gen_i = 17
         #gen_id = '1'
-        bus = self.bus_map[bus_i]
-        #gen = self.gen_map[(gen_i, gen_id)]
+        bus = self.bus_index.get([bus_i])[0]
+        #gen = self.gen_index.get([(gen_i, gen_id)])[0]
         if self.ctg_label[self.ctg_current] == ctg_label:
             debug = True
             print('ctg_label: %s' % self.ctg_label[self.ctg_current])
@@ -1966,14 +3020,51 @@ class Evaluation:
             for i in self.bus}
         '''
 
+    def eval_ctg_bus_pow_balance_kernel(self):
+        '''as eval_ctg_bus_pow_balance, with the bus sums of the branch flows
+        from eval_ctg_branch_kernel'''
+
+        work = self.ctg_workspace
+        viol = np.subtract(self.bus_gen_matrix.dot(self.ctg_gen_pow_real), self.ctg_bus_load_pow_real, out=work.bus_pow_balance_real_viol)
+        viol -= self.ctg_bus_fxsh_pow_real
+        viol -= self.ctg_bus_branch_pow_real
+        self.ctg_bus_pow_balance_real_viol = np.abs(viol, out=viol)
+        viol = np.subtract(self.bus_gen_matrix.dot(self.ctg_gen_pow_imag), self.ctg_bus_load_pow_imag, out=work.bus_pow_balance_imag_viol)
+        viol -= self.ctg_bus_fxsh_pow_imag
+        viol -= self.ctg_bus_swsh_pow_imag
+        viol -= self.ctg_bus_branch_pow_imag
+        self.ctg_bus_pow_balance_imag_viol = np.abs(viol, out=viol)
+
+    def eval_ctg_bus_pow_balance_ybus(self):
+
+        work = self.ctg_workspace
+        bus_pow_inj = self.compute_bus_pow_inj_ybus(self.ctg_bus_volt, self.ctg_branches_out)
+        self.ctg_bus_pow_balance_real_viol = np.abs(
+            self.bus_gen_matrix.dot(self.ctg_gen_pow_real) -
+            self.ctg_bus_load_pow_real -
+            bus_pow_inj.real,
+            out=work.bus_pow_balance_real_viol)
+        self.ctg_bus_pow_balance_imag_viol = np.abs(
+            self.bus_gen_matrix.dot(self.ctg_gen_pow_imag) -
+            self.ctg_bus_load_pow_imag -
+            self.ctg_bus_swsh_pow_imag -
+            bus_pow_inj.imag,
+            out=work.bus_pow_balance_imag_viol)
+
     def eval_ctg_gen_pvpq_viol(self):
 
-        self.ctg_gen_pvpq1_viol = np.minimum(
-            np.maximum(0.0, self.ctg_gen_pow_imag_max - self.ctg_gen_pow_imag),
-            np.maximum(0.0, self.gen_bus_volt_mag - self.ctg_gen_bus_volt_mag))
-        self.ctg_gen_pvpq2_viol = np.minimum(
-            np.maximum(0.0, self.ctg_gen_pow_imag - self.ctg_gen_pow_imag_min),
-            np.maximum(0.0, self.ctg_gen_bus_volt_mag - self.gen_bus_volt_mag))
+        work = self.ctg_workspace
+        (pow_slack, volt_slack) = work.gen_work
+        np.subtract(self.ctg_gen_pow_imag_max, self.ctg_gen_pow_imag, out=pow_slack)
+        np.maximum(0.0, pow_slack, out=pow_slack)
+        np.subtract(self.gen_bus_volt_mag, self.ctg_gen_bus_volt_mag, out=volt_slack)
+        np.maximum(0.0, volt_slack, out=volt_slack)
+        self.ctg_gen_pvpq1_viol = np.minimum(pow_slack, volt_slack, out=work.gen_pvpq1_viol)
+        np.subtract(self.ctg_gen_pow_imag, self.ctg_gen_pow_imag_min, out=pow_slack)
+        np.maximum(0.0, pow_slack, out=pow_slack)
+        np.subtract(self.ctg_gen_bus_volt_mag, self.gen_bus_volt_mag, out=volt_slack)
+        np.maximum(0.0, volt_slack, out=volt_slack)
+        self.ctg_gen_pvpq2_viol = np.minimum(pow_slack, volt_slack, out=work.gen_pvpq2_viol)
 
         '''
         self.ctg_gen_pvpq1_viol = {
@@ -2012,67 +3103,55 @@ class Evaluation:
                 print("vq2_viol (overvoltage / qmin slack: %s" % self.ctg_gen_pvpq2_viol[g])
         '''
 
+    def stack_penalty_viol(
+            self, branch_flow_orig_mag_max_viol, branch_flow_dest_mag_max_viol,
+            bus_pow_balance_real_viol, bus_pow_balance_imag_viol, out=None):
+        '''the stacked violations for compute_penalty, see set_data_penalty_params.
+        the arguments have the same leading shape, e.g. (num ctg in batch,).
+        out: None, or an array for the stack'''
+
+        if out is None:
+            out = np.zeros(shape=(bus_pow_balance_real_viol.shape[:-1] + (self.num_penalty_viol,)))
+        np.maximum(branch_flow_orig_mag_max_viol, branch_flow_dest_mag_max_viol, out=out[..., self.penalty_viol_branch])
+        out[..., self.penalty_viol_bus_real] = bus_pow_balance_real_viol
+        out[..., self.penalty_viol_bus_imag] = bus_pow_balance_imag_viol
+        return out
+
+    def compute_penalty(self, viol, out=None, work=None):
+        '''unweighted penalty of stacked violations, summed over the last axis,
+        i.e. one penalty for (num,), one per ctg for (num ctg in batch, num).
+        the blocks of all the categories are applied in one call of eval_piecewise_linear_penalty,
+        and the categories are summed separately in the order line, xfmr, real, imag,
+        so the result is the same as penalizing each category on its own.
+        out, work: see eval_piecewise_linear_penalty'''
+
+        penalty = eval_piecewise_linear_penalty(
+            viol, self.penalty_viol_block_max, self.penalty_viol_block_coeff, out=out, work=work)
+        return (
+            np.sum(penalty[..., self.penalty_viol_line], axis=-1) +
+            np.sum(penalty[..., self.penalty_viol_xfmr], axis=-1) +
+            np.sum(penalty[..., self.penalty_viol_bus_real], axis=-1) +
+            np.sum(penalty[..., self.penalty_viol_bus_imag], axis=-1))
+
     def eval_penalty(self):
-        '''TODO: maybe this can be more efficient:
-                    check eval_piecewise ... made a big improvement on this - it was creating a list needlessly
-                    try concatenating to one vector'''
 
         start_time = time.time()
-        self.penalty = base_case_penalty_weight * (
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    np.maximum(
-                        self.line_curr_orig_mag_max_viol,
-                        self.line_curr_dest_mag_max_viol),
-                    self.penalty_block_pow_abs_max,
-                    self.penalty_block_pow_abs_coeff)) +
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    np.maximum(
-                        self.xfmr_pow_orig_mag_max_viol,
-                        self.xfmr_pow_dest_mag_max_viol),
-                    self.penalty_block_pow_abs_max,
-                    self.penalty_block_pow_abs_coeff)) +
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    self.bus_pow_balance_real_viol,
-                    self.penalty_block_pow_real_max,
-                    self.penalty_block_pow_real_coeff)) +
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    self.bus_pow_balance_imag_viol,
-                    self.penalty_block_pow_imag_max,
-                    self.penalty_block_pow_imag_coeff)))
+        self.penalty = base_case_penalty_weight * self.compute_penalty(
+            self.stack_penalty_viol(
+                self.branch_flow_orig_mag_max_viol, self.branch_flow_dest_mag_max_viol,
+                self.bus_pow_balance_real_viol, self.bus_pow_balance_imag_viol))
         end_time = time.time()
         print('eval penalty time: %f' % (end_time - start_time))
 
     def eval_ctg_penalty(self):
 
-        self.ctg_penalty = (1 - base_case_penalty_weight) / max(1.0, float(self.num_ctg)) * (
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    np.maximum(
-                        self.ctg_line_curr_orig_mag_max_viol,
-                        self.ctg_line_curr_dest_mag_max_viol),
-                    self.penalty_block_pow_abs_max,
-                    self.penalty_block_pow_abs_coeff)) +
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    np.maximum(
-                        self.ctg_xfmr_pow_orig_mag_max_viol,
-                        self.ctg_xfmr_pow_dest_mag_max_viol),
-                    self.penalty_block_pow_abs_max,
-                    self.penalty_block_pow_abs_coeff)) +
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    self.ctg_bus_pow_balance_real_viol,
-                    self.penalty_block_pow_real_max,
-                    self.penalty_block_pow_real_coeff)) +
-            np.sum(
-                eval_piecewise_linear_penalty(
-                    self.ctg_bus_pow_balance_imag_viol,
-                    self.penalty_block_pow_imag_max,
-                    self.penalty_block_pow_imag_coeff)))
+        work = self.ctg_workspace
+        self.ctg_penalty = (1 - base_case_penalty_weight) / max(1.0, float(self.num_ctg)) * self.compute_penalty(
+            self.stack_penalty_viol(
+                self.ctg_branch_flow_orig_mag_max_viol, self.ctg_branch_flow_dest_mag_max_viol,
+                self.ctg_bus_pow_balance_real_viol, self.ctg_bus_pow_balance_imag_viol,
+                out=work.penalty_viol),
+            out=work.penalty, work=work.penalty_work)
 
     def eval_infeas(self):
 
@@ -2159,27 +3238,70 @@ class Evaluation:
         self.max_line_curr_dest_mag_max_viol = extra_max(self.line_key, self.line_curr_dest_mag_max_viol)
         self.max_xfmr_pow_orig_mag_max_viol = extra_max(self.xfmr_key, self.xfmr_pow_orig_mag_max_viol)
         self.max_xfmr_pow_dest_mag_max_viol = extra_max(self.xfmr_key, self.xfmr_pow_dest_mag_max_viol)
+        if detail_top_k > 0:
+            self.compute_top_k()
         end_time = time.time()
         print('compute detail time: %f' % (end_time - start_time))
 
+    def compute_top_k(self):
+        '''the largest detail_top_k violations of each category of the base case'''
+
+        k = detail_top_k
+        self.top_k_rows = get_top_k_rows('', [
+            ('vmax', extra_top_k(self.bus_i, self.bus_volt_mag_max_viol, k)),
+            ('vmin', extra_top_k(self.bus_i, self.bus_volt_mag_min_viol, k)),
+            ('bmax', extra_top_k(self.bus_i, self.bus_swsh_adm_imag_max_viol, k)),
+            ('bmin', extra_top_k(self.bus_i, self.bus_swsh_adm_imag_min_viol, k)),
+            ('pbal', extra_top_k(self.bus_i, self.bus_pow_balance_real_viol, k)),
+            ('qbal', extra_top_k(self.bus_i, self.bus_pow_balance_imag_viol, k)),
+            ('pgmax', extra_top_k(self.gen_key, self.gen_pow_real_max_viol, k)),
+            ('pgmin', extra_top_k(self.gen_key, self.gen_pow_real_min_viol, k)),
+            ('qgmax', extra_top_k(self.gen_key, self.gen_pow_imag_max_viol, k)),
+            ('qgmin', extra_top_k(self.gen_key, self.gen_pow_imag_min_viol, k)),
+            ('lineomax', extra_top_k(self.line_key, self.line_curr_orig_mag_max_viol, k)),
+            ('linedmax', extra_top_k(self.line_key, self.line_curr_dest_mag_max_viol, k)),
+            ('xfmromax', extra_top_k(self.xfmr_key, self.xfmr_pow_orig_mag_max_viol, k)),
+            ('xfmrdmax', extra_top_k(self.xfmr_key, self.xfmr_pow_dest_mag_max_viol, k))])
+
     def compute_ctg_detail(self):
-        
-        self.ctg_max_bus_volt_mag_max_viol = extra_max(self.bus_i, self.ctg_bus_volt_mag_max_viol)
-        self.ctg_max_bus_volt_mag_min_viol = extra_max(self.bus_i, self.ctg_bus_volt_mag_min_viol)
-        self.ctg_max_bus_swsh_adm_imag_max_viol = extra_max(self.bus_i, self.ctg_bus_swsh_adm_imag_max_viol)
-        self.ctg_max_bus_swsh_adm_imag_min_viol = extra_max(self.bus_i, self.ctg_bus_swsh_adm_imag_min_viol)
-        self.ctg_max_bus_pow_balance_real_viol = extra_max(self.bus_i, self.ctg_bus_pow_balance_real_viol)
-        self.ctg_max_bus_pow_balance_imag_viol = extra_max(self.bus_i, self.ctg_bus_pow_balance_imag_viol)
+        '''the max of each violation, with one argmax over each block of the workspace,
+        i.e. bus, gen, line, xfmr, see CtgWorkspace.
+        the eval_ctg_ functions write the ctg_ violations into the rows of the blocks'''
+
+        work = self.ctg_workspace
+        (self.ctg_max_bus_volt_mag_max_viol,
+         self.ctg_max_bus_volt_mag_min_viol,
+         self.ctg_max_bus_swsh_adm_imag_max_viol,
+         self.ctg_max_bus_swsh_adm_imag_min_viol,
+         self.ctg_max_bus_pow_balance_real_viol,
+         self.ctg_max_bus_pow_balance_imag_viol) = extra_max_rows(self.bus_i, work.bus_viol)
         #self.ctg_max_gen_pow_real_max_viol = extra_max(self.gen_key, self.ctg_gen_pow_real_max_viol) # do we need something for this?
         #self.ctg_max_gen_pow_real_min_viol = extra_max(self.gen_key, self.ctg_gen_pow_real_min_viol)
-        self.ctg_max_gen_pow_imag_max_viol = extra_max(self.gen_key, self.ctg_gen_pow_imag_max_viol)
-        self.ctg_max_gen_pow_imag_min_viol = extra_max(self.gen_key, self.ctg_gen_pow_imag_min_viol)
-        self.ctg_max_gen_pvpq1_viol = extra_max(self.gen_key, self.ctg_gen_pvpq1_viol)
-        self.ctg_max_gen_pvpq2_viol = extra_max(self.gen_key, self.ctg_gen_pvpq2_viol)
-        self.ctg_max_line_curr_orig_mag_max_viol = extra_max(self.line_key, self.ctg_line_curr_orig_mag_max_viol)
-        self.ctg_max_line_curr_dest_mag_max_viol = extra_max(self.line_key, self.ctg_line_curr_dest_mag_max_viol)
-        self.ctg_max_xfmr_pow_orig_mag_max_viol = extra_max(self.xfmr_key, self.ctg_xfmr_pow_orig_mag_max_viol)
-        self.ctg_max_xfmr_pow_dest_mag_max_viol = extra_max(self.xfmr_key, self.ctg_xfmr_pow_dest_mag_max_viol)
+        (self.ctg_max_gen_pow_imag_max_viol,
+         self.ctg_max_gen_pow_imag_min_viol,
+         self.ctg_max_gen_pvpq1_viol,
+         self.ctg_max_gen_pvpq2_viol) = extra_max_rows(self.gen_key, work.gen_viol)
+        (self.ctg_max_line_curr_orig_mag_max_viol,
+         self.ctg_max_line_curr_dest_mag_max_viol) = extra_max_rows(self.line_key, work.branch_viol[:, self.branch_line])
+        (self.ctg_max_xfmr_pow_orig_mag_max_viol,
+         self.ctg_max_xfmr_pow_dest_mag_max_viol) = extra_max_rows(self.xfmr_key, work.branch_viol[:, self.branch_xfmr])
+        if detail_top_k > 0:
+            self.compute_ctg_top_k()
+
+    def compute_ctg_top_k(self):
+        '''the largest detail_top_k violations of each category of the ctg,
+        from the blocks of the workspace, as in compute_ctg_detail'''
+
+        work = self.ctg_workspace
+        k = detail_top_k
+        self.ctg_top_k_rows = get_top_k_rows(
+            self.ctg_label[self.ctg_current],
+            list(zip(top_k_bus_categories, extra_top_k_rows(self.bus_i, work.bus_viol, k))) +
+            list(zip(top_k_ctg_gen_categories, extra_top_k_rows(self.gen_key, work.gen_viol, k))) +
+            list(zip(['line' + c for c in top_k_branch_categories],
+                     extra_top_k_rows(self.line_key, work.branch_viol[:, self.branch_line], k))) +
+            list(zip(['xfmr' + c for c in top_k_branch_categories],
+                     extra_top_k_rows(self.xfmr_key, work.branch_viol[:, self.branch_xfmr], k))))
 
     '''
     def compute_summary(self):
@@ -2423,6 +3545,80 @@ def solution_read_sections_from_lines(lines_in, section_start_line_str=None, has
     print('solution_read_sections_from_lines time: %f' % (end_time - start_time))
     return sections
 
+def sol_bytes_to_str(b):
+    '''bytes from a solution file to str'''
+
+    return b if isinstance(b, str) else b.decode('utf-8')
+
+def parse_sol_bus_rows(text, num_bus):
+    '''parse the bus data rows "i, v, theta, b" of a solution file section.
+    text holds exactly num_bus rows as bytes.
+    returns (bus_i, bus_array) where bus_i is an int array of bus numbers
+    and bus_array is a num_bus x 3 float array with columns v, theta, b.
+    all the fields are numeric, so after turning the newlines into field separators
+    the fields are converted in one numpy call, which raises a ValueError
+    naming the field if one is not a number.'''
+
+    tokens = text.replace(b'\n', b',').split(b',')
+    if len(tokens[-1].strip()) == 0: # after the last newline
+        tokens.pop()
+    if len(tokens) != 4 * num_bus:
+        raise Exception('sol bus section error. expected %u values (%u rows), found %u' % (4 * num_bus, num_bus, len(tokens)))
+    values = np.array(tokens).astype(np.float64).reshape((num_bus, 4))
+    bus_i = values[:, 0].astype(np.int_)
+    bus_array = values[:, 1:4].copy()
+    return (bus_i, bus_array)
+
+def parse_sol_gen_rows(text, num_gen):
+    '''parse the generator data rows "i, uid, p, q" of a solution file section.
+    text holds exactly num_gen rows as bytes.
+    returns (gen_i, gen_id, gen_array) where gen_i is an int array of bus numbers,
+    gen_id is a list of unit id strings (not cleaned) and gen_array is
+    a num_gen x 2 float array with columns p, q.'''
+
+    tokens = text.replace(b'\n', b',').split(b',')
+    if len(tokens[-1].strip()) == 0: # after the last newline
+        tokens.pop()
+    if len(tokens) != 4 * num_gen:
+        raise Exception('sol generator section error. expected %u fields (%u rows), found %u' % (4 * num_gen, num_gen, len(tokens)))
+    gen_i = np.array(tokens[0::4]).astype(np.int_)
+    gen_id = [sol_bytes_to_str(t).lstrip() for t in tokens[1::4]]
+    gen_array = np.zeros(shape=(num_gen, 2))
+    if num_gen > 0:
+        gen_array[:, 0] = np.array(tokens[2::4]).astype(np.float64)
+        gen_array[:, 1] = np.array(tokens[3::4]).astype(np.float64)
+    return (gen_i, gen_id, gen_array)
+
+def read_sol_section(in_file, sol_name, section_start, num_rows):
+    '''read a section of a solution file from the current position of in_file,
+    opened in binary mode: the section start line, which is checked,
+    a header line, and num_rows data rows. returns the data rows as bytes'''
+
+    lines = list(islice(in_file, 2 + num_rows))
+    found = sol_bytes_to_str(lines[0]).strip() if len(lines) > 0 else ''
+    if found != section_start:
+        raise Exception('%s section error. expected: %s, found: %s' % (sol_name, section_start, found))
+    return b''.join(lines[2:])
+
+def parse_ctg_block(block, num_bus, num_gen):
+    '''parse one sol2 contingency block, given as bytes, with the fixed
+    layout described by get_ctg_block_line_offsets.
+    returns (ctg_label, bus_i, bus_array, gen_i, gen_id, gen_array, delta).
+    no DataFrame or StringIO is created.'''
+
+    line_offsets = get_ctg_block_line_offsets(num_bus, num_gen)
+    ctg_block_size = line_offsets[-1]
+    newline_pos = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+    if newline_pos.size < ctg_block_size - 1:
+        raise Exception('sol2 ctg block error. expected lines: %u, found: %u' % (ctg_block_size, newline_pos.size + 1))
+    line_starts = np.concatenate(([0], newline_pos[:(ctg_block_size - 1)] + 1, [len(block)]))
+    starts = [line_starts[r] for r in line_offsets]
+    ctg_label = sol_bytes_to_str(block[starts[1]:starts[2]]).strip()
+    bus_i, bus_array = parse_sol_bus_rows(block[starts[3]:starts[4]], num_bus)
+    gen_i, gen_id, gen_array = parse_sol_gen_rows(block[starts[5]:starts[6]], num_gen)
+    delta = float(block[starts[7]:starts[8]])
+    return (ctg_label, bus_i, bus_array, gen_i, gen_id, gen_array, delta)
+
 class Solution1:
     '''In physical units, i.e. data convention, i.e. same as input and output data files'''
 
@@ -2436,47 +3632,29 @@ class Solution1:
         self.gen_pow_imag = {}
 
     def read(self, file_name, num_bus, num_gen):
+        '''read sol1 in a single pass over the file.
+        the section start lines are checked as they are read'''
         
         start_time = time.time()
-        self.bus_df = pd.read_csv(
-            file_name,
-            sep=',',
-            header=None,
-            names=['i', 'vm', 'va', 'b'],
-            dtype={'i':np.int_, 'vm':np.float_, 'va':np.float_, 'b':np.float_},
-            nrows=num_bus,
-            engine='c',
-            skiprows=2,
-            skipinitialspace=True,
-            float_precision=pandas_float_precision)
-        self.gen_df = pd.read_csv(
-            file_name,
-            sep=',',
-            header=None,
-            names=['i', 'id', 'pg', 'qg'],
-            dtype={'i':np.int_, 'id':str, 'pg':np.float_, 'pq':np.float_},
-            nrows=num_gen,
-            engine='c',
-            na_values=None,
-            keep_default_na=False,
-            #quoting=csv.QUOTE_NONE,
-            skiprows=(4 + num_bus),
-            skipinitialspace=True,
-            float_precision=pandas_float_precision)
-        self.num_bus = self.bus_df.shape[0]
-        self.num_gen = self.gen_df.shape[0]
+        with open_sol(file_name) as f:
+            rows = read_sol_section(f, 'sol1', '--bus section', num_bus)
+            (self.bus_i, self.bus_array) = parse_sol_bus_rows(rows, num_bus)
+            rows = read_sol_section(f, 'sol1', '--generator section', num_gen)
+            (self.gen_i, self.gen_id, self.gen_array) = parse_sol_gen_rows(rows, num_gen)
+        self.num_bus = self.bus_i.size
+        self.num_gen = self.gen_i.size
         '''
         self.bus_i = bus_array.i.values.tolist() # should this be a list?
         self.num_bus = len(self.bus_i)
         #print([self.num_bus, self.bus_i[self.num_bus - 1]])
-        self.bus_map = {self.bus_i[i]:i for i in range(self.num_bus)}
+        self.bus_index = KeyIndex(self.bus_i)
         self.bus_volt_mag = bus_array.vm.values
         self.bus_volt_ang = bus_array.va.values
         self.bus_swsh_adm_imag = bus_array.b.values
         self.gen_i = gen_array.i.values.tolist() # should this be a list?
         self.gen_id = gen_array.id.values.tolist() # should this be a list?
         self.num_gen = len(self.gen_i)
-        self.gen_map = {(self.gen_i[i], self.gen_id[i]):i for i in range(self.num_gen)}
+        self.gen_index = KeyIndex(list(zip(self.gen_i, self.gen_id)))
         #print(self.gen_id[0:10])
         self.gen_pow_real = gen_array.pg.values
         self.gen_pow_imag = gen_array.qg.values
@@ -2649,7 +3827,7 @@ class Solution1:
         self.bus_i = bus_array.i.values.tolist() # should this be a list?
         self.num_bus = len(self.bus_i)
         #print([self.num_bus, self.bus_i[self.num_bus - 1]])
-        self.bus_map = {self.bus_i[i]:i for i in range(self.num_bus)}
+        self.bus_index = KeyIndex(self.bus_i)
         self.bus_volt_mag = bus_array.vm.values
         self.bus_volt_ang = bus_array.va.values
         self.bus_swsh_adm_imag = bus_array.b.values
@@ -2666,7 +3844,7 @@ class Solution1:
         self.gen_i = gen_array.i.values.tolist() # should this be a list?
         self.gen_id = gen_array.id.values.tolist() # should this be a list?
         self.num_gen = len(self.gen_i)
-        self.gen_map = {(self.gen_i[i], self.gen_id[i]):i for i in range(self.num_gen)}
+        self.gen_index = KeyIndex(list(zip(self.gen_i, self.gen_id)))
         #print(self.gen_id[0:10])
         self.gen_pow_real = gen_array.pg.values
         self.gen_pow_imag = gen_array.qg.values
@@ -2959,7 +4137,7 @@ class Solution1:
         start_time = time.time()
         self.num_bus = len(rows)
         self.bus_i = [int(r[i]) for r in rows]
-        self.bus_map = {self.bus_i[i]:i for i in range(self.num_bus)}
+        self.bus_index = KeyIndex(self.bus_i)
         self.bus_volt_mag = np.array([float(r[vm]) for r in rows])
         self.bus_volt_ang = np.array([float(r[va]) for r in rows])
         self.bus_swsh_adm_imag = np.array([float(r[b]) for r in rows])
@@ -2976,7 +4154,7 @@ class Solution1:
         self.num_gen = len(rows)
         self.gen_i = [int(r[i]) for r in rows]
         self.gen_id = [str(r[id]).replace(' ', '') for r in rows]
-        self.gen_map = {(self.gen_i[i], self.gen_id[i]):i for i in range(self.num_gen)}
+        self.gen_index = KeyIndex(list(zip(self.gen_i, self.gen_id)))
         self.gen_pow_real = np.array([float(r[p]) for r in rows])
         self.gen_pow_imag = np.array([float(r[q]) for r in rows])
         end_time = time.time()
@@ -3027,69 +4205,29 @@ class Solution2:
     def read_next_ctg(self, in_file, num_bus, num_gen):
 
         ctg_block_size = get_ctg_block_size(num_bus, num_gen)
-
-        ctg_start = 0
-        ctg_end = ctg_start + 2 + 1
-        bus_start = ctg_end
-        bus_end = bus_start + 2 + num_bus
-        gen_start = bus_end
-        gen_end = gen_start + 2 + num_gen
-        delta_start = gen_end
-        delta_end = delta_start + 2 + 1
-        
-        # get lines for each section as a generator
-        ctg_lines = islice(in_file, 2 + 1)
-        bus_lines = islice(in_file, 2 + num_bus)
-        gen_lines = islice(in_file, 2 + num_gen)
-        delta_lines = islice(in_file, 2 + 1)
-        
-        # write lines to a string buffer
-        def lines_to_str(lines):
-            #out_str = StringIO.StringIO(''.join(lines))
-            #out_str = StringIO.StringIO()
-            #out_str = StringIO.StringIO('foo')
-            #out_str = cStringIO.StringIO()
-            out_str = StringIO()
-            #out_str = cStringIO.StringIO(''.join(lines))
-            out_str.writelines(lines)
-            #out_str.write('foo')
-            #out_str.flush() # do we need this?
-            #out_str.close()
-            #out_str.close()
-            out_str.seek(0) # need this so that read() (called by pd.*) starts at the beginning of the string
-            return out_str
-        ctg_str = lines_to_str(ctg_lines)
-        bus_str = lines_to_str(bus_lines)
-        gen_str = lines_to_str(gen_lines)
-        delta_str = lines_to_str(delta_lines)
-
-        # parse file string to pandas df
-        ctg_df = pd.read_csv(
-            ctg_str, sep=',', header=None, names=['label'], dtype={'label':str},
-            nrows=1, engine='c', skiprows=2, skipinitialspace=True, float_precision=pandas_float_precision)
-        bus_df = pd.read_csv(
-            bus_str, sep=',', header=None, names=['i', 'vm', 'va', 'b'],
-            dtype={'i':np.int_, 'vm':np.float_, 'va':np.float_, 'b':np.float_},
-            nrows=num_bus, engine='c', skiprows=2, skipinitialspace=True, float_precision=pandas_float_precision)
-        gen_df = pd.read_csv(
-            gen_str, sep=',', header=None, names=['i', 'id', 'pg', 'qg'],
-            dtype={'i':np.int_, 'id':str, 'pg':np.float_, 'qg':np.float_},
-            nrows=num_gen, engine='c', skiprows=2, skipinitialspace=True, float_precision=pandas_float_precision,
-            na_values=None, keep_default_na=False #, #quoting=csv.QUOTE_NONE,
-        )
-        delta_df = pd.read_csv(
-            delta_str, sep=',', header=None, names=['delta'],
-            dtype={'delta':np.float_}, nrows=1, engine='c', skiprows=2, skipinitialspace=True, float_precision=pandas_float_precision)
-                
-        self.bus_df = bus_df
-        self.gen_df = gen_df
-        self.ctg_label = ctg_df.label.values[0]
-        self.num_bus = bus_df.shape[0]
-        self.num_gen = gen_df.shape[0]
-        self.delta = delta_df.delta.values[0]
+        lines = list(islice(in_file, ctg_block_size))
+        block = b''.join(
+            [(l if isinstance(l, bytes) else l.encode('utf-8')) for l in lines])
+        self.read_ctg_block(block, num_bus, num_gen)
                 
         #print('ctg: %s, num bus: %u, num gen: %u, delta: %f' % (self.ctg_label, self.num_bus, self.num_gen, self.delta))
 
+    def read_ctg_block(self, block, num_bus, num_gen):
+        '''read a single contingency from the bytes of its sol2 block,
+        e.g. a view returned by Solution2BlockIndex.get_block()'''
+
+        if not isinstance(block, bytes):
+            block = block.tobytes()
+        self.set_parsed_ctg_block(parse_ctg_block(block, num_bus, num_gen))
+
+    def set_parsed_ctg_block(self, parsed_block):
+        '''set a single contingency from the tuple returned by parse_ctg_block'''
+
+        (self.ctg_label, self.bus_i, self.bus_array,
+         self.gen_i, self.gen_id, self.gen_array, self.delta) = parsed_block
+        self.num_bus = self.bus_i.size
+        self.num_gen = self.gen_i.size
+
     def read_from_lines(self, lines):
         """read a sol2 object from a list of text lines
         the lines may be selected as a single contingency from a file
@@ -3152,6 +4290,741 @@ class Solution2:
         rp = float(r[p])
         self.pow_real_change = rp
 
+def read_sol2_ctgs(sol2_file, num_bus, num_gen, ctg_labels_data_list):
+    '''read and check sol2 in a single pass.
+    yields a Solution2 for each contingency block in the order of the file.
+    the number of lines and the contingency labels are checked as the blocks
+    go by, and a block is only parsed and yielded once its label is known to be
+    a new label from the data. if any problem is found, the rest of the file is
+    scanned for labels and newlines only, then check_sol2_num_lines_found and
+    check_sol2_ctg_labels_found are called, so the exception raised is the same
+    one that check_sol2_num_lines and check_sol2_ctg_labels raise.
+    it is raised at the end of the file, though, after the blocks before the
+    problem have been yielded, so the caller should not treat the results of
+    those blocks as final until the iteration ends without an error, as run
+    does with the detail rows. if those checks pass, a block parsing error is raised.
+    sol2_file is opened in binary mode.'''
+
+    num_ctg = len(ctg_labels_data_list)
+    ctg_block_size = get_ctg_block_size(num_bus, num_gen)
+    ctg_labels_data = set(ctg_labels_data_list)
+    ctg_labels_sol_list = []
+    ctg_labels_sol = set()
+    num_lines = 0
+    ok = (len(ctg_labels_data) == num_ctg)
+    block_error = None
+    for k in range(num_ctg):
+        lines = list(islice(sol2_file, ctg_block_size))
+        num_lines += sum(l.count(b'\n') for l in lines)
+        if len(lines) > 2:
+            ctg_label = clean_string(sol_bytes_to_str(lines[2]).strip())
+            ctg_labels_sol_list.append(ctg_label)
+        if len(lines) < ctg_block_size:
+            ok = False
+            break
+        if not ok:
+            continue
+        if (ctg_label not in ctg_labels_data) or (ctg_label in ctg_labels_sol):
+            ok = False
+            continue
+        ctg_labels_sol.add(ctg_label)
+        s2 = Solution2()
+        try:
+            s2.read_ctg_block(b''.join(lines), num_bus, num_gen)
+        except Exception as ex:
+            block_error = ex
+            ok = False
+            continue
+        yield s2
+
+    # count the newlines left over, as rawgencount does
+    num_lines += sum(buf.count(b'\n') for buf in _make_gen(sol2_file.read))
+    check_sol2_num_lines_found(num_bus, num_gen, num_ctg, num_lines)
+    print('checking contingency labels sol vs data')
+    check_sol2_ctg_labels_found(ctg_labels_data_list, ctg_labels_sol_list)
+    if block_error is not None:
+        raise block_error
+
+def prefetch(items, depth, stop=None, join_timeout=None):
+    '''iterate over items, with the items produced in a background thread
+    and up to depth of them held in a queue ahead of the consumer.
+    reading and parsing the next contingencies then overlaps with the
+    evaluation of the current one, as the numpy kernels release the GIL.
+    an exception raised by the producer is raised again in the consumer
+    at the point where the item would have been returned.
+    stop, a threading.Event, is set when the consumer is done, e.g. on an error,
+    and can be shared with items so that a producer waiting for data gives up,
+    see FollowFile. the producer is then waited for at most join_timeout seconds
+    (None: no limit). a producer still running after that, e.g. blocked reading
+    a named pipe, is a daemon thread, and closes items when it gets to its end.
+    depth <= 0 iterates over items in the calling thread.'''
+
+    if depth <= 0:
+        for item in items:
+            yield item
+        return
+    item_queue = queue.Queue(maxsize=depth)
+    if stop is None:
+        stop = threading.Event()
+
+    def put(message):
+        # returns False if the consumer went away
+        while not stop.is_set():
+            try:
+                item_queue.put(message, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in items:
+                if not put((True, item)):
+                    return
+            put((False, None))
+        except Exception as ex:
+            put((False, ex))
+        finally:
+            # e.g. close the file of a generator left part way through
+            if hasattr(items, 'close'):
+                items.close()
+
+    producer = threading.Thread(target=produce)
+    producer.daemon = True
+    producer.start()
+    try:
+        while True:
+            is_item, value = item_queue.get()
+            if is_item:
+                yield value
+            elif value is None:
+                break
+            else:
+                raise value
+    finally:
+        stop.set()
+        producer.join(join_timeout)
+
+class Solution2BlockIndex:
+    '''random access to the contingency blocks of a sol2 file.
+    the file is memory mapped, and the byte offsets of every contingency block
+    and of the sections within it are found by a single vectorized scan for
+    newline characters. the scan is done in chunks so memory use does not grow
+    with the file size, and only the offsets of the section start lines are kept.
+
+    offsets[k, :] holds the byte offsets of the lines given by
+    get_ctg_block_line_offsets for block k, so offsets[k, 0] is the start of
+    block k and offsets[k, 8] is its end. blocks can be read in any order,
+    and contiguous ranges of blocks can be handed to separate workers.'''
+
+    def __init__(self):
+
+        self.file_name = None
+        self.file = None
+        self.mmap = None
+        self.data = None
+        self.num_bus = 0
+        self.num_gen = 0
+        self.num_lines = 0
+        self.num_ctg = 0
+        self.offsets = np.zeros(shape=(0, 9), dtype=np.int64)
+
+    def open(self, file_name, num_bus, num_gen, chunk_size=(64 * 1024 * 1024)):
+
+        start_time = time.time()
+        self.close()
+        if get_sol_compression(file_name) is not None:
+            raise Exception('sol2 block index needs an uncompressed file: %s' % file_name)
+        self.file_name = file_name
+        self.num_bus = num_bus
+        self.num_gen = num_gen
+        self.file = open(file_name, 'rb')
+        self.file.seek(0, 2)
+        file_size = self.file.tell()
+        self.file.seek(0)
+        if file_size > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = np.frombuffer(self.mmap, dtype=np.uint8)
+        else:
+            self.data = np.zeros(shape=0, dtype=np.uint8)
+        line_offsets = get_ctg_block_line_offsets(num_bus, num_gen)
+        ctg_block_size = line_offsets[-1]
+        line_wanted = np.zeros(shape=ctg_block_size, dtype=bool)
+        line_wanted[[r % ctg_block_size for r in line_offsets]] = True
+
+        # line L starts 1 byte past newline L - 1.
+        # keep the starts of the lines that begin a block or a section
+        line_nums = [np.zeros(shape=1, dtype=np.int64)]
+        line_starts = [np.zeros(shape=1, dtype=np.int64)]
+        num_newlines = 0
+        for chunk_start in range(0, file_size, chunk_size):
+            chunk = self.data[chunk_start:(chunk_start + chunk_size)]
+            newline_pos = np.flatnonzero(chunk == ord('\n'))
+            next_line_num = np.arange(
+                num_newlines + 1, num_newlines + 1 + newline_pos.size, dtype=np.int64)
+            keep = line_wanted[next_line_num % ctg_block_size]
+            line_nums.append(next_line_num[keep])
+            line_starts.append(newline_pos[keep].astype(np.int64) + (chunk_start + 1))
+            num_newlines += newline_pos.size
+        line_nums = np.concatenate(line_nums)
+        line_starts = np.concatenate(line_starts)
+
+        # a block is complete if the newline ending its last line is present
+        self.num_lines = num_newlines
+        self.num_ctg = num_newlines // ctg_block_size
+        block_line_nums = (
+            ctg_block_size * np.arange(self.num_ctg, dtype=np.int64).reshape((self.num_ctg, 1)) +
+            np.array(line_offsets, dtype=np.int64).reshape((1, len(line_offsets))))
+        self.offsets = line_starts[np.searchsorted(line_nums, block_line_nums)]
+        end_time = time.time()
+        print('sol2 block index time: %f' % (end_time - start_time))
+
+    def close(self):
+
+        self.data = None
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError: # a view from get_block() is still alive. the map is released with it
+                pass
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def get_block(self, k):
+        '''zero-copy view (numpy uint8 array) of the bytes of contingency block k'''
+
+        return self.data[self.offsets[k, 0]:self.offsets[k, 8]]
+
+    def get_section(self, k, start, end):
+        '''zero-copy view of block k from the line at offsets[k, start]
+        to the line at offsets[k, end], e.g. get_section(k, 3, 4) is the bus data rows'''
+
+        return self.data[self.offsets[k, start]:self.offsets[k, end]]
+
+    def get_label(self, k):
+
+        return clean_string(self.get_section(k, 1, 2).tobytes().decode('utf-8').strip())
+
+    def get_labels(self):
+
+        return [self.get_label(k) for k in range(self.num_ctg)]
+
+    def get_byte_range(self, k_start, k_end):
+        '''byte range [start, end) covering blocks k_start, ..., k_end - 1'''
+
+        return (self.offsets[k_start, 0], self.offsets[k_end - 1, 8])
+
+class Solution2LabelIndex:
+    '''random access by contingency label to the blocks of a sol2 file,
+    with the blocks in any order.
+    the file is memory mapped and scanned once, in chunks, for lines starting
+    with --contingency. each block runs from one of these lines to the next,
+    and its number of lines is checked against get_ctg_block_size,
+    so a block of the wrong size is reported with its label rather than
+    shifting every block after it.
+
+    starts[k] is the byte offset of block k (in file order) and starts[num_ctg]
+    is the end of the file. labels[k] is its cleaned label and label_map maps
+    labels to block numbers.'''
+
+    ctg_marker = b'--contingency'
+
+    def __init__(self):
+
+        self.file_name = None
+        self.file = None
+        self.mmap = None
+        self.data = None
+        self.num_bus = 0
+        self.num_gen = 0
+        self.num_lines = 0
+        self.num_ctg = 0
+        self.starts = np.zeros(shape=1, dtype=np.int64)
+        self.line_nums = np.zeros(shape=1, dtype=np.int64)
+        self.labels = []
+        self.label_map = {}
+
+    def open(self, file_name, num_bus, num_gen, chunk_size=(64 * 1024 * 1024)):
+
+        start_time = time.time()
+        self.close()
+        if get_sol_compression(file_name) is not None:
+            raise Exception('sol2 label index needs an uncompressed file: %s' % file_name)
+        self.file_name = file_name
+        self.num_bus = num_bus
+        self.num_gen = num_gen
+        self.file = open(file_name, 'rb')
+        self.file.seek(0, 2)
+        file_size = self.file.tell()
+        self.file.seek(0)
+        if file_size > 0:
+            self.mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            self.data = np.frombuffer(self.mmap, dtype=np.uint8)
+        else:
+            self.data = np.zeros(shape=0, dtype=np.uint8)
+        marker = np.frombuffer(self.ctg_marker, dtype=np.uint8)
+
+        # a block starts at a line that starts with the marker.
+        # line L starts 1 byte past newline L - 1.
+        # keep the offset and the line number of each block start
+        starts = [np.zeros(shape=1, dtype=np.int64)]
+        line_nums = [np.zeros(shape=1, dtype=np.int64)]
+        num_newlines = 0
+        for chunk_start in range(0, file_size, chunk_size):
+            chunk = self.data[chunk_start:(chunk_start + chunk_size)]
+            newline_pos = np.flatnonzero(chunk == ord('\n'))
+            line_start = newline_pos.astype(np.int64) + (chunk_start + 1)
+            is_start = line_start + marker.size <= file_size
+            for j in range(marker.size):
+                is_start[is_start] = self.data[line_start[is_start] + j] == marker[j]
+            starts.append(line_start[is_start])
+            line_nums.append(np.flatnonzero(is_start).astype(np.int64) + (num_newlines + 1))
+            num_newlines += newline_pos.size
+        starts = np.concatenate(starts)
+        line_nums = np.concatenate(line_nums)
+        if file_size == 0:
+            starts = starts[:0]
+            line_nums = line_nums[:0]
+        elif self.data[:marker.size].tobytes() != self.ctg_marker:
+            raise Exception('sol2 ctg block error. the file does not start with %s' % self.ctg_marker.decode('utf-8'))
+        self.num_lines = num_newlines
+        self.num_ctg = starts.size
+        self.starts = np.append(starts, file_size)
+        self.line_nums = np.append(line_nums, num_newlines)
+
+        # any lines after the last complete block are ignored, as in read_sol2_ctgs
+        ctg_block_size = get_ctg_block_size(num_bus, num_gen)
+        if self.num_ctg > 0 and self.line_nums[-1] - self.line_nums[-2] > ctg_block_size:
+            last_newline_pos = np.flatnonzero(self.data[self.starts[-2]:] == ord('\n'))[ctg_block_size - 1]
+            self.starts[-1] = self.starts[-2] + last_newline_pos + 1
+            self.line_nums[-1] = self.line_nums[-2] + ctg_block_size
+        self.labels = [self.read_label(k) for k in range(self.num_ctg)]
+        self.label_map = {}
+        for k in range(self.num_ctg):
+            self.label_map.setdefault(self.labels[k], k) # keep the first of any repeated label
+        end_time = time.time()
+        print('sol2 label index time: %f' % (end_time - start_time))
+
+    def close(self):
+
+        self.data = None
+        if self.mmap is not None:
+            try:
+                self.mmap.close()
+            except BufferError: # a view is still alive. the map is released with it
+                pass
+            self.mmap = None
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+    def read_label(self, k):
+        '''label of block k, the line after the line after the marker'''
+
+        start = self.starts[k]
+        end = self.starts[k + 1]
+        for j in range(2):
+            start = self.mmap.find(b'\n', start, end) + 1
+            if start == 0:
+                return ''
+        end = self.mmap.find(b'\n', start, end)
+        if end == -1:
+            end = self.starts[k + 1]
+        return clean_string(self.data[start:end].tobytes().decode('utf-8').strip())
+
+    def check(self, ctg_labels_data_list):
+        '''check the number of lines of the file and of each block,
+        and the labels against the data'''
+
+        num_ctg = len(ctg_labels_data_list)
+        check_sol2_num_lines_found(self.num_bus, self.num_gen, num_ctg, self.num_lines)
+        ctg_block_size = get_ctg_block_size(self.num_bus, self.num_gen)
+        block_num_lines = np.diff(self.line_nums)
+        bad = np.flatnonzero(block_num_lines != ctg_block_size)
+        if bad.size > 0:
+            k = bad[0]
+            raise Exception(
+                'sol2 ctg block error. label: %s, expected lines: %u, found: %u, num blocks with errors: %u' % (
+                    self.labels[k], ctg_block_size, block_num_lines[k], bad.size))
+        print('checking contingency labels sol vs data')
+        check_sol2_ctg_labels_found(ctg_labels_data_list, self.labels)
+
+    def get_block(self, k):
+        '''zero-copy view (numpy uint8 array) of the bytes of block k'''
+
+        return self.data[self.starts[k]:self.starts[k + 1]]
+
+    def get_ctg(self, label):
+        '''Solution2 for the contingency with this (cleaned) label'''
+
+        s2 = Solution2()
+        s2.read_ctg_block(self.get_block(self.label_map[label]), self.num_bus, self.num_gen)
+        return s2
+
+def read_sol2_ctgs_indexed(sol2_name, num_bus, num_gen, ctg_labels_data_list, ctg_labels_order=None):
+    '''read sol2 with a Solution2LabelIndex.
+    the blocks may be in any order in the file. after the checks, yields a
+    Solution2 for each contingency in the order of ctg_labels_order,
+    by default the order of the data, ctg_labels_data_list'''
+
+    index = Solution2LabelIndex()
+    index.open(sol2_name, num_bus, num_gen)
+    try:
+        index.check(ctg_labels_data_list)
+        if ctg_labels_order is None:
+            ctg_labels_order = ctg_labels_data_list
+        for label in ctg_labels_order:
+            yield index.get_ctg(label)
+    finally:
+        index.close()
+
+def parse_sol2_byte_range(task):
+    '''worker for read_sol2_ctgs_parallel.
+    task = (sol2_name, num_bus, num_gen, block_starts), where block_starts holds
+    the byte offsets of a run of consecutive contingency blocks followed by
+    the end of the last one. reads that byte range of the file and parses
+    each block. returns a list of parse_ctg_block tuples.'''
+
+    sol2_name, num_bus, num_gen, block_starts = task
+    range_start = block_starts[0]
+    with open(sol2_name, 'rb') as f:
+        f.seek(range_start)
+        buf = f.read(block_starts[-1] - range_start)
+    block_starts = [b - range_start for b in block_starts]
+    return [
+        parse_ctg_block(buf[block_starts[k]:block_starts[k + 1]], num_bus, num_gen)
+        for k in range(len(block_starts) - 1)]
+
+def read_sol2_ctgs_parallel(sol2_name, num_bus, num_gen, ctg_labels_data_list, num_proc, ctgs_per_task=32):
+    '''read sol2 with num_proc worker processes.
+    yields a Solution2 for each contingency block in the order of the file,
+    like read_sol2_ctgs.
+    the block boundaries are found first with a Solution2BlockIndex, and the
+    number of lines and the labels are checked from the index, raising the same
+    errors as check_sol2_num_lines and check_sol2_ctg_labels. the blocks are
+    then cut into byte ranges of ctgs_per_task blocks, and each range is read
+    and parsed by a worker that gets only the file name and the offsets.
+    note the index costs an extra full pass over sol2 in this process, a
+    newline scan of the whole file, before any worker starts, and the workers
+    then read the file again. the scan is much cheaper than the parsing, and
+    the second read mostly comes from the page cache, but on a file too big
+    for the page cache sol2 is read from disk twice. the extra pass is what
+    lets the line count and the labels be checked before anything is yielded.
+    at most 2 * num_proc ranges are in flight, so memory use does not grow
+    when the evaluation is slower than the parsing.'''
+
+    num_ctg = len(ctg_labels_data_list)
+    index = Solution2BlockIndex()
+    index.open(sol2_name, num_bus, num_gen)
+    try:
+        check_sol2_num_lines_found(num_bus, num_gen, num_ctg, index.num_lines)
+        print('checking contingency labels sol vs data')
+        check_sol2_ctg_labels_found(
+            ctg_labels_data_list, [index.get_label(k) for k in range(num_ctg)])
+        block_starts = [int(b) for b in index.offsets[:num_ctg, 0]]
+        if num_ctg > 0:
+            block_starts.append(int(index.offsets[num_ctg - 1, 8]))
+    finally:
+        index.close()
+    tasks = [
+        (sol2_name, num_bus, num_gen, block_starts[k:(k + ctgs_per_task + 1)])
+        for k in range(0, num_ctg, ctgs_per_task)]
+    pool = multiprocessing.Pool(num_proc)
+    try:
+        pending = []
+        next_task = 0
+        while next_task < len(tasks) or len(pending) > 0:
+            while next_task < len(tasks) and len(pending) < 2 * num_proc:
+                pending.append(pool.apply_async(parse_sol2_byte_range, (tasks[next_task],)))
+                next_task += 1
+            for parsed_block in pending.pop(0).get():
+                s2 = Solution2()
+                s2.set_parsed_ctg_block(parsed_block)
+                yield s2
+    finally:
+        pool.terminate()
+        pool.join()
+
+# binary solution format.
+# a directory of .npy files, one per array, so every array can be memory mapped
+# (np.load ignores mmap_mode for .npz archives).
+# sol1: bus_i (num_bus), bus_array (num_bus x 3: v, theta, b),
+#       gen_i (num_gen), gen_id (num_gen), gen_array (num_gen x 2: p, q)
+# sol2: the same arrays stacked over the contingency blocks in file order,
+#       e.g. bus_array is num_ctg x num_bus x 3, plus
+#       ctg_label (num_ctg), delta (num_ctg) and num_lines, the line count
+#       of the text sol2 file, so the same line count check can be made
+sol_npy_sol1_arrays = ['bus_i', 'bus_array', 'gen_i', 'gen_id', 'gen_array']
+sol_npy_sol2_arrays = sol_npy_sol1_arrays + ['ctg_label', 'delta']
+
+def get_sol_npy_file_name(dir_name, sol, array):
+
+    return os.path.join(dir_name, '%s_%s.npy' % (sol, array))
+
+def is_sol_npy(name):
+    '''True if name is a binary solution directory rather than a text solution file'''
+
+    return os.path.isdir(name)
+
+def convert_sol_to_npy(sol1_name, sol2_name, num_bus, num_gen, dir_name):
+    '''convert text sol1 and sol2 files (possibly compressed) to the binary solution format.
+    either of sol1_name, sol2_name may be None.
+    sol2 is read one contingency block at a time and written straight into
+    memory mapped .npy files, so memory use does not grow with the number of
+    contingencies. the string arrays, ctg_label and gen_id, need their width
+    before they can be opened, so they go to a temporary text file first,
+    one line per block, and are copied from it at the end. no checks against the problem data are made here,
+    they are made when the binary solution is evaluated.'''
+
+    start_time = time.time()
+    if not os.path.isdir(dir_name):
+        os.makedirs(dir_name)
+    if sol1_name is not None:
+        s1 = Solution1()
+        s1.read(sol1_name, num_bus, num_gen)
+        np.save(get_sol_npy_file_name(dir_name, 'sol1', 'bus_i'), s1.bus_i)
+        np.save(get_sol_npy_file_name(dir_name, 'sol1', 'bus_array'), s1.bus_array)
+        np.save(get_sol_npy_file_name(dir_name, 'sol1', 'gen_i'), s1.gen_i)
+        np.save(get_sol_npy_file_name(dir_name, 'sol1', 'gen_id'), np.array(s1.gen_id, dtype=np.unicode_).reshape(num_gen))
+        np.save(get_sol_npy_file_name(dir_name, 'sol1', 'gen_array'), s1.gen_array)
+    if sol2_name is not None:
+        num_lines = count_lines(sol2_name)
+        num_ctg = num_lines // get_ctg_block_size(num_bus, num_gen)
+        strings_name = os.path.join(dir_name, 'sol2_strings.tmp')
+        label_width = 1
+        gen_id_width = 1
+        def open_array(array, dtype, shape):
+            return np.lib.format.open_memmap(
+                get_sol_npy_file_name(dir_name, 'sol2', array), mode='w+', dtype=dtype, shape=shape)
+        bus_i = open_array('bus_i', np.int_, (num_ctg, num_bus))
+        bus_array = open_array('bus_array', np.float64, (num_ctg, num_bus, 3))
+        gen_i = open_array('gen_i', np.int_, (num_ctg, num_gen))
+        gen_array = open_array('gen_array', np.float64, (num_ctg, num_gen, 2))
+        delta = open_array('delta', np.float64, (num_ctg,))
+        try:
+            with open_sol(sol2_name) as sol2_file, open(strings_name, 'wb') as strings_file:
+                for k in range(num_ctg):
+                    s2 = Solution2()
+                    s2.read_next_ctg(sol2_file, num_bus, num_gen)
+                    bus_i[k] = s2.bus_i
+                    bus_array[k] = s2.bus_array
+                    gen_i[k] = s2.gen_i
+                    gen_array[k] = s2.gen_array
+                    delta[k] = s2.delta
+                    # gen ids first, they have no commas. the label is the rest of the line
+                    label_width = max(label_width, len(s2.ctg_label))
+                    gen_id_width = max([gen_id_width] + [len(i) for i in s2.gen_id])
+                    strings_file.write((','.join(s2.gen_id + [s2.ctg_label]) + '\n').encode('utf-8'))
+            ctg_label = open_array('ctg_label', (np.unicode_, label_width), (num_ctg,))
+            gen_id = open_array('gen_id', (np.unicode_, gen_id_width), (num_ctg, num_gen))
+            with open(strings_name, 'rb') as strings_file:
+                for k in range(num_ctg):
+                    tokens = strings_file.readline().decode('utf-8').rstrip('\n').split(',', num_gen)
+                    gen_id[k] = tokens[:num_gen]
+                    ctg_label[k] = tokens[num_gen]
+        finally:
+            if os.path.exists(strings_name):
+                os.remove(strings_name)
+        for a in [bus_i, bus_array, gen_i, gen_array, delta, ctg_label, gen_id]:
+            a.flush()
+        del bus_i, bus_array, gen_i, gen_array, delta, ctg_label, gen_id
+        np.save(get_sol_npy_file_name(dir_name, 'sol2', 'num_lines'), np.array(num_lines, dtype=np.int64))
+    end_time = time.time()
+    print('convert sol to npy time: %f' % (end_time - start_time))
+
+def load_sol_npy(dir_name, sol, arrays):
+    '''memory map the arrays of sol ('sol1' or 'sol2') in a binary solution directory.
+    returns a dict of read only arrays'''
+
+    return {a: np.load(get_sol_npy_file_name(dir_name, sol, a), mmap_mode='r') for a in arrays}
+
+def read_sol1_npy(dir_name, num_bus, num_gen):
+    '''Solution1 from a binary solution directory, the arrays are memory mapped'''
+
+    start_time = time.time()
+    arrays = load_sol_npy(dir_name, 'sol1', sol_npy_sol1_arrays)
+    if arrays['bus_i'].shape != (num_bus,) or arrays['gen_i'].shape != (num_gen,):
+        raise Exception(
+            'sol1 npy shape error. expected num bus: %u, num gen: %u, found: %s, %s' % (
+                num_bus, num_gen, arrays['bus_i'].shape, arrays['gen_i'].shape))
+    s1 = Solution1()
+    s1.num_bus = num_bus
+    s1.num_gen = num_gen
+    s1.bus_i = arrays['bus_i']
+    s1.bus_array = arrays['bus_array']
+    s1.gen_i = arrays['gen_i']
+    s1.gen_id = arrays['gen_id'].tolist()
+    s1.gen_array = arrays['gen_array']
+    end_time = time.time()
+    print("sol1 read time: %f" % (end_time - start_time))
+    return s1
+
+def read_sol2_ctgs_npy(dir_name, num_bus, num_gen, ctg_labels_data_list):
+    '''read sol2 from a binary solution directory.
+    yields a Solution2 for each contingency, like read_sol2_ctgs, with the arrays
+    being views into the memory mapped stacks, so nothing is parsed.
+    the line count of the original text file and the labels are checked first,
+    raising the same errors as check_sol2_num_lines and check_sol2_ctg_labels.'''
+
+    num_ctg = len(ctg_labels_data_list)
+    arrays = load_sol_npy(dir_name, 'sol2', sol_npy_sol2_arrays)
+    num_lines = int(np.load(get_sol_npy_file_name(dir_name, 'sol2', 'num_lines')))
+    check_sol2_num_lines_found(num_bus, num_gen, num_ctg, num_lines)
+    if arrays['bus_i'].shape[1:] != (num_bus,) or arrays['gen_i'].shape[1:] != (num_gen,):
+        raise Exception(
+            'sol2 npy shape error. expected num bus: %u, num gen: %u, found: %s, %s' % (
+                num_bus, num_gen, arrays['bus_i'].shape, arrays['gen_i'].shape))
+    ctg_labels = arrays['ctg_label'][:num_ctg].tolist()
+    print('checking contingency labels sol vs data')
+    check_sol2_ctg_labels_found(ctg_labels_data_list, [clean_string(c) for c in ctg_labels])
+    for k in range(num_ctg):
+        s2 = Solution2()
+        s2.set_parsed_ctg_block((
+            ctg_labels[k], arrays['bus_i'][k], arrays['bus_array'][k],
+            arrays['gen_i'][k], arrays['gen_id'][k].tolist(), arrays['gen_array'][k],
+            float(arrays['delta'][k])))
+        yield s2
+
+class FollowFile:
+    '''a sol2 file, opened in binary mode, that is still being written, e.g. by a solver.
+    iterating gives the lines of the file, and at the end of the data written so far,
+    waits for more data, so only complete lines are returned, and islice over
+    the file gives complete contingency blocks as soon as they are written.
+    the file is taken to be done when no new data has come for idle_timeout seconds,
+    or when stop, a threading.Event, is set, e.g. by prefetch when the evaluation
+    fails, and from then on readline returns b'' at once, so a truncated file
+    waits for idle_timeout only once.
+    a named pipe needs no waiting, as reading it blocks until the writer closes it.
+    the file does not need to exist yet when it is opened.
+    compressed files are not supported.'''
+
+    def __init__(self, file_name, idle_timeout, poll_time, stop=None):
+
+        self.file_name = file_name
+        self.idle_timeout = idle_timeout
+        self.poll_time = poll_time
+        self.stop = stop
+        self.ended = False
+        idle_start = time.time()
+        while not os.path.exists(file_name):
+            if self.is_stopped():
+                raise Exception('sol2 follow error. stopped while waiting for file: %s' % file_name)
+            if time.time() - idle_start > idle_timeout:
+                raise Exception('sol2 follow error. file not found after %f seconds: %s' % (idle_timeout, file_name))
+            time.sleep(poll_time)
+        self.is_pipe = not is_regular_file(file_name)
+        self.file = open(file_name, 'rb')
+
+    def __enter__(self):
+
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+
+        self.close()
+
+    def __iter__(self):
+
+        return self
+
+    def __next__(self):
+
+        line = self.readline()
+        if len(line) == 0:
+            raise StopIteration
+        return line
+
+    next = __next__ # py2
+
+    def is_stopped(self):
+
+        return self.stop is not None and self.stop.is_set()
+
+    def readline(self):
+
+        if self.ended:
+            return b''
+        line = self.file.readline()
+        if self.is_pipe:
+            return line
+        idle_start = time.time()
+        while not line.endswith(b'\n'):
+            more = self.file.readline()
+            if len(more) > 0:
+                line += more
+                idle_start = time.time()
+            elif self.is_stopped():
+                self.ended = True
+                break
+            elif time.time() - idle_start > self.idle_timeout:
+                print('sol2 follow idle timeout. no new data for %f seconds' % self.idle_timeout)
+                self.ended = True
+                break
+            else:
+                time.sleep(self.poll_time)
+        return line
+
+    def read(self, size=-1):
+        '''the data available now, without waiting'''
+
+        return self.file.read(size)
+
+    def close(self):
+
+        self.file.close()
+
+def read_sol2_ctgs_file(sol2_name, num_bus, num_gen, ctg_labels_data_list, follow=False, stop=None):
+    '''read_sol2_ctgs on the file sol2_name, which is closed when done.
+    follow=True reads the file with FollowFile, while it is still being written,
+    until stop, a threading.Event, is set'''
+
+    if follow:
+        sol2_file = FollowFile(sol2_name, sol2_follow_idle_timeout, sol2_follow_poll_time, stop)
+    else:
+        sol2_file = open_sol(sol2_name)
+    with sol2_file:
+        for s2 in read_sol2_ctgs(sol2_file, num_bus, num_gen, ctg_labels_data_list):
+            yield s2
+
+def get_sol2_ctgs(sol2_name, num_bus, num_gen, ctg_labels_data_list, follow=False):
+    '''iterator over the Solution2 contingencies of sol2_name, in the order of the file,
+    using the reader that fits the file and the module settings:
+    follow=True: read_sol2_ctgs on a FollowFile, prefetched in a thread
+    binary solution directory: read_sol2_ctgs_npy
+    plain text file and sol2_label_index: read_sol2_ctgs_indexed, in the order of the data, prefetched
+    plain text file and sol2_num_proc > 1: read_sol2_ctgs_parallel
+    otherwise: read_sol2_ctgs, prefetched in a thread with depth sol2_prefetch_depth.
+    each reader checks the number of lines and the labels.
+    the iterator should be closed when done, e.g. with contextlib.closing'''
+
+    if follow:
+        # the FollowFile stops waiting for data when the consumer is done.
+        # a read of a named pipe can not be interrupted that way, so do not wait for it
+        stop = threading.Event()
+        is_pipe = os.path.exists(sol2_name) and not is_regular_file(sol2_name)
+        return prefetch(
+            read_sol2_ctgs_file(sol2_name, num_bus, num_gen, ctg_labels_data_list, follow=True, stop=stop),
+            sol2_prefetch_depth, stop, (0.0 if is_pipe else None))
+    if is_sol_npy(sol2_name):
+        return read_sol2_ctgs_npy(sol2_name, num_bus, num_gen, ctg_labels_data_list)
+    if sol2_label_index:
+        if get_sol_compression(sol2_name) is None:
+            return prefetch(
+                read_sol2_ctgs_indexed(sol2_name, num_bus, num_gen, ctg_labels_data_list),
+                sol2_prefetch_depth)
+        print('compressed sol2, reading in a single pass in the order of the file instead of by label')
+    if sol2_num_proc > 1:
+        if get_sol_compression(sol2_name) is None:
+            return read_sol2_ctgs_parallel(
+                sol2_name, num_bus, num_gen, ctg_labels_data_list, sol2_num_proc, sol2_ctgs_per_task)
+        print('compressed sol2, reading in a single pass instead of with %u processes' % sol2_num_proc)
+    return prefetch(
+        read_sol2_ctgs_file(sol2_name, num_bus, num_gen, ctg_labels_data_list),
+        sol2_prefetch_depth)
+
 def trans_old(raw_name, rop_name, con_name, inl_nsame,filename):
 
     # read the data files
@@ -3165,7 +5038,51 @@ def trans_old(raw_name, rop_name, con_name, inl_nsame,filename):
         p.con.write(filename+".con")
         p.inl.write(filename+".inl",p.raw,p.rop)
     
-def run(raw_name, rop_name, con_name, inl_name, sol1_name=None, sol2_name=None, summary_name=None, detail_name=None):
+def check_ctg_kernels(raw_name, rop_name, con_name, inl_name, sol1_name, sol2_name, tol=1e-10):
+    '''equivalence check of the ctg kernels: evaluates every ctg of sol2 with
+    ctg_kernel_backend = 'numba', and checks each one against the numpy kernels
+    with Evaluation.check_ctg_branch_kernel, which raises an Exception on a mismatch.
+    ctg_branch_kernel is checked compiled if numba is installed, else as plain python,
+    so the check always runs. returns the largest difference'''
+
+    global ctg_kernel_backend
+
+    p = data.Data()
+    p.raw.read(raw_name)
+    p.rop.read(rop_name)
+    p.con.read(con_name)
+    p.inl.read(inl_name)
+    e = Evaluation()
+    e.set_data(p)
+    e.set_params()
+    if is_sol_npy(sol1_name):
+        s1 = read_sol1_npy(sol1_name, e.num_bus, e.num_gen)
+    else:
+        s1 = Solution1()
+        s1.read(sol1_name, e.num_bus, e.num_gen)
+    e.set_solution1(s1)
+    e.eval_base()
+    backend = ctg_kernel_backend
+    ctg_kernel_backend = 'numba'
+    diff = 0.0
+    num_ctg = 0
+    try:
+        with closing(get_sol2_ctgs(sol2_name, e.num_bus, e.num_gen, e.ctg_label)) as ctgs:
+            for s2 in ctgs:
+                e.set_solution2(s2)
+                e.set_ctg_data()
+                diff = max(diff, e.check_ctg_branch_kernel(tol))
+                e.eval_ctg()
+                num_ctg += 1
+    finally:
+        ctg_kernel_backend = backend
+    print('ctg kernel check ok, ctgs: %u, max diff: %s, kernel: %s' % (
+        num_ctg, diff, ('plain python' if numba is None else 'numba')))
+    return diff
+
+def run(raw_name, rop_name, con_name, inl_name, sol1_name=None, sol2_name=None, summary_name=None, detail_name=None, follow_sol2=False):
+    '''follow_sol2=True evaluates the contingencies of sol2 as they are written,
+    e.g. while the solver is still running, see FollowFile'''
 
     # start timer
     start_time_all = time.time()
@@ -3209,12 +5126,18 @@ def run(raw_name, rop_name, con_name, inl_name, sol1_name=None, sol2_name=None,
     
     # base case solution evaluation
     start_time = time.time()
-    s1 = Solution1()
-    s1.read(sol1_name, e.num_bus, e.num_gen) # this is now fairly long ~ 0.17 second
+    if is_sol_npy(sol1_name):
+        s1 = read_sol1_npy(sol1_name, e.num_bus, e.num_gen)
+    else:
+        s1 = Solution1()
+        s1.read(sol1_name, e.num_bus, e.num_gen) # this is now fairly long ~ 0.17 second
     e.set_solution1(s1)
     e.eval_base()
     e.write_header(detail_name)
     e.write_base(detail_name)
+    if detail_top_k > 0:
+        e.write_top_k_header(top_k_name(detail_name))
+        e.write_top_k(top_k_name(detail_name), e.top_k_rows)
     e.print_base()
     end_time = time.time()
     print("total base case time: %f" % (end_time - start_time))
@@ -3228,9 +5151,10 @@ def run(raw_name, rop_name, con_name, inl_name, sol1_name=None, sol2_name=None,
     # get ctg structure in sol
     # need to check that every contingency is found in the sol file
     start_time = time.time()
-    ok = check_sol2_num_lines(sol2_name, e.num_bus, e.num_gen, e.num_ctg)
-    ok = check_sol2_ctg_labels(sol2_name, e.num_bus, e.num_gen, e.ctg_label)
-    s2 = Solution2()
+    # the number of lines and the ctg labels are checked while reading,
+    # in the same pass as the evaluation, see read_sol2_ctgs
+    #ok = check_sol2_num_lines(sol2_name, e.num_bus, e.num_gen, e.num_ctg)
+    #ok = check_sol2_ctg_labels(sol2_name, e.num_bus, e.num_gen, e.ctg_label)
     ctgs_reported = []
     print('start ctg eval')
     print('ctg eval log')
@@ -3246,15 +5170,31 @@ def run(raw_name, rop_name, con_name, inl_name, sol1_name=None, sol2_name=None,
     print(
         '%12u %12u %12.2e %12s %12s' %
         (ctg_counter, ctg_to_go, time_elapsed, time_per_ctg, time_to_go))
-    with open(sol2_name) as sol2_file:
-        for k in range(e.num_ctg):
-            s2.read_next_ctg(sol2_file, e.num_bus, e.num_gen)
-            e.set_solution2(s2)
-            ctgs_reported.append(e.ctg_current)
-            e.set_ctg_data()
-            e.eval_ctg()
-            e.write_ctg(detail_name)
-            ctg_counter += 1
+    # the sol2 readers raise the sol2 line count and label errors only at the end
+    # of the file, after the blocks before the problem are evaluated, so the ctg rows
+    # are kept here and written only once the reader has ended without an error.
+    # a rejected sol2 then leaves the same detail file as the checks up front did
+    ctg_detail_rows = []
+    ctg_top_k_rows = []
+    with closing(get_sol2_ctgs(sol2_name, e.num_bus, e.num_gen, e.ctg_label, follow_sol2)) as ctgs:
+        for s2_batch in make_batches(ctgs, max(1, ctg_batch_size)):
+            if ctg_batch_size > 1:
+                e.set_solution2_batch(s2_batch)
+                ctgs_reported.extend(e.ctg_batch)
+                e.set_ctg_data_batch()
+                e.eval_ctg_batch()
+                ctg_detail_rows.extend(e.ctg_batch_detail_rows)
+                if detail_top_k > 0:
+                    ctg_top_k_rows.extend([r for rows in e.ctg_batch_top_k_rows for r in rows])
+            else:
+                e.set_solution2(s2_batch[0])
+                ctgs_reported.append(e.ctg_current)
+                e.set_ctg_data()
+                e.eval_ctg()
+                ctg_detail_rows.append(e.get_ctg_detail_row())
+                if detail_top_k > 0:
+                    ctg_top_k_rows.extend(e.ctg_top_k_rows)
+            ctg_counter += len(s2_batch)
             time_elapsed = time.time() - start_time
             if time_elapsed > float(log_counter + 1) * float(log_time):
                 log_counter += 1
@@ -3264,6 +5204,9 @@ def run(raw_name, rop_name, con_name, inl_name, sol1_name=None, sol2_name=None,
                 print(
                     '%12u %12u %12.2e %12.2e %12.2e' %
                     (ctg_counter, ctg_to_go, time_elapsed, time_per_ctg, time_to_go))
+    e.write_ctg_rows(detail_name, ctg_detail_rows)
+    if detail_top_k > 0:
+        e.write_top_k(top_k_name(detail_name), ctg_top_k_rows)
     num_ctgs_reported = len(ctgs_reported)
     num_ctgs_reported_unique = len(set(ctgs_reported))
     if (num_ctgs_reported != num_ctgs_reported_unique or
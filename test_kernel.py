@@ -0,0 +1,48 @@
+'''
+equivalence check of the ctg loop kernel against the numpy kernels,
+see evaluation.check_ctg_kernels. the loop kernel is compiled with numba
+if it is installed, else it is checked as plain python.
+
+syntax:
+
+from a command prompt:
+python test_kernel.py raw rop con inl sol1 sol2
+'''
+
+import argparse
+import evaluation
+import os
+
+def run_kernel_check():
+
+    parser = argparse.ArgumentParser(description='Check the ctg loop kernel against the numpy kernels')
+    
+    parser.add_argument('raw', help='raw')
+    parser.add_argument('rop', help='rop')
+    parser.add_argument('con', help='con')
+    parser.add_argument('inl', help='inl')
+    parser.add_argument('sol1', help='sol1')
+    parser.add_argument('sol2', help='sol2')
+    
+    args = parser.parse_args()
+
+    # Check files exist
+    for f in [args.raw, args.rop, args.con, args.inl, args.sol1, args.sol2]:
+        if not os.path.exists(f):
+            raise Exception("Can't find {}".format(f))
+    
+    try:
+        evaluation.check_ctg_kernels(
+            args.raw,
+            args.rop,
+            args.con,
+            args.inl,
+            args.sol1,
+            args.sol2,
+        )
+    except:
+        print("exception in evaluation.check_ctg_kernels")
+        raise
+
+if __name__ == '__main__':
+    run_kernel_check()